@@ -0,0 +1,267 @@
+"""
+API Payloads - Request decoding (JSON, multipart and raw binary uploads) and response compression
+
+Requests to /outfit-bundles may arrive as:
+    application/json       {"images": ["<base64>", ...], "age": "25", ...}
+    multipart/form-data    one file part per image (any field name), plus text
+                           fields (age, gender, occasion, season, budget, timings)
+                           and/or a JSON part named "request" with the same fields
+    image/* or application/octet-stream
+                           a single raw image; the other fields come from the query string
+
+Binary bodies need the API's binary media types to include them (e.g. "*/*"), so
+API Gateway passes them through base64-encoded with isBase64Encoded set.
+Sizes are checked before anything is decoded.
+"""
+import base64
+import gzip
+import json
+import os
+from email.message import Message
+
+from outfit_images import BEDROCK_MEDIA_TYPES, OutfitImage, can_send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional - gzip is offered instead
+    brotli = None
+
+# Upload limits, checked before decoding (API Gateway itself stops at 10 MB)
+MAX_REQUEST_BYTES = int(os.environ.get('MAX_REQUEST_BYTES', str(10 * 1024 * 1024)))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', str(5 * 1024 * 1024)))
+MAX_IMAGES = int(os.environ.get('MAX_IMAGES', '8'))
+
+# Responses smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', '5'))
+
+# Form fields that are numbers in a JSON body
+FORM_NUMBER_FIELDS = ('budget',)
+
+
+class RequestError(Exception):
+    """A request that cannot be served, with the HTTP status code to report"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def _header(event, name):
+    """Case-insensitive request header lookup"""
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _content_type(value):
+    """(media type, parameters) of a Content-Type header"""
+    message = Message()
+    message['Content-Type'] = value or 'application/json'
+    return message.get_content_type(), dict(message.get_params()[1:])
+
+
+def _base64_size(text):
+    """Decoded size of base64 text, without decoding it"""
+    return len(text) * 3 // 4
+
+
+def _check_size(size, limit, what):
+    if size > limit:
+        raise RequestError(413, f"{what} is too large ({size:,} bytes, max {limit:,})")
+
+
+def _form_value(name, value):
+    if name in FORM_NUMBER_FIELDS:
+        try:
+            return float(value) if '.' in value else int(value)
+        except ValueError:
+            raise RequestError(400, f"{name} must be a number")
+    return value
+
+
+def _check_format(image, number):
+    """Reject an image Bedrock cannot take and this process cannot convert (HEIC without pillow_heif)"""
+    if not can_send(image.media_type):
+        accepted = ', '.join(media_type.split('/')[1].upper() for media_type in BEDROCK_MEDIA_TYPES)
+        raise RequestError(400, f"Image {number} is {image.media_type}, which is not supported here (send {accepted})")
+    return image
+
+
+def json_images(body):
+    """Outfit images of a JSON request body, kept in memory as base64"""
+    images_base64 = body.get('images', [])
+
+    if not images_base64:
+        raise RequestError(400, 'No images provided')
+    if len(images_base64) > MAX_IMAGES:
+        raise RequestError(413, f"Too many images ({len(images_base64)}, max {MAX_IMAGES})")
+
+    images = []
+    for i, img_base64 in enumerate(images_base64):
+        if not isinstance(img_base64, str):
+            raise RequestError(400, f"Image {i + 1} is not a base64 string")
+        _check_size(_base64_size(img_base64), MAX_IMAGE_BYTES, f"Image {i + 1}")
+        # Kept in memory as base64; decoded only when hashed or preprocessed (preprocess_image re-encodes)
+        images.append(_check_format(OutfitImage.from_base64(img_base64, name=f"outfit_{i+1}"), i + 1))
+    return images
+
+
+def parse_multipart(data, boundary):
+    """
+    Fields and images of a multipart/form-data body.
+
+    Parts with a filename or an image content type are images; text parts are
+    fields, and a part named "request" holds a JSON object of fields.
+    """
+    if not boundary:
+        raise RequestError(400, 'multipart/form-data without a boundary')
+    delimiter = b'--' + boundary.encode('latin-1')
+
+    fields = {}
+    images = []
+    position = data.find(delimiter)
+    if position < 0:
+        raise RequestError(400, 'Malformed multipart body')
+    while True:
+        position += len(delimiter)
+        if data[position:position + 2] == b'--':
+            break
+        end = data.find(b'\r\n' + delimiter, position)
+        if end < 0:
+            raise RequestError(400, 'Malformed multipart body')
+
+        head_end = data.find(b'\r\n\r\n', position, end)
+        if head_end < 0:
+            raise RequestError(400, 'Malformed multipart part')
+        headers = Message()
+        for line in data[position:head_end].decode('latin-1').split('\r\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip()] = value.strip()
+        name = headers.get_param('name', header='content-disposition')
+        filename = headers.get_param('filename', header='content-disposition')
+        content_start = head_end + 4
+
+        if filename is not None or headers.get_content_maintype() == 'image':
+            if len(images) == MAX_IMAGES:
+                raise RequestError(413, f"Too many images (max {MAX_IMAGES})")
+            _check_size(end - content_start, MAX_IMAGE_BYTES, f"Image {len(images) + 1}")
+            image = OutfitImage(data=data[content_start:end], name=filename or f"outfit_{len(images) + 1}")
+            images.append(_check_format(image, len(images) + 1))
+        elif name == 'request':
+            try:
+                fields.update(json.loads(data[content_start:end]))
+            except ValueError:
+                raise RequestError(400, 'The request part is not valid JSON')
+        elif name:
+            fields[name] = _form_value(name, data[content_start:end].decode('utf-8'))
+        position = end + 2
+
+    if not images:
+        raise RequestError(400, 'No images provided')
+    return fields, images
+
+
+def parse_request(event):
+    """
+    (fields, images) of an API Gateway event, or of the event itself when invoked directly.
+    Raises RequestError for oversized, malformed or image-less requests.
+    """
+    if 'body' not in event:
+        return event, json_images(event)
+
+    raw = event.get('body')
+    if raw is None:
+        raise RequestError(400, 'Empty request body')
+    if not isinstance(raw, (str, bytes)):
+        # Already parsed (local callers)
+        return raw, json_images(raw)
+
+    encoded = bool(event.get('isBase64Encoded'))
+    _check_size(_base64_size(raw) if encoded else len(raw), MAX_REQUEST_BYTES, 'Request body')
+    media_type, params = _content_type(_header(event, 'Content-Type'))
+    query = event.get('queryStringParameters') or {}
+
+    if media_type.startswith('image/') or media_type == 'application/octet-stream':
+        _check_size(_base64_size(raw) if encoded else len(raw), MAX_IMAGE_BYTES, 'Image 1')
+        # A single raw image: base64 passthrough is kept as base64, not decoded here
+        image = OutfitImage.from_base64(raw, name='outfit_1') if encoded else OutfitImage(
+            data=raw.encode('latin-1') if isinstance(raw, str) else raw, name='outfit_1')
+        fields = {name: _form_value(name, value) for name, value in query.items()}
+        return fields, [_check_format(image, 1)]
+
+    if encoded:
+        try:
+            data = base64.b64decode(raw)
+        except ValueError:
+            raise RequestError(400, 'Request body is not valid base64')
+    else:
+        data = raw.encode('utf-8') if isinstance(raw, str) else raw
+
+    if media_type == 'multipart/form-data':
+        return parse_multipart(data, params.get('boundary'))
+
+    try:
+        body = json.loads(data)
+    except ValueError:
+        raise RequestError(400, 'Request body is not valid JSON')
+    if not isinstance(body, dict):
+        raise RequestError(400, 'Request body must be a JSON object')
+    return body, json_images(body)
+
+
+def request_format(event):
+    """'json', 'multipart' or 'binary', for metrics"""
+    media_type, _ = _content_type(_header(event, 'Content-Type'))
+    if media_type == 'multipart/form-data':
+        return 'multipart'
+    if media_type.startswith('image/') or media_type == 'application/octet-stream':
+        return 'binary'
+    return 'json'
+
+
+def accepted_encoding(event):
+    """'br', 'gzip' or None from the request's Accept-Encoding header"""
+    offered = {}
+    for entry in (_header(event, 'Accept-Encoding') or '').split(','):
+        coding, _, params = entry.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            offered[coding.lower()] = quality
+
+    for coding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        if offered.get(coding, offered.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compress_response(response, event):
+    """Compress an API Gateway proxy response body if the client accepts it and it is worth it"""
+    body = response.get('body')
+    if not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES or response.get('isBase64Encoded'):
+        return response
+    encoding = accepted_encoding(event)
+    if encoding is None:
+        return response
+
+    data = body.encode('utf-8')
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    return dict(response, headers=headers, body=base64.b64encode(compressed).decode('ascii'), isBase64Encoded=True)
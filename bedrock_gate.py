@@ -0,0 +1,288 @@
+"""
+Bedrock Gate - Process-wide admission control, retries and hedging for Bedrock calls
+"""
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# AIMD concurrency window shared by every thread in the process
+BEDROCK_MIN_CONCURRENCY = int(os.environ.get('BEDROCK_MIN_CONCURRENCY', '1'))
+BEDROCK_INITIAL_CONCURRENCY = int(os.environ.get('BEDROCK_INITIAL_CONCURRENCY', '8'))
+BEDROCK_MAX_CONCURRENCY = int(os.environ.get('BEDROCK_MAX_CONCURRENCY', '32'))
+
+# Full-jitter exponential backoff on throttling and transient errors
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '6'))
+BEDROCK_BACKOFF_BASE = float(os.environ.get('BEDROCK_BACKOFF_BASE', '0.25'))
+BEDROCK_BACKOFF_CAP = float(os.environ.get('BEDROCK_BACKOFF_CAP', '8'))
+
+# Send a second copy of a hedgeable call still running after this many seconds (0 = never)
+BEDROCK_HEDGE_AFTER = float(os.environ.get('BEDROCK_HEDGE_AFTER', '0'))
+
+THROTTLING_CODES = frozenset((
+    'ThrottlingException', 'TooManyRequestsException',
+    'ServiceQuotaExceededException', 'ServiceUnavailableException'
+))
+TRANSIENT_CODES = frozenset((
+    'ModelTimeoutException', 'ModelNotReadyException', 'InternalServerException'
+))
+
+
+class BedrockGateError(Exception):
+    """A Bedrock call the gate gave up on, with the HTTP status to report"""
+    status_code = 503
+
+
+class BedrockThrottled(BedrockGateError):
+    """Still throttled (or failing transiently) after every attempt"""
+    status_code = 503
+
+
+class BedrockDeadlineExceeded(BedrockGateError, TimeoutError):
+    """The call could not finish before its deadline"""
+    status_code = 504
+
+
+def error_code(error):
+    """AWS error code of a botocore ClientError (or the exception class name)"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        if code:
+            return code
+    return type(error).__name__
+
+
+class AdaptiveLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent calls.
+
+    Every successful call widens the window by 1/limit (about +1 per full
+    window of successes); a throttled call halves it. Only calls started after
+    the last decrease can shrink it again, so one burst of throttles counts
+    once. Waiters block until a slot frees up or their deadline passes.
+    """
+
+    def __init__(self, initial=BEDROCK_INITIAL_CONCURRENCY, minimum=BEDROCK_MIN_CONCURRENCY,
+                 maximum=BEDROCK_MAX_CONCURRENCY, decrease=0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.decrease = decrease
+        self.in_flight = 0
+        self._last_decrease = float('-inf')
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        """Take a slot; returns False if the deadline passes first"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    return False
+                self._condition.wait(timeout)
+            self.in_flight += 1
+            return True
+
+    def try_acquire(self):
+        """Take a slot only if one is free right now"""
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, outcome, started=None):
+        """Return a slot; outcome is 'ok', 'throttled' or 'error', started is when the call was sent"""
+        with self._condition:
+            self.in_flight -= 1
+            if outcome == 'ok':
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif outcome == 'throttled' and (started is None or started >= self._last_decrease):
+                self._last_decrease = time.monotonic()
+                self.limit = max(self.minimum, self.limit * self.decrease)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {'limit': round(self.limit, 2), 'in_flight': self.in_flight,
+                    'min': self.minimum, 'max': self.maximum}
+
+
+class _GatedStream:
+    """Response stream that holds its limiter slot until it is exhausted or closed"""
+
+    def __init__(self, stream, limiter, started):
+        self._stream = stream
+        self._limiter = limiter
+        self._started = started
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        outcome = 'error'
+        try:
+            for event in self._stream:
+                yield event
+            outcome = 'ok'
+        finally:
+            self._release(outcome)
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            # Closing early after the bundles are complete is a success
+            self._release('ok')
+
+    def _release(self, outcome):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._limiter.release(outcome, self._started)
+
+
+class BedrockGate:
+    """
+    Every Bedrock call in the process goes through here.
+
+    Calls wait for a slot in the shared AdaptiveLimiter, are retried with
+    jittered exponential backoff on throttling and transient errors, and never
+    run past their deadline: a call still running at its deadline is
+    abandoned (it keeps its slot until it returns) and BedrockDeadlineExceeded
+    is raised. Hedgeable calls get a second copy after hedge_after seconds and
+    the first answer wins.
+    """
+
+    def __init__(self, limiter=None, max_attempts=BEDROCK_MAX_ATTEMPTS, backoff_base=BEDROCK_BACKOFF_BASE,
+                 backoff_cap=BEDROCK_BACKOFF_CAP, hedge_after=BEDROCK_HEDGE_AFTER):
+        self.limiter = limiter or AdaptiveLimiter()
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(max_workers=self.limiter.maximum * 2, thread_name_prefix='bedrock-call')
+        self._lock = threading.Lock()
+        self._counters = {'calls': 0, 'retries': 0, 'throttles': 0, 'hedges': 0,
+                          'hedge_wins': 0, 'deadline_exceeded': 0, 'gave_up': 0}
+
+    def invoke(self, client, model_id, body, deadline=None, hedge=False, metrics=None):
+        """invoke_model through the gate; returns the raw response body bytes"""
+        self._count('calls', metrics)
+        return self._with_retries(
+            lambda: self._race(client, model_id, body, deadline, hedge and self.hedge_after > 0, metrics),
+            deadline, metrics)
+
+    def stream(self, client, model_id, body, deadline=None, metrics=None):
+        """invoke_model_with_response_stream through the gate; the slot is held while the stream is read"""
+        self._count('calls', metrics)
+
+        def open_stream():
+            self._acquire(deadline, metrics)
+            started = time.monotonic()
+            try:
+                response = client.invoke_model_with_response_stream(modelId=model_id, body=body)
+            except Exception as e:
+                self.limiter.release('throttled' if error_code(e) in THROTTLING_CODES else 'error', started)
+                raise
+            return dict(response, body=_GatedStream(response['body'], self.limiter, started))
+
+        return self._with_retries(open_stream, deadline, metrics)
+
+    def stats(self):
+        """Limiter window and call counters"""
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update(self.limiter.stats())
+        counters['hedge_after_seconds'] = self.hedge_after
+        return counters
+
+    def _with_retries(self, call, deadline, metrics):
+        for attempt in range(self.max_attempts):
+            try:
+                return call()
+            except BedrockDeadlineExceeded:
+                raise
+            except Exception as e:
+                code = error_code(e)
+                if code not in THROTTLING_CODES and code not in TRANSIENT_CODES:
+                    raise
+                if code in THROTTLING_CODES:
+                    self._count('throttles', metrics)
+                if attempt == self.max_attempts - 1:
+                    self._count('gave_up', metrics)
+                    raise BedrockThrottled(f"Bedrock still unavailable after {self.max_attempts} attempts ({code})") from e
+
+                delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self._count('deadline_exceeded', metrics)
+                    raise BedrockDeadlineExceeded(f"No time left to retry Bedrock ({code})") from e
+                self._count('retries', metrics)
+                time.sleep(delay)
+
+    def _acquire(self, deadline, metrics):
+        started = time.monotonic()
+        if not self.limiter.acquire(deadline):
+            self._count('deadline_exceeded', metrics)
+            raise BedrockDeadlineExceeded('Deadline passed while waiting for a Bedrock slot')
+        if metrics is not None:
+            metrics.add('bedrock_queue_ms', round((time.monotonic() - started) * 1000, 2))
+
+    def _attempt(self, client, model_id, body):
+        # Runs on the gate's executor with a slot already taken
+        started = time.monotonic()
+        outcome = 'error'
+        try:
+            response = client.invoke_model(modelId=model_id, body=body)
+            data = response['body'].read()
+            outcome = 'ok'
+            return data
+        except Exception as e:
+            if error_code(e) in THROTTLING_CODES:
+                outcome = 'throttled'
+            raise
+        finally:
+            self.limiter.release(outcome, started)
+
+    def _race(self, client, model_id, body, deadline, hedge, metrics):
+        """One attempt (plus an optional hedge), bounded by the deadline"""
+        self._acquire(deadline, metrics)
+        futures = [self._executor.submit(self._attempt, client, model_id, body)]
+
+        if hedge:
+            first_wait = self.hedge_after
+            if deadline is not None:
+                first_wait = min(first_wait, max(0.0, deadline - time.monotonic()))
+            done, _ = wait(futures, timeout=first_wait)
+            # Only hedge with spare capacity - a hedge must never queue behind real work
+            if not done and self.limiter.try_acquire():
+                self._count('hedges', metrics)
+                futures.append(self._executor.submit(self._attempt, client, model_id, body))
+
+        pending = set(futures)
+        error = None
+        while pending:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                self._count('deadline_exceeded', metrics)
+                raise BedrockDeadlineExceeded('Bedrock call did not finish before its deadline')
+            for future in done:
+                if future.exception() is None:
+                    if future is not futures[0]:
+                        self._count('hedge_wins', metrics)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _count(self, name, metrics):
+        with self._lock:
+            self._counters[name] += 1
+        if metrics is not None and name != 'calls':
+            metrics.add(f"bedrock_{name}", 1)
+
+
+# Process-wide gate shared by all agents
+bedrock_gate = BedrockGate()
@@ -0,0 +1,3 @@
+"""
+Offline benchmarks - measure the agent against local stand-ins for Bedrock and DynamoDB
+"""
@@ -0,0 +1,122 @@
+"""
+Benchmark product categorization: the old substring chain against ProductClassifier
+
+Usage (from the repository root):
+    python -m benchmarks.bench_classifier
+    python -m benchmarks.bench_classifier --size 100000 --repeat 5 --output classifier.json
+
+Names are drawn from the synthetic catalog plus words that fooled the old
+substring checks ("earring", "spring", "that"), with no product_type on a share
+of the items so the name rules carry the result.
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+
+from benchmarks.fakes import synthetic_catalog
+from product_classifier import DEFAULT_RULES, ProductClassifier
+
+TRICKY_WORDS = ['spring', 'that', 'earrings', 'bagatelle', 'chatty', 'string', 'beltway', 'totem']
+
+
+def substring_categorize(item):
+    """The categorization rules before product_classifier, kept as the baseline"""
+    product_type = item.get('product_type', '').upper()
+    product_name = item.get('product_name', '').lower()
+
+    if product_type == 'FOOTWEAR':
+        return 'shoes'
+
+    if (product_type in ['BAG', 'HANDBAG', 'HANDBAGS'] or
+            'bag' in product_name or 'handbag' in product_name or
+            'tote' in product_name or 'purse' in product_name or
+            'clutch' in product_name or 'crossbody' in product_name):
+        return 'handbags'
+
+    if (product_type in ['JEWELRY', 'JEWELLERY'] or
+            'necklace' in product_name or 'earring' in product_name or
+            'bracelet' in product_name or 'ring' in product_name or
+            'jewelry' in product_name or 'jewellery' in product_name):
+        return 'jewelry'
+
+    if product_type in ['CLOTHING', 'APPAREL', 'TOP', 'BOTTOM', 'DRESS']:
+        return 'clothing'
+
+    if (product_type in ['ACCESSORIES', 'ACCESSORY'] or
+            'scarf' in product_name or 'hat' in product_name or
+            'belt' in product_name or 'sunglasses' in product_name or
+            'wallet' in product_name):
+        return 'other_accessories'
+
+    return None
+
+
+def benchmark_items(size, untyped_share, seed):
+    rng = random.Random(seed)
+    items = synthetic_catalog(size, seed=seed)
+    for item in items:
+        if rng.random() < 0.3:
+            item['product_name'] = f"{rng.choice(TRICKY_WORDS).title()} {item['product_name']}"
+        if rng.random() < untyped_share:
+            item['product_type'] = ''
+    return items
+
+
+def time_runs(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark product categorization')
+    parser.add_argument('--size', type=int, default=100000, help='Products to classify (default: 100000)')
+    parser.add_argument('--untyped-share', type=float, default=0.5, help='Share of items without product_type (default: 0.5)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per method (default: 5)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    items = benchmark_items(args.size, args.untyped_share, args.seed)
+    classifier = ProductClassifier(DEFAULT_RULES)
+
+    methods = {
+        'substring_chain': lambda: [substring_categorize(item) for item in items],
+        'classifier_per_item': lambda: [classifier.primary(item) for item in items],
+        'classifier_batch': lambda: classifier.classify_many(items),
+        'classifier_batch_multi_label': lambda: classifier.classify_many(items, multi_label=True),
+    }
+
+    results = {}
+    for name, fn in methods.items():
+        median = time_runs(fn, args.repeat)
+        results[name] = {'median_ms': round(median, 2), 'items_per_second': round(args.size * 1000 / median)}
+        print(f"{name:<30} {median:>9.2f} ms  {results[name]['items_per_second']:>12,} items/s", file=sys.stderr)
+
+    old = [substring_categorize(item) for item in items]
+    new = classifier.classify_many(items)
+    changed = [(item['product_name'], before, after) for item, before, after in zip(items, old, new) if before != after]
+    print(f"{len(changed)} of {args.size} items changed category, e.g.:", file=sys.stderr)
+    for name, before, after in changed[:5]:
+        print(f"  {name!r}: {before} -> {after}", file=sys.stderr)
+
+    report = {
+        'size': args.size,
+        'untyped_share': args.untyped_share,
+        'repeat': args.repeat,
+        'results': results,
+        'changed_categories': len(changed)
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
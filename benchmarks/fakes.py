@@ -0,0 +1,305 @@
+"""
+Local stand-ins for the AWS services the agent uses
+
+- synthetic_catalog(): product table items with a configurable size and category mix
+- FakeTable: a DynamoDB Table whose meta.client answers segmented, paginated scans
+- FakeBedrock: a bedrock-runtime client with configurable latency and canned or streamed replies
+- latency_model(): latency samplers (constant, uniform, lognormal, spikes) for the fakes
+"""
+import json
+import math
+import random
+import re
+import time
+from io import BytesIO
+
+# product_type -> (name words, description words); every type lands in one agent category
+PRODUCT_TYPES = {
+    'FOOTWEAR': (['pump', 'sneaker', 'sandal', 'loafer', 'boot', 'mule', 'heel', 'flat'],
+                 ['leather', 'suede', 'block heel', 'pointed toe', 'platform', 'ankle strap']),
+    'HANDBAG': (['tote bag', 'crossbody bag', 'clutch', 'shoulder bag', 'purse', 'backpack'],
+                ['quilted', 'chain strap', 'top handle', 'magnetic closure', 'structured']),
+    'JEWELRY': (['necklace', 'earrings', 'bracelet', 'ring set', 'pendant', 'hoops'],
+                ['gold-tone', 'silver-tone', 'pearl', 'crystal', 'layered', 'minimal']),
+    'CLOTHING': (['dress', 'blazer', 'skirt', 'trousers', 'blouse', 'cardigan'],
+                 ['linen', 'satin', 'tailored', 'wrap', 'pleated', 'oversized']),
+    'ACCESSORIES': (['scarf', 'belt', 'sunglasses', 'wallet', 'hat', 'hair clip'],
+                    ['printed', 'woven', 'tortoiseshell', 'buckle', 'faux leather']),
+}
+
+# Rough share of each product_type in the real catalog
+DEFAULT_MIX = {'FOOTWEAR': 0.45, 'HANDBAG': 0.2, 'JEWELRY': 0.15, 'CLOTHING': 0.05, 'ACCESSORIES': 0.15}
+
+# Price range per product_type in dollars
+PRICE_RANGES = {
+    'FOOTWEAR': (40, 250),
+    'HANDBAG': (30, 180),
+    'JEWELRY': (10, 60),
+    'CLOTHING': (30, 150),
+    'ACCESSORIES': (10, 70),
+}
+
+COLORS = ['black', 'white', 'beige', 'tan', 'navy', 'red', 'pink', 'green', 'silver', 'gold', 'brown', 'cream']
+
+DESCRIPTION = 'An outfit of a black midi dress with a tailored beige blazer, formal and elegant, suited to an evening event.'
+
+
+def synthetic_catalog(size, mix=None, seed=0):
+    """`size` product table items, drawn with the product_type shares in `mix`"""
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    types = list(mix)
+    weights = [mix[t] for t in types]
+    items = []
+    for i in range(size):
+        product_type = rng.choices(types, weights)[0]
+        names, details = PRODUCT_TYPES[product_type]
+        low, high = PRICE_RANGES[product_type]
+        color = rng.choice(COLORS)
+        name = f"{color.title()} {rng.choice(details)} {rng.choice(names)}"
+        items.append({
+            'product_id': f"P{i:07d}",
+            'product_name': name,
+            'price': f"${rng.uniform(low, high):,.2f}",
+            'product_type': product_type,
+            'description': f"{name} in {color} with {rng.choice(details)} details. {rng.choice(details).capitalize()} finish.",
+            'product_url': f"https://www.aldoshoes.com/us/en_US/p/{i}",
+            'original_image_url': f"https://media.aldoshoes.com/v2/product/{i}.jpg",
+            # Attributes the catalog projection should never fetch
+            'sizes': ' '.join(str(s) for s in range(5, 12)),
+            'long_description': 'x' * 400
+        })
+    return items
+
+
+def synthetic_image(width=3024, height=4032, seed=0):
+    """JPEG bytes of a phone-camera sized photo (a tiny JPEG header without Pillow); seeds give distinct images"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return b'\xff\xd8\xff\xe0' + seed.to_bytes(4, 'big') + b'\x00' * 1024
+    rng = random.Random(seed)
+    img = Image.new('RGB', (width, height), (30, 30, 30))
+    shade = (200, 180, 150) if seed == 0 else tuple(rng.randrange(256) for _ in range(3))
+    img.paste(shade, (width // 4, height // 5, 3 * width // 4, 4 * height // 5))
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=92)
+    return output.getvalue()
+
+
+def latency_model(spec, seed=0):
+    """
+    Sampler returning seconds from a spec string:
+        0.3                  constant
+        uniform:0.2,0.6      uniform between two bounds
+        lognormal:0.3,0.5    lognormal with this median and sigma
+        spike:0.3,4,0.05     0.3s, except 4s with probability 0.05
+    """
+    rng = random.Random(seed)
+    kind, _, params = str(spec).partition(':')
+    if not params:
+        value = float(kind)
+        return lambda: value
+    values = [float(v) for v in params.split(',')]
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'spike':
+        return lambda: values[1] if rng.random() < values[2] else values[0]
+    raise ValueError(f"Unknown latency model {spec!r}")
+
+
+class ThrottlingError(Exception):
+    """Shaped like the botocore ClientError Bedrock raises when it throttles a call"""
+
+    def __init__(self, code='ThrottlingException'):
+        super().__init__(f"An error occurred ({code}) when calling the InvokeModel operation: Too many requests")
+        self.response = {'Error': {'Code': code, 'Message': 'Too many requests'}}
+
+
+def _attribute_value(value):
+    return {'N': str(value)} if isinstance(value, (int, float)) else {'S': str(value)}
+
+
+class FakeScanClient:
+    """Low-level DynamoDB client answering Scan over a fixed list of items"""
+
+    def __init__(self, items, page_latency=0.0):
+        self.items = items
+        self.page_latency = page_latency
+        self.scans = 0
+
+    def scan(self, TableName, Segment=0, TotalSegments=1, Limit=1000, ExclusiveStartKey=None,
+             ProjectionExpression=None, ExpressionAttributeNames=None):
+        self.scans += 1
+        if self.page_latency:
+            time.sleep(self.page_latency)
+
+        fields = None
+        if ProjectionExpression:
+            names = ExpressionAttributeNames or {}
+            fields = {names.get(part.strip(), part.strip()) for part in ProjectionExpression.split(',')}
+
+        # Segment n owns every TotalSegments-th item, like a hash split
+        start = int(ExclusiveStartKey['position']['N']) if ExclusiveStartKey else Segment
+        stop = min(len(self.items), start + Limit * TotalSegments)
+        page = []
+        for item in self.items[start:stop:TotalSegments]:
+            page.append({k: _attribute_value(v) for k, v in item.items() if fields is None or k in fields})
+
+        response = {'Items': page, 'Count': len(page), 'ScannedCount': len(page)}
+        if stop < len(self.items):
+            response['LastEvaluatedKey'] = {'position': {'N': str(stop)}}
+        return response
+
+
+class _Meta:
+    def __init__(self, client):
+        self.client = client
+
+
+class FakeTable:
+    """Enough of a boto3 Table resource for the catalog loader"""
+
+    def __init__(self, items, name='aldo-product-metadata', page_latency=0.0):
+        self.name = name
+        self.meta = _Meta(FakeScanClient(items, page_latency))
+
+    @property
+    def item_count(self):
+        # DescribeTable's ItemCount
+        return len(self.meta.client.items)
+
+
+class _Body:
+    def __init__(self, data):
+        self._data = data
+
+    def read(self):
+        return self._data
+
+
+class _EventStream:
+    """Iterable of Bedrock stream events that stops early once closed"""
+
+    def __init__(self, events, chunk_delay):
+        self._events = events
+        self._chunk_delay = chunk_delay
+        self.closed = False
+
+    def __iter__(self):
+        for event in self._events:
+            if self.closed:
+                return
+            if self._chunk_delay and event['type'] == 'content_block_delta':
+                time.sleep(self._chunk_delay)
+            yield {'chunk': {'bytes': json.dumps(event).encode('utf-8')}}
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrock:
+    """
+    bedrock-runtime stand-in.
+
+    Image requests get a canned outfit description (a JSON array of them when
+    the prompt asks for one per outfit); bundling requests, fused ones with
+    images included, get three bundles built from the product IDs in the
+    prompt, so the solver sees the same shapes it gets from Claude. `latency` (seconds, or a sampler from
+    latency_model()) is added to every call, a `throttle_rate` share of calls
+    fail at once with ThrottlingError, and streamed replies wait `chunk_delay`
+    between `chunk_size`-character deltas.
+    """
+
+    def __init__(self, latency=0.0, chunk_size=16, chunk_delay=0.0, description=DESCRIPTION, throttle_rate=0.0, seed=0):
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.description = description
+        self.throttle_rate = throttle_rate
+        self.calls = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+
+    def invoke_model(self, modelId, body):
+        text, usage = self._reply(body)
+        return {'body': _Body(json.dumps({
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'usage': usage
+        }).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        text, usage = self._reply(body)
+        events = [{'type': 'message_start', 'message': {'usage': {'input_tokens': usage['input_tokens'], 'output_tokens': 1}}}]
+        for i in range(0, len(text), self.chunk_size):
+            events.append({'type': 'content_block_delta', 'index': 0,
+                           'delta': {'type': 'text_delta', 'text': text[i:i + self.chunk_size]}})
+        events.append({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': usage['output_tokens']}})
+        events.append({'type': 'message_stop'})
+        return {'body': _EventStream(events, self.chunk_delay)}
+
+    def _reply(self, body):
+        self.calls += 1
+        if self.throttle_rate and self._random.random() < self.throttle_rate:
+            self.throttled += 1
+            raise ThrottlingError()
+        latency = self.latency() if callable(self.latency) else self.latency
+        if latency:
+            time.sleep(latency)
+
+        request = json.loads(body)
+        texts = []
+        images = 0
+        for message in request.get('messages', []):
+            for block in message.get('content', []):
+                if block.get('type') == 'image':
+                    images += 1
+                elif block.get('type') == 'text':
+                    texts.append(block['text'])
+        for block in request.get('system', []) if isinstance(request.get('system'), list) else []:
+            texts.append(block.get('text', ''))
+
+        prompt = '\n'.join(texts)
+        if 'AVAILABLE PRODUCTS' in prompt or not images:
+            text = json.dumps(self._bundles(prompt), indent=2)
+        elif '"description"' in prompt:
+            text = json.dumps([{'outfit': i + 1, 'description': self.description} for i in range(images)], indent=2)
+        else:
+            text = self.description
+        # ~4 characters per token, plus a flat cost per image
+        usage = {'input_tokens': len(prompt) // 4 + 1500 * images, 'output_tokens': max(1, len(text) // 4)}
+        return text, usage
+
+    def _bundles(self, prompt):
+        ids = {}
+        for item_id in re.findall(r'\b([SHJCA]\d+)\b', prompt):
+            ids.setdefault(item_id[0], [])
+            if item_id not in ids[item_id[0]]:
+                ids[item_id[0]].append(item_id)
+
+        def pick(prefix, n):
+            found = ids.get(prefix, [])
+            return found[n] if n < len(found) else None
+
+        picks = [
+            ('Evening Classic', 'budget', [pick('S', 0), pick('H', 0)]),
+            ('Polished Minimal', 'mid-range', [pick('S', 1), pick('J', 0)]),
+            ('Statement Night', 'premium', [pick('S', 2), pick('H', 1), pick('J', 1)]),
+        ]
+        categories = {'S': 'shoes', 'H': 'handbag', 'J': 'jewelry', 'C': 'clothing', 'A': 'accessory'}
+        bundles = []
+        for score, (name, bundle_type, item_ids) in zip((9, 8, 9), picks):
+            items = [{'id': item_id, 'category': categories[item_id[0]], 'reason': 'Echoes the outfit palette'}
+                     for item_id in item_ids if item_id]
+            bundles.append({
+                'bundle_name': name,
+                'bundle_type': bundle_type,
+                'match_score': score,
+                'total_cost': 0,
+                'items': items,
+                'styling_note': 'Keep the rest of the look simple.'
+            })
+        return bundles
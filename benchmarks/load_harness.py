@@ -0,0 +1,300 @@
+"""
+Load-test the full request path against local stand-ins for Bedrock and DynamoDB
+
+Usage (from the repository root):
+    python -m benchmarks.load_harness
+    python -m benchmarks.load_harness --targets lambda,asgi --concurrency 1,16,64,256 --requests 400
+    python -m benchmarks.load_harness --bedrock-latency spike:0.4,5,0.05 --throttle-rate 0.1
+    python -m benchmarks.load_harness --compare benchmarks/results/load-<old commit>.json
+
+Requests replay a traffic mix: 1-5 images each, varied budgets, ages, genders,
+occasions and seasons, with a share of exact duplicates (retries, shared looks)
+that the response and description caches should absorb. Each concurrency level
+is a closed loop - that many clients sending back to back - against:
+
+    lambda    lambda_handler called from a thread per client (one warm container
+              serving them all, as the shared process-wide state would)
+    asgi      outfit_bundle_server's ASGI app, driven in-process without sockets
+
+Caches and the Bedrock gate's window are reset before every level. The report
+has p50/p95/p99 latency, throughput, status counts, Bedrock retries and
+throttles, and resident memory before and after each level; the level with the
+highest throughput marks where the target saturates.
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Per-request metric lines and disk-cached descriptions would skew every run
+os.environ['METRICS_FORMAT'] = 'off'
+os.environ['DESCRIPTION_CACHE_DIR'] = ''
+
+import outfit_bundle_agent
+import product_catalog
+from bedrock_gate import AdaptiveLimiter, bedrock_gate
+from benchmarks.fakes import FakeBedrock, FakeTable, latency_model, synthetic_catalog, synthetic_image
+from benchmarks.run_benchmarks import RESULTS_DIR, _commit, _percentile
+from description_cache import description_cache
+from outfit_bundle_api import lambda_handler
+from response_cache import response_cache
+
+TARGETS = ('lambda', 'asgi')
+
+BUDGETS = (50, 80, 120, 150, 200, 250, 300, 400, 500)
+AGES = (None, '19', '24', '31', '38', '45', '57')
+GENDERS = (None, 'female', 'male', 'non-binary')
+OCCASIONS = (None, 'wedding', 'office', 'date night', 'garden party', 'gala', 'weekend brunch', 'concert')
+SEASONS = (None, 'spring', 'summer', 'fall', 'winter')
+
+# Images per request, 1 to 5, mostly one or two
+IMAGE_COUNT_WEIGHTS = (0.45, 0.25, 0.15, 0.1, 0.05)
+
+
+def traffic_mix(count, image_pool, duplicate_share, seed):
+    """`count` request bodies; a duplicate_share of them repeat an earlier body exactly"""
+    rng = random.Random(seed)
+    bodies = []
+    for _ in range(count):
+        if bodies and rng.random() < duplicate_share:
+            bodies.append(rng.choice(bodies))
+            continue
+        images = rng.sample(image_pool, rng.choices(range(1, 6), IMAGE_COUNT_WEIGHTS)[0])
+        body = {'images': images, 'budget': rng.choice(BUDGETS)}
+        for field, values in (('age', AGES), ('gender', GENDERS), ('occasion', OCCASIONS), ('season', SEASONS)):
+            value = rng.choice(values)
+            if value is not None:
+                body[field] = value
+        bodies.append(body)
+    return bodies
+
+
+def _rss_mb():
+    """Current resident set size (peak RSS where /proc is unavailable)"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return round(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20, 1)
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10), 1)
+
+
+def run_lambda(payloads, concurrency):
+    """(seconds, status) per request, `concurrency` threads calling lambda_handler back to back"""
+    def call(payload):
+        started = time.perf_counter()
+        response = lambda_handler({'body': payload, 'headers': {'Content-Type': 'application/json'}}, None)
+        return time.perf_counter() - started, response['statusCode']
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='load-client') as pool:
+        return list(pool.map(call, payloads))
+
+
+async def asgi_request(app, method, path, body=b'', headers=None):
+    """Send one request to an ASGI app in-process; returns (status, body bytes)"""
+    request = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    finished = asyncio.Event()
+    response = {'status': None, 'chunks': []}
+
+    async def receive():
+        if request:
+            return request.pop()
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['chunks'].append(message.get('body', b''))
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+        'headers': [(key.lower().encode('latin-1'), value.encode('latin-1')) for key, value in (headers or {}).items()]
+    }
+    try:
+        await app(scope, receive, send)
+    finally:
+        finished.set()
+    return response['status'], b''.join(response['chunks'])
+
+
+def run_asgi(payloads, concurrency):
+    """(seconds, status) per request, `concurrency` clients posting to a fresh BundleServer"""
+    from outfit_bundle_server import BundleServer
+
+    async def run():
+        app = BundleServer()
+        # Wait for the catalog warm-up so it is not counted against the first requests
+        await asgi_request(app, 'GET', '/health')
+        while (await asgi_request(app, 'GET', '/health'))[0] != 200:
+            await asyncio.sleep(0.05)
+
+        clients = asyncio.Semaphore(concurrency)
+
+        async def call(payload):
+            async with clients:
+                started = time.perf_counter()
+                status, _ = await asgi_request(app, 'POST', '/outfit-bundles', payload.encode('utf-8'),
+                                               {'Content-Type': 'application/json'})
+                return time.perf_counter() - started, status
+
+        try:
+            return await asyncio.gather(*(call(payload) for payload in payloads))
+        finally:
+            await app._shutdown()
+
+    return asyncio.run(run())
+
+
+RUNNERS = {'lambda': run_lambda, 'asgi': run_asgi}
+
+
+def run_level(target, concurrency, payloads):
+    """Run one target at one concurrency level and summarize it"""
+    response_cache.clear()
+    description_cache.clear()
+    bedrock_gate.limiter = AdaptiveLimiter()
+    gate_before = bedrock_gate.stats()
+    cache_before = response_cache.stats()
+    rss_before = _rss_mb()
+
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        outcomes = RUNNERS[target](payloads, concurrency)
+    duration = time.perf_counter() - started
+
+    latencies = sorted(seconds * 1000 for seconds, _ in outcomes)
+    statuses = Counter(str(status) for _, status in outcomes)
+    gate_after = bedrock_gate.stats()
+    cache_after = response_cache.stats()
+    return {
+        'target': target,
+        'concurrency': concurrency,
+        'requests': len(outcomes),
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(outcomes) / duration, 2),
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.50), 1),
+            'p95': round(_percentile(latencies, 0.95), 1),
+            'p99': round(_percentile(latencies, 0.99), 1),
+            'max': round(latencies[-1], 1),
+            'mean': round(sum(latencies) / len(latencies), 1)
+        },
+        'statuses': dict(statuses),
+        'error_rate': round(1 - statuses.get('200', 0) / len(outcomes), 4),
+        'bedrock': {name: gate_after[name] - gate_before[name]
+                    for name in ('calls', 'retries', 'throttles', 'hedges', 'deadline_exceeded', 'gave_up')},
+        'bedrock_window_end': gate_after['limit'],
+        'response_cache': {name: cache_after[name] - cache_before[name] for name in ('hits', 'coalesced', 'misses')},
+        'rss_mb': {'before': rss_before, 'after': _rss_mb()}
+    }
+
+
+def compare(old_path, new_results):
+    """Print latency and throughput changes per (target, concurrency) against an earlier report"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    old_results = {(r['target'], r['concurrency']): r for r in old['results']}
+
+    print(f"\nCompared with {old.get('commit', old_path)}")
+    print(f"{'target':<8} {'conc':>5} {'p50 ms':>18} {'p95 ms':>18} {'p99 ms':>18} {'req/s':>16}")
+    for result in new_results:
+        before = old_results.get((result['target'], result['concurrency']))
+        if before is None:
+            continue
+        columns = [f"{before['latency_ms'][p]:>7.0f}->{result['latency_ms'][p]:<7.0f}" for p in ('p50', 'p95', 'p99')]
+        rate = f"{before['throughput_rps']:>6.1f}->{result['throughput_rps']:<6.1f}"
+        print(f"{result['target']:<8} {result['concurrency']:>5} {columns[0]:>18} {columns[1]:>18} {columns[2]:>18} {rate:>16}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load-test lambda_handler and the ASGI server against local fakes')
+    parser.add_argument('--targets', default=','.join(TARGETS), help='Comma-separated targets (default: lambda,asgi)')
+    parser.add_argument('--concurrency', default='1,8,32,128', help='Comma-separated client counts (default: 1,8,32,128)')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per level (default: 200)')
+    parser.add_argument('--catalog-size', type=int, default=10000, help='Synthetic catalog items (default: 10000)')
+    parser.add_argument('--bedrock-latency', default='lognormal:0.4,0.35',
+                        help='Bedrock latency model, see benchmarks.fakes.latency_model (default: lognormal:0.4,0.35)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of Bedrock calls throttled (default: 0)')
+    parser.add_argument('--page-latency', type=float, default=0.02, help='Seconds per DynamoDB scan page (default: 0.02)')
+    parser.add_argument('--duplicate-share', type=float, default=0.15, help='Share of exact duplicate requests (default: 0.15)')
+    parser.add_argument('--image-pool', type=int, default=40, help='Distinct outfit images to draw from (default: 40)')
+    parser.add_argument('--image-size', default='1024x1365', help='Outfit image size WxH (default: 1024x1365)')
+    parser.add_argument('--seed', type=int, default=0, help='Traffic and fake seed (default: 0)')
+    parser.add_argument('--output', help='Report file (default: benchmarks/results/load-<commit>.json)')
+    parser.add_argument('--compare', help='Earlier load report to compare against')
+
+    args = parser.parse_args(argv)
+    targets = [target for target in args.targets.split(',') if target]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',') if level]
+    width, height = (int(value) for value in args.image_size.lower().split('x'))
+
+    image_pool = [base64.b64encode(synthetic_image(width, height, seed=i + 1)).decode('ascii') for i in range(args.image_pool)]
+    payloads = [json.dumps(body) for body in traffic_mix(args.requests, image_pool, args.duplicate_share, args.seed)]
+
+    bedrock = FakeBedrock(latency=latency_model(args.bedrock_latency, args.seed), throttle_rate=args.throttle_rate, seed=args.seed)
+    table = FakeTable(synthetic_catalog(args.catalog_size, seed=args.seed), name=f"load-{args.catalog_size}",
+                      page_latency=args.page_latency)
+    outfit_bundle_agent._clients['bedrock_client'] = bedrock
+    outfit_bundle_agent._clients['product_table'] = table
+    product_catalog.get_catalog_cache(table).get()
+
+    results = []
+    for target in targets:
+        for concurrency in levels:
+            result = run_level(target, concurrency, payloads)
+            results.append(result)
+            latency = result['latency_ms']
+            print(f"{target:<7} c={concurrency:<5} {result['throughput_rps']:>7.1f} req/s  p50 {latency['p50']:>8.0f}  "
+                  f"p95 {latency['p95']:>8.0f}  p99 {latency['p99']:>8.0f} ms  errors {result['error_rate']:.1%}  "
+                  f"rss {result['rss_mb']['before']:.0f}->{result['rss_mb']['after']:.0f} MB", file=sys.stderr)
+        best = max((r for r in results if r['target'] == target), key=lambda r: r['throughput_rps'])
+        print(f"{target}: throughput peaks at {best['throughput_rps']:.1f} req/s with {best['concurrency']} clients", file=sys.stderr)
+
+    commit = _commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'targets': targets,
+            'concurrency': levels,
+            'requests': args.requests,
+            'catalog_size': args.catalog_size,
+            'bedrock_latency': args.bedrock_latency,
+            'throttle_rate': args.throttle_rate,
+            'page_latency': args.page_latency,
+            'duplicate_share': args.duplicate_share,
+            'image_pool': args.image_pool,
+            'image_size': args.image_size,
+            'seed': args.seed
+        },
+        'results': results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
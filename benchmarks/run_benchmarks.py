@@ -0,0 +1,266 @@
+"""
+Benchmark the agent's stages against local stand-ins for Bedrock and DynamoDB
+
+Usage (from the repository root):
+    python -m benchmarks.run_benchmarks
+    python -m benchmarks.run_benchmarks --sizes 300,100000 --repeat 10 --latency 0.05
+    python -m benchmarks.run_benchmarks --compare benchmarks/results/<old commit>.json
+    python -m benchmarks.run_benchmarks --sizes 1000 --stages pipeline_two_stage,pipeline_multi_image,pipeline_fused --latency 0.5
+
+Every stage runs `repeat` timed iterations and one more under tracemalloc, so
+the allocation numbers never inflate the wall times. Results are written as
+JSON (default benchmarks/results/<commit>.json); --compare prints the median
+change against an earlier results file and exits non-zero on regressions.
+The pipeline_* stages run the same outfits through each pipeline mode and also
+record its model calls and tokens per request.
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Disk-cached descriptions would turn every analyze run after the first into a file read
+os.environ['DESCRIPTION_CACHE_DIR'] = ''
+
+import outfit_bundle_agent
+import product_catalog
+from catalog_file import CatalogFile, write_catalog_file
+from benchmarks.fakes import DESCRIPTION, FakeBedrock, FakeTable, synthetic_catalog, synthetic_image
+from description_cache import description_cache
+from outfit_bundle_agent import PIPELINE_MODES, OutfitBundleAgent
+from outfit_images import OutfitImage
+from outfit_bundle_api import lambda_handler
+from product_catalog import CatalogSnapshot, scan_catalog
+from response_cache import response_cache
+
+DEFAULT_SIZES = (300, 1000, 10000, 100000)
+STAGES = ('catalog_load', 'catalog_file_load', 'get_products_from_dynamodb', 'analyze_outfit',
+          'create_bundles', 'create_bundles_stream', 'lambda_handler') + tuple(f"pipeline_{mode}" for mode in PIPELINE_MODES)
+
+# Outfits per request in the pipeline_* stages
+PIPELINE_OUTFITS = 3
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(fn, repeat, setup=None):
+    """Wall time of `repeat` runs of fn(), then peak/net allocations of one traced run"""
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            if setup:
+                setup()
+            started = time.perf_counter()
+            fn()
+            times.append((time.perf_counter() - started) * 1000)
+
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            fn()
+            after, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    times.sort()
+    median = statistics.median(times)
+    return {
+        'runs': repeat,
+        'wall_ms': {
+            'min': round(times[0], 3),
+            'median': round(median, 3),
+            'mean': round(statistics.mean(times), 3),
+            'p95': round(_percentile(times, 0.95), 3),
+            'max': round(times[-1], 3)
+        },
+        'ops_per_second': round(1000 / median, 2) if median else None,
+        'alloc_peak_kb': round((peak - before) / 1024, 1),
+        'alloc_net_kb': round((after - before) / 1024, 1)
+    }
+
+
+def benchmark_size(size, args, image_path, image_data, tmp):
+    """Run every selected stage against a synthetic catalog of `size` items"""
+    items = synthetic_catalog(size, seed=args.seed)
+    table = FakeTable(items, name=f"bench-{size}", page_latency=args.page_latency)
+    bedrock = FakeBedrock(latency=args.latency, chunk_size=args.chunk_size, chunk_delay=args.chunk_delay)
+
+    # lambda_handler builds its own agents on the shared process-wide clients
+    outfit_bundle_agent._clients['bedrock_client'] = bedrock
+    outfit_bundle_agent._clients['product_table'] = table
+
+    agent = OutfitBundleAgent(budget=args.budget, occasion='evening event', season='fall', bedrock=bedrock, table=table)
+    snapshot = agent.catalog.get()
+    products = agent.get_products_from_dynamodb()
+    catalog_path = os.path.join(tmp, f"catalog-{size}.bin")
+    write_catalog_file(snapshot, catalog_path, table.name)
+
+    event = {'body': json.dumps({
+        'images': [base64.b64encode(image_data).decode('ascii')],
+        'occasion': 'evening event',
+        'season': 'fall',
+        'budget': args.budget
+    })}
+
+    def handle():
+        response = lambda_handler(event, None)
+        if response['statusCode'] != 200:
+            raise RuntimeError(f"lambda_handler returned {response['statusCode']}: {response['body'][:200]}")
+
+    def fresh_request():
+        response_cache.clear()
+        description_cache.clear()
+
+    outfits = [OutfitImage(data=synthetic_image(seed=seed), name=f"outfit_{seed + 1}") for seed in range(PIPELINE_OUTFITS)]
+    last_agents = {}
+
+    def recommend(mode):
+        agent = OutfitBundleAgent(budget=args.budget, occasion='evening event', season='fall', bedrock=bedrock,
+                                  table=table, pipeline=mode)
+        bundles, _ = agent.recommend(outfits)
+        if not bundles:
+            raise RuntimeError(f"The {mode} pipeline returned no bundles")
+        last_agents[mode] = agent
+
+    stages = {
+        'catalog_load': (lambda: CatalogSnapshot(scan_catalog(table)), None),
+        'catalog_file_load': (lambda: CatalogFile(catalog_path).snapshot(), None),
+        'get_products_from_dynamodb': (agent.get_products_from_dynamodb, None),
+        'analyze_outfit': (lambda: agent.analyze_outfit(image_path), description_cache.clear),
+        'create_bundles': (lambda: agent.create_bundles(DESCRIPTION, *products), None),
+        'create_bundles_stream': (lambda: list(agent.create_bundles_stream(DESCRIPTION, *products)), None),
+        'lambda_handler': (handle, fresh_request),
+    }
+    for mode in PIPELINE_MODES:
+        stages[f"pipeline_{mode}"] = ((lambda mode=mode: recommend(mode)), description_cache.clear)
+
+    results = []
+    for stage in args.stages:
+        fn, setup = stages[stage]
+        calls_before = bedrock.calls
+        result = measure(fn, args.repeat, setup)
+        result.update({'catalog_size': size, 'stage': stage})
+        result['bedrock_calls_per_op'] = round((bedrock.calls - calls_before) / (args.repeat + 1), 2)
+        if stage in ('catalog_load', 'catalog_file_load'):
+            result['items_per_second'] = round(size * 1000 / result['wall_ms']['median'])
+        if stage.startswith('pipeline_'):
+            result['pipeline'] = last_agents[stage[len('pipeline_'):]].pipeline_report()
+        results.append(result)
+        print(f"{size:>7} {stage:<28} median {result['wall_ms']['median']:>10.2f} ms  "
+              f"p95 {result['wall_ms']['p95']:>10.2f} ms  peak {result['alloc_peak_kb']:>10.1f} KiB", file=sys.stderr)
+
+    # Free this size's snapshot before building the next, larger one
+    with product_catalog._caches_lock:
+        product_catalog._caches.pop(table.name, None)
+    return results
+
+
+def compare(old_path, new_results, threshold):
+    """Print the median change per stage and return the number of regressions"""
+    with open(old_path, 'r', encoding='utf-8') as f:
+        old = json.load(f)
+    old_medians = {(r['catalog_size'], r['stage']): r['wall_ms']['median'] for r in old['results']}
+
+    regressions = 0
+    print(f"\nCompared with {old.get('commit', old_path)} (regression threshold {threshold:.0%})")
+    for result in new_results:
+        key = (result['catalog_size'], result['stage'])
+        if key not in old_medians or not old_medians[key]:
+            continue
+        change = result['wall_ms']['median'] / old_medians[key] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{key[0]:>7} {key[1]:<28} {old_medians[key]:>10.2f} -> {result['wall_ms']['median']:>10.2f} ms  {change:+.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the outfit bundle agent against local fakes')
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Comma-separated catalog sizes (default: 300,1000,10000,100000)')
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Comma-separated stages (default: all of {', '.join(STAGES)})")
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per stage (default: 5)')
+    parser.add_argument('--budget', type=float, default=200, help='Bundle budget (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every Bedrock call (default: 0)')
+    parser.add_argument('--chunk-size', type=int, default=16, help='Characters per streamed Bedrock delta (default: 16)')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='Seconds between streamed deltas (default: 0)')
+    parser.add_argument('--page-latency', type=float, default=0.0, help='Seconds per DynamoDB scan page (default: 0)')
+    parser.add_argument('--seed', type=int, default=0, help='Synthetic catalog seed (default: 0)')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare medians against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Median slowdown counted as a regression (default: 0.10)')
+
+    args = parser.parse_args(argv)
+    args.stages = [stage for stage in args.stages.split(',') if stage]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"Unknown stages: {', '.join(sorted(unknown))}")
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    commit = _commit()
+    image_data = synthetic_image()
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, 'outfit.jpg')
+        with open(image_path, 'wb') as f:
+            f.write(image_data)
+
+        results = []
+        for size in sizes:
+            results.extend(benchmark_size(size, args, image_path, image_data, tmp))
+
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {
+            'sizes': sizes,
+            'repeat': args.repeat,
+            'budget': args.budget,
+            'latency': args.latency,
+            'chunk_size': args.chunk_size,
+            'chunk_delay': args.chunk_delay,
+            'page_latency': args.page_latency,
+            'seed': args.seed,
+            'image_bytes': len(image_data)
+        },
+        'results': results
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
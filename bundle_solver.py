@@ -0,0 +1,296 @@
+"""
+Bundle Solver - Deterministic price repair and construction of bundles
+"""
+from bisect import bisect_left, bisect_right
+
+# Prompt ID prefix -> category name used in bundle items
+CATEGORY_NAMES = {'S': 'shoes', 'H': 'handbag', 'J': 'jewelry', 'C': 'clothing', 'A': 'accessory'}
+
+MAX_EXTRAS = 2
+
+# Objective weights - keeping the model's own picks dominates, reusing a shoe is discouraged
+KEEP_WEIGHT = 1000.0
+REUSED_SHOE_PENALTY = 500.0
+
+# Prices are in dollars; anything closer than half a cent counts as equal
+EPSILON = 0.005
+
+
+def _bundle_slots(budget):
+    """The 2 within-budget + 1 premium distribution as (bundle_type, low, high) windows"""
+    return [
+        ('within_budget', 0.0, budget - EPSILON),
+        ('within_budget', 0.0, budget - EPSILON),
+        ('premium', budget + 50 - EPSILON, budget + 75 + EPSILON)
+    ]
+
+
+def _match_score(value):
+    """A model match score as a float, or None if it is missing or not a number ("9/10", "high")"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class _RangeMax:
+    """Sparse table answering 'best scoring index in [start, stop)' in O(1)"""
+
+    def __init__(self, scores):
+        self.scores = scores
+        self.table = [list(range(len(scores)))]
+        width = 1
+        while width * 2 <= len(scores):
+            previous = self.table[-1]
+            self.table.append([
+                previous[i] if scores[previous[i]] >= scores[previous[i + width]] else previous[i + width]
+                for i in range(len(scores) - width * 2 + 1)
+            ])
+            width *= 2
+
+    def best(self, start, stop):
+        if start >= stop:
+            return None
+        level = (stop - start).bit_length() - 1
+        left = self.table[level][start]
+        right = self.table[level][stop - (1 << level)]
+        return left if self.scores[left] >= self.scores[right] else right
+
+
+class BundleSolver:
+    """
+    Turn the model's bundles into exactly 2 within-budget bundles and 1 premium bundle.
+
+    Model bundles whose real price already fits an open slot are accepted as-is.
+    Bundles that miss every window are repaired by the cheapest-to-explain edit:
+    the best shoe + 0-2 extras inside the window, weighted to keep as many of the
+    model's items as possible. Slots still open after that are filled with the
+    best-ranked products the model mentioned anywhere. Everything runs over the
+    same S1/H1/... product maps as the prompt, so no second model call is needed.
+    """
+
+    def __init__(self, budget, product_maps):
+        self.budget = budget
+        self.slots = _bundle_slots(budget)
+        self.filled = [None] * len(self.slots)
+        self.filled_ids = [None] * len(self.slots)
+        self.sources = [None] * len(self.slots)
+        self.products = {}
+        self.order = {}
+        for prefix_map in product_maps.values():
+            for item_id, product in prefix_map.items():
+                self.order[item_id] = len(self.products)
+                self.products[item_id] = product
+
+        self.shoe_ids = [item_id for item_id in self.products if item_id.startswith('S')]
+        self.extra_ids = sorted(
+            (item_id for item_id in self.products if not item_id.startswith('S')),
+            key=self.price
+        )
+        self.extra_prices = [self.price(item_id) for item_id in self.extra_ids]
+        self.preference = {}
+        self.reasons = {}
+        self.categories = {}
+        self.scores = []
+
+    def price(self, item_id):
+        return float(self.products[item_id].get('price_float', 0))
+
+    def counts(self):
+        """Accepted bundles so far by type"""
+        counts = {'within_budget': 0, 'premium': 0}
+        for (bundle_type, _, _), bundle in zip(self.slots, self.filled):
+            if bundle:
+                counts[bundle_type] += 1
+        return counts
+
+    def complete(self):
+        """True once every slot is filled"""
+        return all(self.filled)
+
+    def bundles(self):
+        """Accepted bundles in slot order (within-budget first, premium last)"""
+        return [bundle for bundle in self.filled if bundle]
+
+    def accept(self, bundle):
+        """
+        Record a model bundle and accept it if its real price fits an open slot.
+        Returns the enriched bundle, or None if it needs repair.
+        """
+        item_ids = self._note_model_bundle(bundle)
+        if not item_ids or sum(1 for item_id in item_ids if item_id.startswith('S')) != 1:
+            return None
+        if len(item_ids) > 1 + MAX_EXTRAS:
+            return None
+
+        cost = sum(self.price(item_id) for item_id in item_ids)
+        for slot, (bundle_type, low, high) in enumerate(self.slots):
+            if self.filled[slot] is None and low <= cost <= high:
+                return self._enriched(bundle, item_ids, bundle_type, slot, 'model')
+        return None
+
+    def finish(self, model_bundles):
+        """
+        Fill the open slots by repairing unused model bundles, then from ranked products.
+        Returns the newly created bundles.
+        """
+        created = []
+        used = {id(source) for source in self.sources if source is not None}
+
+        # Repair model bundles in the order the model ranked them
+        for bundle in model_bundles:
+            if self.complete():
+                break
+            if id(bundle) in used:
+                continue
+            item_ids = self._item_ids(bundle)
+            if not item_ids:
+                continue
+            slot = self._nearest_open_slot(sum(self.price(item_id) for item_id in item_ids))
+            _, low, high = self.slots[slot]
+            repaired = self._search(low, high, keep=set(item_ids))
+            if repaired:
+                created.append(self._enriched(bundle, repaired, self.slots[slot][0], slot, 'repaired'))
+                used.add(id(bundle))
+
+        # Build the rest from the best-ranked products
+        for slot, (bundle_type, low, high) in enumerate(self.slots):
+            if self.filled[slot] is not None:
+                continue
+            built = self._search(low, high, keep=set())
+            if built:
+                created.append(self._enriched({}, built, bundle_type, slot, 'solver'))
+
+        return created
+
+    def solve(self, model_bundles):
+        """Accept, repair and complete a full list of model bundles"""
+        for bundle in model_bundles:
+            self.accept(bundle)
+        self.finish(model_bundles)
+        return self.bundles()
+
+    def _item_ids(self, bundle):
+        item_ids = []
+        for item in bundle.get('items', []):
+            item_id = item.get('id', '')
+            if item_id in self.products and item_id not in item_ids:
+                item_ids.append(item_id)
+        return item_ids
+
+    def _note_model_bundle(self, bundle):
+        """Update product preferences from a model bundle and return its valid item IDs"""
+        item_ids = self._item_ids(bundle)
+        score = _match_score(bundle.get('match_score'))
+        weight = score or 5
+        for item in bundle.get('items', []):
+            item_id = item.get('id', '')
+            if item_id in self.products:
+                self.preference[item_id] = self.preference.get(item_id, 0.0) + weight
+                self.reasons.setdefault(item_id, item.get('reason', ''))
+                self.categories.setdefault(item_id, item.get('category'))
+        if score is not None:
+            self.scores.append(score)
+        return item_ids
+
+    def _nearest_open_slot(self, cost):
+        def distance(slot):
+            _, low, high = self.slots[slot]
+            return max(low - cost, cost - high, 0)
+        open_slots = [slot for slot in range(len(self.slots)) if self.filled[slot] is None]
+        return min(open_slots, key=distance)
+
+    def _score(self, item_id, keep, used_shoes):
+        # Earlier prompt position is a tiny tie-breaker so results are deterministic
+        score = self.preference.get(item_id, 0.0) - self.order[item_id] * 1e-6
+        if item_id in keep:
+            score += KEEP_WEIGHT
+        if item_id in used_shoes:
+            score -= REUSED_SHOE_PENALTY
+        return score
+
+    def _search(self, low, high, keep):
+        """Best shoe + 0-2 extras whose total price lies in [low, high], or None"""
+        used_shoes = {item_id for item_ids in self.filled_ids if item_ids for item_id in item_ids if item_id.startswith('S')}
+        extra_scores = [self._score(item_id, keep, used_shoes) for item_id in self.extra_ids]
+        best_extra = _RangeMax(extra_scores) if extra_scores else None
+        prices = self.extra_prices
+
+        best = None
+        best_score = None
+
+        def consider(item_ids, score):
+            nonlocal best, best_score
+            if best_score is None or score > best_score:
+                best, best_score = item_ids, score
+
+        for shoe_id in self.shoe_ids:
+            base = self.price(shoe_id)
+            if base > high:
+                continue
+            shoe_score = self._score(shoe_id, keep, used_shoes)
+
+            if low <= base:
+                consider([shoe_id], shoe_score)
+            if not best_extra:
+                continue
+
+            # One extra: any extra priced in [low - base, high - base]
+            start = bisect_left(prices, low - base)
+            stop = bisect_right(prices, high - base)
+            index = best_extra.best(start, stop)
+            if index is not None:
+                consider([shoe_id, self.extra_ids[index]], shoe_score + extra_scores[index])
+
+            # Two extras: for each first extra, the best partner later in price order
+            for first in range(bisect_right(prices, high - base)):
+                remaining = base + prices[first]
+                start = max(first + 1, bisect_left(prices, low - remaining))
+                stop = bisect_right(prices, high - remaining)
+                index = best_extra.best(start, stop)
+                if index is not None:
+                    consider([shoe_id, self.extra_ids[first], self.extra_ids[index]],
+                             shoe_score + extra_scores[first] + extra_scores[index])
+
+        return best
+
+    def _enriched(self, bundle, item_ids, bundle_type, slot, source):
+        """Record a bundle in a slot, in the shape create_bundles returns"""
+        model_ids = set(self._item_ids(bundle))
+        items = []
+        for item_id in item_ids:
+            reason = self.reasons.get(item_id, '')
+            if item_id not in model_ids:
+                reason = reason or 'Added to fit the price range'
+            items.append({
+                'product': self.products[item_id],
+                'category': self.categories.get(item_id) or CATEGORY_NAMES.get(item_id[0], 'unknown'),
+                'reason': reason
+            })
+
+        if bundle_type == 'premium':
+            default_name = 'Premium Bundle'
+        else:
+            default_name = f"Within Budget Bundle {slot + 1}"
+
+        floor_score = min(self.scores) if self.scores else 5
+        # The model's name, score and note describe its own items - a changed bundle gets neutral ones
+        if model_ids and model_ids == set(item_ids):
+            bundle_name = bundle.get('bundle_name', default_name)
+            match_score = bundle['match_score'] if _match_score(bundle.get('match_score')) is not None else floor_score
+            styling_note = bundle.get('styling_note', '')
+        else:
+            bundle_name, match_score, styling_note = default_name, floor_score, ''
+
+        self.filled_ids[slot] = item_ids
+        self.sources[slot] = bundle
+        self.filled[slot] = {
+            'bundle_name': bundle_name,
+            'bundle_type': bundle_type,
+            'match_score': match_score,
+            'total_cost': round(sum(self.price(item_id) for item_id in item_ids), 2),
+            'items': items,
+            'styling_note': styling_note,
+            'source': source
+        }
+        return self.filled[slot]
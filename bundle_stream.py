@@ -0,0 +1,80 @@
+"""
+Bundle Stream - Incremental parsing of the bundle JSON array while Claude writes it
+"""
+import json
+
+
+class BundleStreamParser:
+    """
+    Extract the objects of a top-level JSON array from text that arrives in chunks.
+
+    feed() returns every object that was closed by the new text, so each bundle
+    can be used as soon as the model finishes writing it instead of after the
+    whole reply. Text before the array (preamble) is ignored; a '[' only opens
+    the array when the next non-whitespace character is '{', so brackets in
+    the preamble ("Here [are] the bundles:") are skipped.
+    """
+
+    def __init__(self):
+        self._started = False
+        # A '[' was seen in the preamble and may open the array
+        self._bracket = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._buffer = []
+
+    @property
+    def finished(self):
+        """True once the closing ']' of the array has been seen"""
+        return self._finished
+
+    def feed(self, text):
+        """Consume a chunk of text and return the list of newly completed objects"""
+        objects = []
+        for ch in text:
+            if self._finished:
+                break
+
+            if not self._started:
+                if self._bracket and ch == '{':
+                    self._started = True
+                    self._depth = 1
+                    self._buffer = [ch]
+                elif ch == '[':
+                    self._bracket = True
+                elif not ch.isspace():
+                    self._bracket = False
+                continue
+
+            if self._depth == 0:
+                # Between array elements - only an object start or the array end matter
+                if ch == '{':
+                    self._depth = 1
+                    self._buffer = [ch]
+                elif ch == ']':
+                    self._finished = True
+                continue
+
+            self._buffer.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        objects.append(json.loads(''.join(self._buffer)))
+                    except ValueError as e:
+                        print(f"Skipping malformed bundle in stream: {e}")
+                    self._buffer = []
+        return objects
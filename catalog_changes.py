@@ -0,0 +1,229 @@
+"""
+Catalog Changes - Apply DynamoDB Streams style change records to the catalog cache
+
+Records have the DynamoDB Streams shape (the stream must use the NEW_IMAGE or
+NEW_AND_OLD_IMAGES view type so upserts carry the item):
+
+    {"eventName": "MODIFY",
+     "dynamodb": {"Keys": {"product_id": {"S": "123"}},
+                  "NewImage": {"product_id": {"S": "123"}, "price": {"S": "$89.99"}, ...}}}
+
+INSERT and MODIFY upsert the NewImage, REMOVE deletes the key. Two local
+stand-in feeds are included: FileChangeFeed tails a JSON-lines file of records
+(or of Lambda stream events, {"Records": [...]}), QueueChangeFeed is an
+in-process queue that tests and tools can put records on.
+
+Usage:
+    python catalog_changes.py emit changes.jsonl MODIFY 123 --product-name 'Stessy Pump' \
+        --product-type FOOTWEAR --price '$89.99'     # upserts replace the whole item
+    python catalog_changes.py emit changes.jsonl REMOVE 123
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+from product_catalog import CATALOG_FIELDS, CATALOG_KEY
+
+# JSON-lines file to follow as a change feed; empty disables it
+CATALOG_CHANGE_FEED = os.environ.get('CATALOG_CHANGE_FEED', '')
+
+# How often the feed is polled, and the most records applied as one batch
+CATALOG_CHANGE_POLL_SECONDS = float(os.environ.get('CATALOG_CHANGE_POLL_SECONDS', '1'))
+CATALOG_CHANGE_BATCH_SIZE = int(os.environ.get('CATALOG_CHANGE_BATCH_SIZE', '1000'))
+
+_deserializer = None
+
+
+def _deserialize(value):
+    global _deserializer
+    if _deserializer is None:
+        from boto3.dynamodb.types import TypeDeserializer
+        _deserializer = TypeDeserializer()
+    return _deserializer.deserialize(value)
+
+
+def parse_record(record, key=CATALOG_KEY):
+    """(key, item) for INSERT/MODIFY, (key, None) for REMOVE; None if the record cannot be applied"""
+    event_name = record.get('eventName')
+    data = record.get('dynamodb', {})
+    keys = data.get('Keys', {})
+    if key not in keys:
+        print(f"Skipping change record without {key}: {record.get('eventID')}")
+        return None
+    # Records hold keys as text, whatever the attribute type
+    product_key = str(_deserialize(keys[key]))
+
+    if event_name == 'REMOVE':
+        return product_key, None
+    if event_name not in ('INSERT', 'MODIFY'):
+        print(f"Skipping change record with event {event_name}")
+        return None
+
+    image = data.get('NewImage')
+    if image is None:
+        print(f"Skipping {event_name} of {product_key}: the stream does not include new images")
+        return None
+    return product_key, {field: _deserialize(image[field]) for field in CATALOG_FIELDS if field in image}
+
+
+def stream_record(event_name, item, key=CATALOG_KEY):
+    """A DynamoDB Streams record for a plain item (strings and numbers), for the stand-in feeds"""
+    def typed(value):
+        return {'N': str(value)} if isinstance(value, (int, float)) and not isinstance(value, bool) else {'S': str(value)}
+
+    data = {'Keys': {key: typed(item[key])}}
+    if event_name != 'REMOVE':
+        data['NewImage'] = {field: typed(value) for field, value in item.items()}
+    return {'eventName': event_name, 'eventSource': 'aws:dynamodb', 'dynamodb': data}
+
+
+def apply_stream_event(cache, event):
+    """Apply a Lambda DynamoDB stream event ({"Records": [...]}); returns the number of changes"""
+    changes = [change for change in map(parse_record, event.get('Records', [])) if change is not None]
+    cache.apply_changes(changes)
+    return len(changes)
+
+
+class FileChangeFeed:
+    """Stream records appended to a JSON-lines file, read from where the last poll stopped"""
+
+    def __init__(self, path, from_start=False):
+        self.path = path
+        # Start at the end: the first load already reflects earlier changes
+        self._offset = 0 if from_start or not os.path.exists(path) else os.path.getsize(path)
+
+    def poll(self, max_records=CATALOG_CHANGE_BATCH_SIZE, timeout=None):
+        """Records written since the last poll; only complete lines are consumed"""
+        if not os.path.exists(self.path):
+            return []
+        if os.path.getsize(self.path) < self._offset:
+            # Truncated or replaced - follow the new file from its start
+            self._offset = 0
+
+        records = []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            while len(records) < max_records:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                self._offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    value = json.loads(line)
+                except ValueError as e:
+                    print(f"Skipping malformed change record in {self.path}: {e}")
+                    continue
+                records.extend(value.get('Records', [value]) if isinstance(value, dict) else [])
+        return records
+
+
+class QueueChangeFeed:
+    """In-process queue of stream records"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, record):
+        self._queue.put(record)
+
+    def poll(self, max_records=CATALOG_CHANGE_BATCH_SIZE, timeout=None):
+        """Waits up to timeout for the first record, then takes whatever else is queued"""
+        try:
+            records = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(records) < max_records:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+
+class ChangeFeedConsumer:
+    """
+    Background thread that polls a feed and applies each batch to a CatalogCache.
+
+    Each applied batch keeps a fresh snapshot fresh. Empty polls do not, so a
+    feed that stops delivering records falls back to the cache's TTL rescan.
+    """
+
+    def __init__(self, cache, feed, interval=CATALOG_CHANGE_POLL_SECONDS):
+        self.cache = cache
+        self.feed = feed
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._counters = {'polls': 0, 'records': 0, 'skipped': 0, 'errors': 0}
+        self._last_poll_at = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='catalog-changes', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def poll_once(self, timeout=None):
+        """Poll the feed once and apply what it returned; returns the number of changes"""
+        records = self.feed.poll(timeout=timeout)
+        changes = [change for change in map(parse_record, records) if change is not None]
+        self.cache.apply_changes(changes)
+        with self._lock:
+            self._counters['polls'] += 1
+            self._counters['records'] += len(records)
+            self._counters['skipped'] += len(records) - len(changes)
+            self._last_poll_at = time.time()
+        return len(changes)
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self._counters)
+            last_poll_at = self._last_poll_at
+        counters['last_poll_age_seconds'] = round(time.time() - last_poll_at, 3) if last_poll_at else None
+        return counters
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                # Queue feeds block for up to the interval; file feeds return at once
+                if not self.poll_once(timeout=self.interval) and not isinstance(self.feed, QueueChangeFeed):
+                    self._stop.wait(self.interval)
+            except Exception as e:
+                print(f"Error applying catalog changes: {e}")
+                with self._lock:
+                    self._counters['errors'] += 1
+                self._stop.wait(self.interval)
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Append a change record to a local change feed file')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    emit_parser = subcommands.add_parser('emit', help='Append an INSERT, MODIFY or REMOVE record')
+    emit_parser.add_argument('path', help='Change feed file (JSON lines)')
+    emit_parser.add_argument('event', choices=['INSERT', 'MODIFY', 'REMOVE'])
+    emit_parser.add_argument('key', help=f"{CATALOG_KEY} of the product")
+    for field in CATALOG_FIELDS:
+        if field != CATALOG_KEY:
+            emit_parser.add_argument(f"--{field.replace('_', '-')}", dest=field)
+
+    args = parser.parse_args(argv)
+    item = {CATALOG_KEY: args.key}
+    item.update({field: getattr(args, field) for field in CATALOG_FIELDS
+                 if field != CATALOG_KEY and getattr(args, field) is not None})
+    with open(args.path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(stream_record(args.event, item)) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,334 @@
+"""
+Catalog File - Compact columnar catalog snapshots loaded through a memory map
+
+Layout (little-endian):
+    magic 'ALDOCAT\\0' | header length (uint32) | header JSON | padding to 8 bytes | sections
+
+Sections, at offsets listed in the header:
+    prices          float64 per row
+    field:<name>    uint32 string ID per row for each CATALOG_FIELDS entry (MISSING if absent)
+    string_offsets  uint32 start of every string in string_data, plus the end
+    string_data     UTF-8 bytes of every distinct string
+    search          JSON BM25 statistics (ProductSearchIndex.stats())
+
+Rows are grouped by category in CATEGORIES order and sorted by price inside each
+group, so a category index is just a slice of the price column. Uncategorized
+rows come last. Products are read lazily from the map: worker processes that
+open the same file share its pages instead of each holding dicts.
+
+Usage:
+    python catalog_file.py export catalog.bin          # scan the table and write a file
+    python catalog_file.py inspect catalog.bin         # print the header and check freshness
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections.abc import Sequence
+
+from product_catalog import CATALOG_FIELDS, CATEGORIES, CatalogSnapshot, CategoryIndex
+from product_search import ProductSearchIndex
+
+MAGIC = b'ALDOCAT\x00'
+FORMAT_VERSION = 1
+
+# Empty disables the file; e.g. /opt/catalog.bin from a Lambda layer or /tmp/catalog.bin
+CATALOG_FILE = os.environ.get('CATALOG_FILE', '')
+
+# A file older than this, or whose row count is off from the table's by more
+# than the tolerance, is not used for a cold start
+CATALOG_FILE_MAX_AGE_SECONDS = float(os.environ.get('CATALOG_FILE_MAX_AGE_SECONDS', '86400'))
+CATALOG_FILE_COUNT_TOLERANCE = float(os.environ.get('CATALOG_FILE_COUNT_TOLERANCE', '0.05'))
+
+MISSING = 0xFFFFFFFF
+
+_MISSING_VALUE = object()
+
+
+def _align(offset, alignment=8):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def _little_endian(column):
+    if sys.byteorder != 'little':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def write_catalog_file(snapshot, path, table_name):
+    """Write a snapshot to path atomically (temp file + rename)"""
+    rows = []
+    category_ranges = {}
+    categorized = set()
+    for category in CATEGORIES:
+        products = snapshot.index[category].products
+        category_ranges[category] = [len(rows), len(rows) + len(products)]
+        rows.extend(products)
+        categorized.update(id(product) for product in products)
+    rows.extend(product for product in snapshot.items if id(product) not in categorized)
+
+    string_ids = {}
+    string_offsets = array('I', [0])
+    string_data = bytearray()
+
+    def string_id(value):
+        if value is None:
+            return MISSING
+        value = str(value)
+        sid = string_ids.get(value)
+        if sid is None:
+            sid = string_ids[value] = len(string_ids)
+            string_data.extend(value.encode('utf-8'))
+            string_offsets.append(len(string_data))
+        return sid
+
+    sections = [('prices', _little_endian(array('d', (float(p.get('price_float', 0)) for p in rows))))]
+    for field in CATALOG_FIELDS:
+        sections.append((f"field:{field}", _little_endian(array('I', (string_id(p.get(field)) for p in rows)))))
+    sections.append(('string_offsets', _little_endian(string_offsets)))
+    sections.append(('string_data', bytes(string_data)))
+    sections.append(('search', json.dumps(snapshot.search.stats()).encode('utf-8')))
+
+    offsets = {}
+    position = 0
+    for name, data in sections:
+        position = _align(position)
+        offsets[name] = [position, len(data)]
+        position += len(data)
+
+    header = json.dumps({
+        'format_version': FORMAT_VERSION,
+        'table_name': table_name,
+        'created_at': snapshot.loaded_at,
+        'rows': len(rows),
+        'table_item_count': snapshot.scanned_count,
+        'strings': len(string_ids),
+        'fields': list(CATALOG_FIELDS),
+        'category_ranges': category_ranges,
+        'sections': offsets
+    }).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, data in sections:
+            f.write(b'\x00' * (data_start + offsets[name][0] - f.tell()))
+            f.write(data)
+    # Readers holding the old file keep their map; new readers see the new file
+    os.replace(temp_path, path)
+    return len(rows)
+
+
+class MappedProduct:
+    """Read-only product backed by a row of a CatalogFile, with the dict get() interface"""
+
+    __slots__ = ('_file', '_row')
+
+    def __init__(self, catalog_file, row):
+        self._file = catalog_file
+        self._row = row
+
+    def get(self, key, default=None):
+        if key == 'price_float':
+            return self._file.prices[self._row]
+        column = self._file.columns.get(key)
+        if column is None:
+            return default
+        sid = column[self._row]
+        return default if sid == MISSING else self._file.string(sid)
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING_VALUE)
+        if value is _MISSING_VALUE:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING_VALUE) is not _MISSING_VALUE
+
+    def keys(self):
+        return [key for key in (*self._file.columns, 'price_float') if key in self]
+
+    def to_dict(self):
+        return {key: self.get(key) for key in self.keys()}
+
+    def __eq__(self, other):
+        return isinstance(other, MappedProduct) and self._file is other._file and self._row == other._row
+
+    def __hash__(self):
+        return hash((id(self._file), self._row))
+
+    def __repr__(self):
+        return f"MappedProduct({self.get('product_id')!r}, {self.get('product_name')!r})"
+
+
+class MappedRows(Sequence):
+    """Rows [start, stop) of a CatalogFile as a sequence of MappedProduct"""
+
+    def __init__(self, catalog_file, start, stop):
+        self._file = catalog_file
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [MappedProduct(self._file, self._start + i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return MappedProduct(self._file, self._start + index)
+
+
+class CatalogFile:
+    """A catalog file opened through a read-only memory map"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} is not a catalog file")
+        if sys.byteorder != 'little':
+            raise ValueError('Catalog files can only be mapped on little-endian machines')
+
+        (header_length,) = struct.unpack_from('<I', self._map, len(MAGIC))
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self._map[header_start:header_start + header_length])
+        if self.header.get('format_version') != FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog file version {self.header.get('format_version')}")
+
+        self._base = _align(header_start + header_length)
+        view = memoryview(self._map)
+        sections = self.header['sections']
+
+        def section(name):
+            offset, length = sections[name]
+            return view[self._base + offset:self._base + offset + length]
+
+        self.prices = section('prices').cast('d')
+        self.columns = {field: section(f"field:{field}").cast('I') for field in self.header['fields']}
+        self.string_offsets = section('string_offsets').cast('I')
+        self._strings_start = self._base + sections['string_data'][0]
+        self._search = section('search')
+
+    @property
+    def created_at(self):
+        return self.header['created_at']
+
+    def string(self, sid):
+        start = self._strings_start + self.string_offsets[sid]
+        end = self._strings_start + self.string_offsets[sid + 1]
+        return self._map[start:end].decode('utf-8')
+
+    def rows(self, start=0, stop=None):
+        return MappedRows(self, start, self.header['rows'] if stop is None else stop)
+
+    def snapshot(self):
+        """CatalogSnapshot over this file - no per-product work until products are read"""
+        index = {
+            category: CategoryIndex.presorted(self.rows(start, stop), self.prices[start:stop])
+            for category, (start, stop) in self.header['category_ranges'].items()
+        }
+        search = ProductSearchIndex.from_stats(**json.loads(bytes(self._search)))
+        return CatalogSnapshot.prebuilt(self.rows(), index, search, self.created_at, self.header['table_item_count'])
+
+
+def check_freshness(header, table):
+    """None if a file header is usable for table, else the reason it is not"""
+    if header.get('table_name') != table.name:
+        return f"built for table {header.get('table_name')}, not {table.name}"
+
+    age = time.time() - header['created_at']
+    if age > CATALOG_FILE_MAX_AGE_SECONDS:
+        return f"{age:.0f}s old (max {CATALOG_FILE_MAX_AGE_SECONDS:.0f}s)"
+
+    # DescribeTable's ItemCount is refreshed about every six hours, so only large drifts count
+    try:
+        item_count = table.item_count
+    except Exception as e:
+        print(f"Could not read item count of {table.name}: {e}")
+        return None
+    expected = header['table_item_count']
+    if item_count is not None and abs(item_count - expected) > CATALOG_FILE_COUNT_TOLERANCE * max(item_count, expected, 1):
+        return f"has {expected} items, table has {item_count}"
+    return None
+
+
+def load_fresh_snapshot(path, table):
+    """Snapshot from the catalog file at path if it exists and is fresh for table, else None"""
+    if not os.path.exists(path):
+        return None
+    try:
+        catalog_file = CatalogFile(path)
+    except (OSError, ValueError) as e:
+        print(f"Error opening catalog file {path}: {e}")
+        return None
+
+    reason = check_freshness(catalog_file.header, table)
+    if reason:
+        print(f"Not using catalog file {path}: {reason}")
+        return None
+    return catalog_file.snapshot()
+
+
+def export_in_background(snapshot, path, table_name):
+    """Write a freshly scanned snapshot to path from a daemon thread, if its directory is writable"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.access(directory, os.W_OK):
+        return
+
+    def export():
+        try:
+            write_catalog_file(snapshot, path, table_name)
+        except Exception as e:
+            print(f"Error writing catalog file {path}: {e}")
+
+    threading.Thread(target=export, name='catalog-export', daemon=True).start()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Export or inspect a columnar catalog file')
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    export_parser = subcommands.add_parser('export', help='Scan the product table and write a catalog file')
+    export_parser.add_argument('path', help='Output file')
+    inspect_parser = subcommands.add_parser('inspect', help='Print a catalog file header and check it against the table')
+    inspect_parser.add_argument('path', help='Catalog file')
+    inspect_parser.add_argument('--no-table', action='store_true', help='Do not contact DynamoDB')
+
+    args = parser.parse_args(argv)
+    if args.command == 'export':
+        from outfit_bundle_agent import get_product_table
+        from product_catalog import scan_catalog
+        table = get_product_table()
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot(scan_catalog(table))
+        rows = write_catalog_file(snapshot, args.path, table.name)
+        print(f"Wrote {rows} products to {args.path} ({os.path.getsize(args.path):,} bytes) in {time.perf_counter() - started:.1f}s")
+    else:
+        started = time.perf_counter()
+        catalog_file = CatalogFile(args.path)
+        snapshot = catalog_file.snapshot()
+        load_ms = (time.perf_counter() - started) * 1000
+        header = {key: value for key, value in catalog_file.header.items() if key != 'sections'}
+        print(json.dumps(dict(header, load_ms=round(load_ms, 2), categories={c: len(i) for c, i in snapshot.index.items()}), indent=2))
+        if not args.no_table:
+            from outfit_bundle_agent import get_product_table
+            print(f"Freshness: {check_freshness(catalog_file.header, get_product_table()) or 'ok'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Description Cache - Content-addressed cache for outfit descriptions
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Memory tier is bounded by the total size of the cached descriptions
+DESCRIPTION_CACHE_MAX_BYTES = int(os.environ.get('DESCRIPTION_CACHE_MAX_BYTES', str(4 * 1024 * 1024)))
+
+# Optional disk tier, off by default. Set to a directory only this function writes to
+# (e.g. /tmp/outfit-descriptions) to keep descriptions across warm Lambda invocations
+DESCRIPTION_CACHE_DIR = os.environ.get('DESCRIPTION_CACHE_DIR', '')
+
+# Disk tier cap - /tmp is small on Lambda and shared with the catalog file export.
+# Past the cap the least recently used files are deleted down to 3/4 of it
+DESCRIPTION_CACHE_DISK_MAX_BYTES = int(os.environ.get('DESCRIPTION_CACHE_DISK_MAX_BYTES', str(16 * 1024 * 1024)))
+
+
+def description_key(image_data, model_id, prompt_version):
+    """Cache key for an image: hash of its bytes plus the model and prompt that describe it"""
+    image_digest = hashlib.sha256(image_data).hexdigest()
+    return hashlib.sha256(f"{model_id}|{prompt_version}|{image_digest}".encode('utf-8')).hexdigest()
+
+
+class DescriptionCache:
+    """Two-tier (in-memory LRU + optional, size-capped /tmp files) cache of outfit descriptions"""
+
+    def __init__(self, max_bytes=DESCRIPTION_CACHE_MAX_BYTES, directory=DESCRIPTION_CACHE_DIR,
+                 disk_max_bytes=DESCRIPTION_CACHE_DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        # Bytes in the disk tier, counted when the first file is written
+        self._disk_size = None
+        self._disk_lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def get(self, key):
+        """Return the cached description for key, or None"""
+        with self._lock:
+            description = self._entries.get(key)
+            if description is not None:
+                self._entries.move_to_end(key)
+                self._memory_hits += 1
+                return description
+
+        description = self._read_disk(key)
+        with self._lock:
+            if description is None:
+                self._misses += 1
+                return None
+            self._disk_hits += 1
+            self._store(key, description)
+        return description
+
+    def put(self, key, description):
+        """Cache a description in memory and, if enabled, on disk"""
+        with self._lock:
+            self._store(key, description)
+        self._write_disk(key, description)
+
+    def clear(self):
+        """Drop the in-memory tier (the disk tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """Hit/miss counters and memory usage"""
+        with self._lock:
+            return {
+                'memory_hits': self._memory_hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+                'disk_bytes': self._disk_size,
+                'disk_max_bytes': self.disk_max_bytes
+            }
+
+    def _store(self, key, description):
+        # Caller holds self._lock
+        size = len(description.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous.encode('utf-8'))
+        self._entries[key] = description
+        self._size += size
+
+        # Evict least recently used entries until we fit
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted.encode('utf-8'))
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.txt")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                description = f.read()
+        except OSError:
+            return None
+        try:
+            # Pruning goes by mtime, so a hit keeps the file
+            os.utime(self._path(key))
+        except OSError:
+            pass
+        return description
+
+    def _write_disk(self, key, description):
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Write then rename so concurrent readers never see a partial file
+            temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(description)
+            os.replace(temp_path, self._path(key))
+            self._prune_disk(len(description.encode('utf-8')))
+        except OSError as e:
+            print(f"Error writing description cache: {e}")
+
+    def _disk_files(self):
+        """(mtime, size, path) of every cached description file"""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.txt'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _prune_disk(self, written):
+        """Delete the least recently used files once the disk tier passes disk_max_bytes"""
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = sum(size for _, size, _ in self._disk_files())
+            else:
+                # Approximate between prunes (overwrites count twice); recounted below
+                self._disk_size += written
+            if self._disk_size <= self.disk_max_bytes:
+                return
+
+            files = sorted(self._disk_files())
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.disk_max_bytes * 3 // 4:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._disk_size = total
+
+
+# Process-wide cache shared by all agents
+description_cache = DescriptionCache()
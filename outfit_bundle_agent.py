@@ -1,436 +1,993 @@
-"""
-Outfit Bundle Agent - Suggests complete bundles of shoes and accessories for outfits
-"""
-import boto3
-import json
-import base64
-import sys
-import os
-
-class OutfitBundleAgent:
-    def __init__(self, budget=200, age=None, gender=None, occasion=None, season=None):
-        self.s3 = boto3.client('s3', region_name='us-east-1')
-        self.bedrock = boto3.client('bedrock-runtime', region_name='us-east-1')
-        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        self.table = self.dynamodb.Table('aldo-product-metadata')
-        self.bucket_name = 'aldo-images'
-        self.budget = budget
-        self.age = age
-        self.gender = gender
-        self.occasion = occasion
-        self.season = season
-        
-    def analyze_outfit(self, image_path):
-        """Analyze the outfit image and get description"""
-        
-        with open(image_path, 'rb') as f:
-            image_bytes = base64.b64encode(f.read()).decode('utf-8')
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": image_bytes
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": "Describe this outfit in detail, focusing on colors, style, and formality. What type of shoes and accessories would complement this outfit best?"
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        response = self.bedrock.invoke_model(
-            modelId='us.anthropic.claude-3-5-sonnet-20241022-v2:0',
-            body=json.dumps(request_body)
-        )
-        
-        response_body = json.loads(response['body'].read())
-        outfit_description = response_body['content'][0]['text']
-        
-        return outfit_description
-    
-    def get_products_from_dynamodb(self, limit=30):
-        """Get products from DynamoDB within budget + premium range, separated by type (optimized)"""
-        premium_budget = self.budget + 75  # Increased from 50 to 75
-        
-        try:
-            # Limit scan to reduce time - only get what we need
-            response = self.table.scan(Limit=300)  # Increased to get more variety
-            items = response.get('Items', [])
-            
-            # Separate products by type and filter by premium budget
-            shoes = []
-            handbags = []
-            jewelry = []
-            clothing = []
-            other_accessories = []
-            
-            for item in items:
-                price_str = str(item.get('price', '0'))
-                price = float(price_str.replace('$', '').replace(',', ''))
-                item['price_float'] = price
-                
-                # Include items up to premium budget
-                if price > premium_budget:
-                    continue
-                
-                product_type = item.get('product_type', '').upper()
-                product_name = item.get('product_name', '').lower()
-                description = item.get('description', '').lower()
-                
-                # Categorize products
-                if product_type == 'FOOTWEAR' and len(shoes) < limit:
-                    shoes.append(item)
-                    
-                elif len(handbags) < limit and (product_type in ['BAG', 'HANDBAG', 'HANDBAGS'] or
-                      'bag' in product_name or 'handbag' in product_name or 
-                      'tote' in product_name or 'purse' in product_name or
-                      'clutch' in product_name or 'crossbody' in product_name):
-                    handbags.append(item)
-                    
-                elif len(jewelry) < limit and (product_type in ['JEWELRY', 'JEWELLERY'] or
-                      'necklace' in product_name or 'earring' in product_name or
-                      'bracelet' in product_name or 'ring' in product_name or
-                      'jewelry' in product_name or 'jewellery' in product_name):
-                    jewelry.append(item)
-                    
-                elif len(clothing) < limit and product_type in ['CLOTHING', 'APPAREL', 'TOP', 'BOTTOM', 'DRESS']:
-                    clothing.append(item)
-                    
-                elif len(other_accessories) < limit and (product_type in ['ACCESSORIES', 'ACCESSORY'] or
-                      'scarf' in product_name or 'hat' in product_name or
-                      'belt' in product_name or 'sunglasses' in product_name or
-                      'wallet' in product_name):
-                    other_accessories.append(item)
-                
-                # Stop early if we have enough of each
-                if (len(shoes) >= limit and len(handbags) >= limit and 
-                    len(jewelry) >= limit and len(clothing) >= limit and 
-                    len(other_accessories) >= limit):
-                    break
-            
-            return shoes, handbags, jewelry, clothing, other_accessories
-            
-        except Exception as e:
-            print(f"Error fetching from DynamoDB: {e}")
-            return [], [], [], [], []
-    
-    def create_bundles(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories):
-        """Create outfit bundles using Claude"""
-        
-        # Prepare product descriptions - limit to 15 each for faster processing
-        shoes_text = "\n".join([
-            f"S{i+1}. {s.get('product_name')} (${s.get('price_float', 0):.2f}) - {s.get('description', 'No description')}"
-            for i, s in enumerate(shoes[:15])
-        ])
-        
-        handbags_text = "\n".join([
-            f"H{i+1}. {h.get('product_name')} (${h.get('price_float', 0):.2f}) - {h.get('description', 'No description')}"
-            for i, h in enumerate(handbags[:15])
-        ])
-        
-        jewelry_text = "\n".join([
-            f"J{i+1}. {j.get('product_name')} (${j.get('price_float', 0):.2f}) - {j.get('description', 'No description')}"
-            for i, j in enumerate(jewelry[:15])
-        ]) if jewelry else "No jewelry available"
-        
-        clothing_text = "\n".join([
-            f"C{i+1}. {c.get('product_name')} (${c.get('price_float', 0):.2f}) - {c.get('description', 'No description')}"
-            for i, c in enumerate(clothing[:15])
-        ]) if clothing else "No clothing available"
-        
-        accessories_text = "\n".join([
-            f"A{i+1}. {a.get('product_name')} (${a.get('price_float', 0):.2f}) - {a.get('description', 'No description')}"
-            for i, a in enumerate(other_accessories[:15])
-        ]) if other_accessories else "No other accessories available"
-        
-        request_body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 2000,  # Reduced from 4000 for faster response
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"""I need to match shoes and handbags with these outfits:
-
-{outfit_description}
-
-CONTEXT:
-Age: {self.age if self.age else 'Not specified'}
-Gender: {self.gender if self.gender else 'Not specified'}
-Occasion: {self.occasion if self.occasion else 'Not specified'}
-Season: {self.season if self.season else 'Not specified'}
-
-AVAILABLE PRODUCTS:
-
-SHOES:
-{shoes_text}
-
-HANDBAGS:
-{handbags_text}
-
-JEWELRY:
-{jewelry_text}
-
-CLOTHING:
-{clothing_text}
-
-OTHER ACCESSORIES:
-{accessories_text}
-
-Create EXACTLY 3 bundles that work well with ALL the outfits described above, considering the age, gender, occasion, and season:
-- Bundle 1: Within budget (under ${self.budget}) - can have 1-3 items
-- Bundle 2: Within budget (under ${self.budget}) - can have 1-3 items  
-- Bundle 3: Premium upgrade (${self.budget + 50} to ${self.budget + 75}) - can have 1-3 items
-
-Each bundle MUST have:
-- 1 pair of shoes (REQUIRED - always include)
-- 0-2 additional items from: handbags, jewelry, clothing, or other accessories (OPTIONAL)
-- Match score (1-10) for how well the bundle complements ALL the outfits and context
-- Brief styling note explaining how it works with all outfits and the occasion/season
-
-CRITICAL REQUIREMENTS: 
-- Bundle 1 and Bundle 2 MUST stay UNDER ${self.budget}
-- Bundle 3 MUST be between ${self.budget + 50} and ${self.budget + 75} (exactly $50-75 above budget)
-- You MUST return exactly 3 bundles, no more, no less
-- If you cannot create a bundle in the premium range, add more expensive items to reach the target price range
-
-Respond with a JSON array:
-[{{
-  "bundle_name": "Bundle name",
-  "bundle_type": "budget/mid-range/premium",
-  "match_score": 9,
-  "total_cost": 150.50,
-  "items": [
-    {{"id": "S1", "category": "shoes", "reason": "why it works"}},
-    {{"id": "H1", "category": "handbag", "reason": "why it works"}}
-  ],
-  "styling_note": "How to wear this bundle"
-}}]"""
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        try:
-            bedrock_response = self.bedrock.invoke_model(
-                modelId='us.anthropic.claude-3-5-sonnet-20241022-v2:0',
-                body=json.dumps(request_body)
-            )
-            
-            response_body = json.loads(bedrock_response['body'].read())
-            analysis_text = response_body['content'][0]['text']
-            
-            # Extract JSON from response
-            start = analysis_text.find('[')
-            end = analysis_text.rfind(']') + 1
-            json_str = analysis_text[start:end]
-            bundles = json.loads(json_str)
-            
-            # Map IDs back to actual products
-            product_maps = {
-                'S': {f"S{i+1}": s for i, s in enumerate(shoes[:20])},
-                'H': {f"H{i+1}": h for i, h in enumerate(handbags[:20])},
-                'J': {f"J{i+1}": j for i, j in enumerate(jewelry[:20])},
-                'C': {f"C{i+1}": c for i, c in enumerate(clothing[:20])},
-                'A': {f"A{i+1}": a for i, a in enumerate(other_accessories[:20])}
-            }
-            
-            enriched_bundles = []
-            within_budget_count = 0
-            premium_count = 0
-            
-            for bundle in bundles:
-                items_list = bundle.get('items', [])
-                
-                if not items_list:
-                    continue
-                
-                enriched_items = []
-                total_cost = 0
-                
-                for item in items_list:
-                    item_id = item.get('id', '')
-                    if not item_id:
-                        continue
-                    
-                    # Get the product from the appropriate map
-                    prefix = item_id[0]
-                    product = product_maps.get(prefix, {}).get(item_id, {})
-                    
-                    if product:
-                        enriched_items.append({
-                            'product': product,
-                            'category': item.get('category', 'unknown'),
-                            'reason': item.get('reason', '')
-                        })
-                        total_cost += product.get('price_float', 0)
-                
-                if len(enriched_items) >= 1:  # At least one item (shoes)
-                    # Validate budget constraints
-                    bundle_cost = bundle.get('total_cost', total_cost)
-                    bundle_type = bundle.get('bundle_type', 'standard')
-                    
-                    # Check if this bundle fits our requirements
-                    if bundle_cost < self.budget and within_budget_count < 2:
-                        within_budget_count += 1
-                        enriched_bundles.append({
-                            'bundle_name': bundle.get('bundle_name', f'Within Budget Bundle {within_budget_count}'),
-                            'bundle_type': 'within_budget',
-                            'match_score': bundle.get('match_score', 0),
-                            'total_cost': bundle_cost,
-                            'items': enriched_items,
-                            'styling_note': bundle.get('styling_note', '')
-                        })
-                    elif (bundle_cost >= self.budget + 50 and bundle_cost <= self.budget + 75 and premium_count < 1):
-                        premium_count += 1
-                        enriched_bundles.append({
-                            'bundle_name': bundle.get('bundle_name', 'Premium Bundle'),
-                            'bundle_type': 'premium',
-                            'match_score': bundle.get('match_score', 0),
-                            'total_cost': bundle_cost,
-                            'items': enriched_items,
-                            'styling_note': bundle.get('styling_note', '')
-                        })
-            
-            # Ensure we have exactly 3 bundles with correct distribution
-            if len(enriched_bundles) != 3 or within_budget_count != 2 or premium_count != 1:
-                print(f"Warning: Bundle distribution not optimal. Got {within_budget_count} within budget, {premium_count} premium")
-            
-            return enriched_bundles[:3]  # Ensure exactly 3 bundles
-            
-        except Exception as e:
-            print(f"Error creating bundles: {e}")
-            import traceback
-            traceback.print_exc()
-            return []
-    
-    def display_bundles(self, bundles, outfit_names):
-        """Display the bundles in JSON format"""
-        output = {
-            "outfits": outfit_names if isinstance(outfit_names, list) else [outfit_names],
-            "context": {
-                "age": self.age,
-                "gender": self.gender,
-                "occasion": self.occasion,
-                "season": self.season,
-                "budget": self.budget
-            },
-            "bundles": []
-        }
-        
-        for i, bundle in enumerate(bundles, 1):
-            items_data = []
-            
-            for item in bundle['items']:
-                product = item['product']
-                items_data.append({
-                    "category": item['category'],
-                    "product_name": product.get('product_name'),
-                    "price": product.get('price_float', 0),
-                    "product_id": product.get('product_id'),
-                    "product_url": product.get('product_url'),
-                    "image_url": product.get('original_image_url'),
-                    "reason": item['reason']
-                })
-            
-            bundle_data = {
-                "bundle_number": i,
-                "bundle_name": bundle['bundle_name'],
-                "bundle_type": bundle.get('bundle_type', 'standard'),
-                "match_score": bundle['match_score'],
-                "total_cost": bundle['total_cost'],
-                "items": items_data,
-                "styling_note": bundle['styling_note']
-            }
-            
-            output["bundles"].append(bundle_data)
-        
-        print(json.dumps(output, indent=2))
-        
-
-    
-    def run(self, outfit_images):
-        """Main agent execution for multiple outfit images"""
-        try:
-            # Get products once
-            shoes, handbags, jewelry, clothing, other_accessories = self.get_products_from_dynamodb()
-            
-            if not shoes:
-                return {}
-            
-            # Step 1: Analyze all outfits
-            outfit_descriptions = []
-            valid_images = []
-            for outfit_image in outfit_images:
-                if not os.path.exists(outfit_image):
-                    continue
-                outfit_description = self.analyze_outfit(outfit_image)
-                outfit_descriptions.append(outfit_description)
-                valid_images.append(os.path.basename(outfit_image))
-            
-            if not outfit_descriptions:
-                return {}
-            
-            # Step 2: Combine all outfit descriptions
-            combined_description = "\n\n".join([
-                f"OUTFIT {i+1} ({valid_images[i]}):\n{desc}"
-                for i, desc in enumerate(outfit_descriptions)
-            ])
-            
-            # Step 3: Create bundles that work for all outfits
-            bundles = self.create_bundles(combined_description, shoes, handbags, jewelry, clothing, other_accessories)
-            
-            # Step 4: Display results
-            self.display_bundles(bundles, valid_images)
-            
-            return bundles
-            
-        except Exception as e:
-            import traceback
-            traceback.print_exc()
-            return {}
-
-
-def main():
-    if len(sys.argv) < 2:
-        sys.exit(1)
-    
-    # Parse command line arguments
-    import argparse
-    parser = argparse.ArgumentParser(description='Outfit Bundle Agent')
-    parser.add_argument('images', nargs='+', help='Outfit image paths')
-    parser.add_argument('--budget', type=int, default=200, help='Budget in dollars (default: 200)')
-    parser.add_argument('--age', type=str, help='Age or age range (e.g., "25" or "20-30")')
-    parser.add_argument('--gender', type=str, help='Gender (e.g., "female", "male", "unisex")')
-    parser.add_argument('--occasion', type=str, help='Occasion (e.g., "wedding", "birthday", "casual")')
-    parser.add_argument('--season', type=str, help='Season (e.g., "summer", "winter", "spring", "fall")')
-    
-    args = parser.parse_args()
-    
-    agent = OutfitBundleAgent(
-        budget=args.budget,
-        age=args.age,
-        gender=args.gender,
-        occasion=args.occasion,
-        season=args.season
-    )
-    agent.run(args.images)
-
-
-if __name__ == "__main__":
-    main()
+"""
+Outfit Bundle Agent - Suggests complete bundles of shoes and accessories for outfits
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+
+from bedrock_gate import BedrockGateError, bedrock_gate
+from bundle_solver import BundleSolver
+from bundle_stream import BundleStreamParser
+from description_cache import description_cache, description_key
+from outfit_images import OutfitImage, preprocess_image, preprocess_signature
+from product_catalog import CATEGORIES, catalog_stats, get_catalog_cache
+from request_metrics import RequestMetrics
+
+MODEL_ID = 'us.anthropic.claude-3-5-sonnet-20241022-v2:0'
+
+AWS_REGION = 'us-east-1'
+PRODUCT_TABLE = 'aldo-product-metadata'
+
+# Connection pool per client - analysis, bundling and catalog scan threads share them
+BEDROCK_MAX_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_CONNECTIONS', '50'))
+DYNAMODB_MAX_CONNECTIONS = int(os.environ.get('DYNAMODB_MAX_CONNECTIONS', '16'))
+
+OUTFIT_PROMPT = "Describe this outfit in detail, focusing on colors, style, and formality. What type of shoes and accessories would complement this outfit best?"
+# Bump whenever OUTFIT_PROMPT changes so cached descriptions are not reused
+OUTFIT_PROMPT_VERSION = 1
+
+# All outfits in one vision call (multi_image pipeline); the images are labelled OUTFIT 1..n
+MULTI_OUTFIT_PROMPT = """Each image above is one outfit, labelled OUTFIT 1 to OUTFIT {count}. Describe every outfit in detail, focusing on colors, style, and formality, and say what type of shoes and accessories would complement it best.
+
+Respond with a JSON array only, one entry per outfit in order:
+[{{"outfit": 1, "description": "..."}}]"""
+MULTI_OUTFIT_PROMPT_VERSION = 1
+
+# How a request turns outfit images into bundles:
+#   two_stage    one vision call per outfit, then one bundling call over the descriptions
+#   multi_image  one vision call for all outfits, then the bundling call
+#   fused        a single call that sees the outfit images and the catalog and returns the bundles
+PIPELINE_MODES = ('two_stage', 'multi_image', 'fused')
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'two_stage')
+
+# Spans of the Bedrock round trips, for pipeline_report
+MODEL_CALL_SPANS = ('vision_call', 'bundling_call', 'fused_call')
+
+# Candidates sampled per category, and how many of them make it into the prompt
+CANDIDATE_POOL_SIZE = int(os.environ.get('CANDIDATE_POOL_SIZE', '60'))
+PROMPT_TOP_K = int(os.environ.get('PROMPT_TOP_K', '10'))
+
+# Max outfit images analyzed in parallel per request
+ANALYZE_CONCURRENCY = int(os.environ.get('ANALYZE_CONCURRENCY', '4'))
+
+# Time budget of one request; image analysis must leave the bundling call its reserve
+REQUEST_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_TIMEOUT_SECONDS', '25'))
+BUNDLING_RESERVE_SECONDS = float(os.environ.get('BUNDLING_RESERVE_SECONDS', '8'))
+
+# Prompt caching of the catalog block (needs a model with Bedrock prompt caching support)
+PROMPT_CACHING = os.environ.get('PROMPT_CACHING', '0') == '1'
+CACHED_CATALOG_SIZE = int(os.environ.get('CACHED_CATALOG_SIZE', '30'))
+
+# (ID prefix, prompt heading, text when empty) per category, in CATEGORIES order
+PRODUCT_SECTIONS = (
+    ('S', 'SHOES', 'No shoes available'),
+    ('H', 'HANDBAGS', 'No handbags available'),
+    ('J', 'JEWELRY', 'No jewelry available'),
+    ('C', 'CLOTHING', 'No clothing available'),
+    ('A', 'OTHER ACCESSORIES', 'No other accessories available')
+)
+
+BUNDLE_FORMAT = """Each bundle MUST have:
+- 1 pair of shoes (REQUIRED - always include)
+- 0-2 additional items from: handbags, jewelry, clothing, or other accessories (OPTIONAL)
+- Match score (1-10) for how well the bundle complements ALL the outfits and context
+- Brief styling note explaining how it works with all outfits and the occasion/season
+
+Respond with a JSON array:
+[{
+  "bundle_name": "Bundle name",
+  "bundle_type": "budget/mid-range/premium",
+  "match_score": 9,
+  "total_cost": 150.50,
+  "items": [
+    {"id": "S1", "category": "shoes", "reason": "why it works"},
+    {"id": "H1", "category": "handbag", "reason": "why it works"}
+  ],
+  "styling_note": "How to wear this bundle"
+}]"""
+
+
+def format_catalog(shoes, handbags, jewelry, clothing, other_accessories):
+    """AVAILABLE PRODUCTS block of the bundling prompt, with S1/H1/... IDs"""
+    sections = []
+    for (prefix, label, empty_text), products in zip(PRODUCT_SECTIONS, (shoes, handbags, jewelry, clothing, other_accessories)):
+        products_text = "\n".join([
+            f"{prefix}{i+1}. {p.get('product_name')} (${p.get('price_float', 0):.2f}) - {p.get('description', 'No description')}"
+            for i, p in enumerate(products)
+        ]) if products else empty_text
+        sections.append(f"{label}:\n{products_text}")
+    
+    return "AVAILABLE PRODUCTS:\n\n" + "\n\n".join(sections) + "\n\n" + BUNDLE_FORMAT
+
+
+_catalog_prefixes = {}
+_catalog_prefixes_lock = threading.Lock()
+
+
+def cached_catalog_prefix(snapshot, size=CACHED_CATALOG_SIZE):
+    """
+    Snapshot-wide catalog prompt text and its product lists, built once per snapshot.
+    Byte-identical across requests, which is what lets Bedrock cache it.
+    """
+    key = (snapshot.version, size)
+    with _catalog_prefixes_lock:
+        prefix = _catalog_prefixes.get(key)
+        if prefix is None:
+            product_lists = [snapshot.index[category].sample(None, None, size) for category in CATEGORIES]
+            prefix = (format_catalog(*product_lists), product_lists)
+            # Only the current snapshot's prefix is worth keeping
+            _catalog_prefixes.clear()
+            _catalog_prefixes[key] = prefix
+        return prefix
+
+
+# Long-lived AWS clients, created on first use and shared by every agent in the process
+_clients = {}
+_clients_lock = threading.Lock()
+
+# Milliseconds spent on one-time initialization steps (see init_report)
+_init_timings = {}
+
+
+def _timed(name, build):
+    started = time.perf_counter()
+    value = build()
+    _init_timings[name] = round((time.perf_counter() - started) * 1000, 1)
+    return value
+
+
+def _shared_client(name, build):
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = _timed(f"{name}_ms", build)
+    return client
+
+
+def _client_config(max_connections, max_attempts=3):
+    return Config(
+        max_pool_connections=max_connections,
+        tcp_keepalive=True,
+        connect_timeout=5,
+        read_timeout=120,
+        retries={'max_attempts': max_attempts, 'mode': 'standard'}
+    )
+
+
+def get_bedrock_client():
+    """Process-wide Bedrock runtime client"""
+    # max_attempts=1: retries are left to bedrock_gate, which also adapts concurrency to throttling
+    return _shared_client('bedrock_client', lambda: boto3.client(
+        'bedrock-runtime', region_name=AWS_REGION, config=_client_config(BEDROCK_MAX_CONNECTIONS, max_attempts=1)))
+
+
+def get_product_table():
+    """Process-wide DynamoDB Table for the product catalog"""
+    return _shared_client('product_table', lambda: boto3.resource(
+        'dynamodb', region_name=AWS_REGION, config=_client_config(DYNAMODB_MAX_CONNECTIONS)).Table(PRODUCT_TABLE))
+
+
+def init_report():
+    """Where cold-start time went: module import and one-time client/catalog setup, in ms"""
+    report = dict(_init_timings)
+    for table_name, stats in catalog_stats().items():
+        if stats.get('first_load_seconds') is not None:
+            report[f"catalog_load_ms:{table_name}"] = round(stats['first_load_seconds'] * 1000, 1)
+    return report
+
+
+class OutfitBundleAgent:
+    def __init__(self, budget=200, age=None, gender=None, occasion=None, season=None, bedrock=None, table=None, metrics=None,
+                 deadline=None, pipeline=None):
+        # Clients and the catalog are process-wide; only the settings below are per request.
+        # Pass bedrock/table to use other clients (e.g. local stand-ins)
+        self.bedrock = bedrock or get_bedrock_client()
+        self.table = table or get_product_table()
+        self.catalog = get_catalog_cache(self.table)
+        self.budget = budget
+        self.age = age
+        self.gender = gender
+        self.occasion = occasion
+        self.season = season
+        self.analysis_stats = {}
+        self.token_usage = {}
+        self._usage_lock = threading.Lock()
+        # Per-stage spans and counters of the request this agent serves
+        self.metrics = metrics or RequestMetrics()
+        # time.monotonic() by which the request must finish (None: REQUEST_TIMEOUT_SECONDS per call)
+        self.deadline = deadline
+        self.bedrock_error = None
+        # One of PIPELINE_MODES
+        self.pipeline = pipeline or PIPELINE_MODE
+        if self.pipeline not in PIPELINE_MODES:
+            raise ValueError(f"Unknown pipeline mode {self.pipeline!r} (one of {', '.join(PIPELINE_MODES)})")
+        self.metrics.set('pipeline', self.pipeline)
+        
+    def analyze_outfit(self, image_path):
+        """Analyze the outfit image file and get description"""
+        return self.analyze_image(OutfitImage.from_path(image_path))
+    
+    def analyze_image(self, image):
+        """Analyze an in-memory OutfitImage and get description"""
+        with self.metrics.span('analyze_image', image=image.name) as span:
+            key = description_key(image.data, MODEL_ID, self._description_version())
+            outfit_description = description_cache.get(key)
+            span['cache_hit'] = outfit_description is not None
+            if outfit_description is None:
+                image, _ = self._preprocess(image)
+                outfit_description = self._describe_image(image)
+                description_cache.put(key, outfit_description)
+        
+        return outfit_description
+    
+    def _preprocess(self, image):
+        """preprocess_image, timed and counted"""
+        with self.metrics.span('preprocess', image=image.name) as span:
+            image, stats = preprocess_image(image)
+            span['resized'] = stats['resized']
+        self.metrics.add('image_original_bytes', stats['original_bytes'])
+        self.metrics.add('image_sent_bytes', stats['sent_bytes'])
+        return image, stats
+    
+    def _call_deadline(self, stage):
+        """Deadline for one Bedrock call; analysis leaves BUNDLING_RESERVE_SECONDS for bundling"""
+        deadline = self.deadline or time.monotonic() + REQUEST_TIMEOUT_SECONDS
+        if stage == 'analysis' and deadline - BUNDLING_RESERVE_SECONDS > time.monotonic():
+            return deadline - BUNDLING_RESERVE_SECONDS
+        return deadline
+    
+    def _description_version(self, together=False):
+        """Prompt version plus preprocessing settings - both change what the model sees"""
+        if together:
+            return f"multi{MULTI_OUTFIT_PROMPT_VERSION}:{preprocess_signature()}"
+        return f"{OUTFIT_PROMPT_VERSION}:{preprocess_signature()}"
+    
+    def _image_block(self, image):
+        """Message content block for an OutfitImage"""
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": image.media_type,
+                "data": image.base64
+            }
+        }
+    
+    def _image_blocks(self, images):
+        """Message content for several outfit images, each preceded by its OUTFIT n label"""
+        content = []
+        for i, image in enumerate(images, 1):
+            content.append({"type": "text", "text": f"OUTFIT {i}:"})
+            content.append(self._image_block(image))
+        return content
+    
+    def _describe_image(self, image):
+        """Ask Claude to describe an outfit image"""
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 1000,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        self._image_block(image),
+                        {
+                            "type": "text",
+                            "text": OUTFIT_PROMPT
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        body = json.dumps(request_body)
+        with self.metrics.span('vision_call', image=image.name):
+            # Descriptions are idempotent, so a slow call may be hedged
+            raw = bedrock_gate.invoke(self.bedrock, MODEL_ID, body, deadline=self._call_deadline('analysis'),
+                                      hedge=True, metrics=self.metrics)
+        self.metrics.add('model_calls', 1)
+        self.metrics.add('vision_request_bytes', len(body))
+        self.metrics.add('vision_response_bytes', len(raw))
+        
+        response_body = json.loads(raw)
+        self._record_usage('analysis', response_body.get('usage', {}))
+        outfit_description = response_body['content'][0]['text']
+        
+        return outfit_description
+    
+    def _describe_images(self, images):
+        """
+        Ask Claude to describe several outfit images in one call.
+        Returns one description per image, in order (None for outfits missing from the reply).
+        """
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": min(1000 * len(images), 4096),
+            "messages": [
+                {
+                    "role": "user",
+                    "content": self._image_blocks(images) + [
+                        {
+                            "type": "text",
+                            "text": MULTI_OUTFIT_PROMPT.format(count=len(images))
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        body = json.dumps(request_body)
+        with self.metrics.span('vision_call', images=len(images)):
+            raw = bedrock_gate.invoke(self.bedrock, MODEL_ID, body, deadline=self._call_deadline('analysis'),
+                                      hedge=True, metrics=self.metrics)
+        self.metrics.add('model_calls', 1)
+        self.metrics.add('vision_request_bytes', len(body))
+        self.metrics.add('vision_response_bytes', len(raw))
+        
+        response_body = json.loads(raw)
+        self._record_usage('analysis', response_body.get('usage', {}))
+        text = response_body['content'][0]['text']
+        
+        # Entries are matched by their outfit number, or by position when it is missing
+        entries = json.loads(text[text.find('['):text.rfind(']') + 1])
+        descriptions = [None] * len(images)
+        for position, entry in enumerate(entries):
+            if not isinstance(entry, dict) or not entry.get('description'):
+                continue
+            try:
+                index = int(entry.get('outfit', position + 1)) - 1
+            except (TypeError, ValueError):
+                index = position
+            if 0 <= index < len(images) and descriptions[index] is None:
+                descriptions[index] = str(entry['description'])
+        return descriptions
+    
+    def analyze_outfits(self, image_paths, max_workers=ANALYZE_CONCURRENCY):
+        """Analyze several outfit image files (see analyze_images)"""
+        images = []
+        for image_path in image_paths:
+            try:
+                images.append(OutfitImage.from_path(image_path))
+            except OSError as e:
+                print(f"Error reading outfit {image_path}: {e}")
+                images.append(None)
+        return self.analyze_images(images, max_workers)
+    
+    def analyze_images(self, images, max_workers=ANALYZE_CONCURRENCY, together=None):
+        """
+        Analyze several OutfitImages concurrently, in input order (None for failed images).
+        Identical images are described once, and cached descriptions skip the vision call.
+        With together (default: the multi_image pipeline) the uncached images share one vision call.
+        """
+        if not images:
+            return []
+        if together is None:
+            together = self.pipeline == 'multi_image'
+        version = self._description_version(together)
+        
+        # Deduplicate by content before any call goes out
+        keys = []
+        unique_images = {}
+        for image in images:
+            try:
+                key = description_key(image.data, MODEL_ID, version) if image else None
+            except ValueError as e:
+                print(f"Error decoding outfit image: {e}")
+                key = None
+            keys.append(key)
+            if key:
+                unique_images.setdefault(key, image)
+        
+        descriptions = {}
+        for key in unique_images:
+            cached = description_cache.get(key)
+            if cached is not None:
+                descriptions[key] = cached
+        pending = [key for key in unique_images if key not in descriptions]
+        
+        preprocessing = []
+        
+        def analyze(key):
+            with self.metrics.span('analyze_image', image=unique_images[key].name, cache_hit=False):
+                try:
+                    image, stats = self._preprocess(unique_images[key])
+                    preprocessing.append(stats)
+                    return self._describe_image(image)
+                except BedrockGateError as e:
+                    print(f"Error analyzing outfit: {e}")
+                    self.bedrock_error = e
+                    return None
+                except Exception as e:
+                    print(f"Error analyzing outfit: {e}")
+                    return None
+        
+        def analyze_together(keys):
+            with self.metrics.span('analyze_images', images=len(keys), cache_hit=False):
+                try:
+                    prepared = []
+                    for key in keys:
+                        image, stats = self._preprocess(unique_images[key])
+                        preprocessing.append(stats)
+                        prepared.append(image)
+                    return self._describe_images(prepared)
+                except BedrockGateError as e:
+                    print(f"Error analyzing outfits: {e}")
+                    self.bedrock_error = e
+                except Exception as e:
+                    print(f"Error analyzing outfits: {e}")
+                return [None] * len(keys)
+        
+        if pending:
+            if together:
+                results = analyze_together(pending)
+            else:
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(pending)), thread_name_prefix='analyze') as pool:
+                    results = list(pool.map(analyze, pending))
+            for key, outfit_description in zip(pending, results):
+                if outfit_description is not None:
+                    description_cache.put(key, outfit_description)
+                    descriptions[key] = outfit_description
+        
+        self.analysis_stats = {
+            'images': len(images),
+            'unique_images': len(unique_images),
+            'description_cache_hits': len(unique_images) - len(pending),
+            'vision_calls': (1 if pending else 0) if together else len(pending),
+            'bytes_saved': sum(stats['bytes_saved'] for stats in preprocessing),
+            'preprocessing': preprocessing
+        }
+        for name in ('images', 'unique_images', 'description_cache_hits', 'vision_calls'):
+            self.metrics.add(name, self.analysis_stats[name])
+        
+        return [descriptions.get(key) for key in keys]
+    
+    def analyze_with_products(self, images):
+        """Analyze OutfitImages while the product catalog loads in the background"""
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-load') as pool:
+            products_future = pool.submit(self.get_products_from_dynamodb)
+            with self.metrics.span('analyze'):
+                outfit_descriptions = self.analyze_images(images)
+            return products_future.result(), outfit_descriptions
+    
+    def prepare_fused(self, images):
+        """
+        First half of the fused pipeline: deduplicate and preprocess the OutfitImages while
+        the product catalog loads. Returns (products, images for the single fused call).
+        """
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-load') as pool:
+            products_future = pool.submit(self.get_products_from_dynamodb)
+            
+            unique_images = {}
+            copies = {}
+            for image in images:
+                try:
+                    unique_images.setdefault(image.data, image)
+                    copies[image.data] = copies.get(image.data, 0) + 1
+                except (AttributeError, ValueError) as e:
+                    print(f"Error decoding outfit image: {e}")
+            
+            decoded = 0
+            prepared = []
+            preprocessing = []
+            for data, image in unique_images.items():
+                try:
+                    image, stats = self._preprocess(image)
+                except ValueError as e:
+                    print(f"Error preprocessing outfit image: {e}")
+                    continue
+                decoded += copies[data]
+                preprocessing.append(stats)
+                prepared.append(image)
+            products = products_future.result()
+        
+        self.analysis_stats = {
+            'images': len(images),
+            'decoded_images': decoded,
+            'unique_images': len(unique_images),
+            'description_cache_hits': 0,
+            'vision_calls': 0,
+            'bytes_saved': sum(stats['bytes_saved'] for stats in preprocessing),
+            'preprocessing': preprocessing
+        }
+        for name in ('images', 'unique_images', 'description_cache_hits', 'vision_calls'):
+            self.metrics.add(name, self.analysis_stats[name])
+        
+        return products, prepared
+    
+    def fused_description(self, count):
+        """Stands in for the outfit descriptions in a fused bundling prompt"""
+        return f"The {count} outfit image{'s' if count != 1 else ''} above (OUTFIT 1 to OUTFIT {count})."
+    
+    def get_products_from_dynamodb(self, limit=CANDIDATE_POOL_SIZE):
+        """Get products from the cached catalog within budget + premium range, separated by type"""
+        premium_budget = self.budget + 75  # Increased from 50 to 75
+        
+        try:
+            # Shared snapshot - the table is only scanned when the snapshot expires
+            with self.metrics.span('catalog'):
+                snapshot = self.catalog.get()
+            self.metrics.set('catalog_size', len(snapshot.items))
+            self.metrics.set('catalog_version', snapshot.version)
+            self.metrics.set('catalog_age_seconds', round(snapshot.age(), 1))
+            
+            # Price-diverse sample of each category up to the premium budget
+            with self.metrics.span('candidates'):
+                shoes, handbags, jewelry, clothing, other_accessories = [
+                    snapshot.index[category].sample(0, premium_budget, limit)
+                    for category in CATEGORIES
+                ]
+            
+            return shoes, handbags, jewelry, clothing, other_accessories
+            
+        except Exception as e:
+            print(f"Error fetching from DynamoDB: {e}")
+            return [], [], [], [], []
+    
+    def shortlist_products(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories, k=PROMPT_TOP_K):
+        """Keep the k products per category most relevant to the outfits and context"""
+        query = " ".join(str(part) for part in (outfit_description, self.occasion, self.season, self.gender) if part)
+        try:
+            search = self.catalog.get().search
+        except Exception as e:
+            print(f"Error loading search index: {e}")
+            return [products[:k] for products in (shoes, handbags, jewelry, clothing, other_accessories)]
+        
+        shortlisted = []
+        with self.metrics.span('shortlist'):
+            for products in (shoes, handbags, jewelry, clothing, other_accessories):
+                scores = search.score(query, products)
+                # Stable sort keeps the price-diverse pool order among equally relevant products
+                ranked = [p for _, p in sorted(zip(scores, products), key=lambda pair: -pair[0])]
+                top = ranked[:k]
+                
+                # Keep at least one in-budget option so the within-budget bundles stay reachable
+                if top and all(p.get('price_float', 0) >= self.budget for p in top):
+                    affordable = next((p for p in ranked[k:] if p.get('price_float', 0) < self.budget), None)
+                    if affordable:
+                        top[-1] = affordable
+                
+                shortlisted.append(top)
+        
+        return shortlisted
+    
+    def _request_text(self, outfit_description, shortlist_text=None):
+        """Per-request part of the bundling prompt: outfits, context and budget rules"""
+        shortlist_section = f"""
+MOST RELEVANT PRODUCTS FOR THESE OUTFITS (prefer these, most relevant first):
+{shortlist_text}
+""" if shortlist_text else ""
+        
+        return f"""I need to match shoes and handbags with these outfits:
+
+{outfit_description}
+
+CONTEXT:
+Age: {self.age if self.age else 'Not specified'}
+Gender: {self.gender if self.gender else 'Not specified'}
+Occasion: {self.occasion if self.occasion else 'Not specified'}
+Season: {self.season if self.season else 'Not specified'}
+{shortlist_section}
+Create EXACTLY 3 bundles from the AVAILABLE PRODUCTS that work well with ALL the outfits described above, considering the age, gender, occasion, and season:
+- Bundle 1: Within budget (under ${self.budget}) - can have 1-3 items
+- Bundle 2: Within budget (under ${self.budget}) - can have 1-3 items  
+- Bundle 3: Premium upgrade (${self.budget + 50} to ${self.budget + 75}) - can have 1-3 items
+
+CRITICAL REQUIREMENTS: 
+- Bundle 1 and Bundle 2 MUST stay UNDER ${self.budget}
+- Bundle 3 MUST be between ${self.budget + 50} and ${self.budget + 75} (exactly $50-75 above budget)
+- You MUST return exactly 3 bundles, no more, no less
+- If you cannot create a bundle in the premium range, add more expensive items to reach the target price range
+
+Respond with the JSON array only."""
+    
+    def _bundle_request_body(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories):
+        """Build the bundling prompt request for Claude"""
+        # Lists are already shortlisted to PROMPT_TOP_K
+        catalog_text = format_catalog(shoes, handbags, jewelry, clothing, other_accessories)
+        
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 2000,  # Reduced from 4000 for faster response
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": f"{catalog_text}\n\n{self._request_text(outfit_description)}"
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        return request_body
+    
+    def _cached_bundle_request(self, outfit_description, query=None):
+        """
+        Build a bundling request whose catalog prefix is identical for every request on the
+        same snapshot, so Bedrock can serve it from its prompt cache.
+        query ranks the shortlist (default: outfit_description).
+        Returns (request_body, product lists the prompt IDs refer to).
+        """
+        catalog_text, product_lists = cached_catalog_prefix(self.catalog.get())
+        
+        # Relevance shortlist goes in the per-request suffix as IDs into the cached catalog
+        premium_budget = self.budget + 75
+        affordable = [[p for p in products if p['price_float'] <= premium_budget] for products in product_lists]
+        shortlist = self.shortlist_products(outfit_description if query is None else query, *affordable)
+        shortlist_lines = []
+        for (prefix, label, _), products, top in zip(PRODUCT_SECTIONS, product_lists, shortlist):
+            if top:
+                positions = {id(p): i + 1 for i, p in enumerate(products)}
+                shortlist_lines.append(f"{label}: " + ", ".join(f"{prefix}{positions[id(p)]}" for p in top))
+        shortlist_text = "\n".join(shortlist_lines)
+        
+        request_body = {
+            "anthropic_version": "bedrock-2023-05-31",
+            "max_tokens": 2000,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": catalog_text,
+                            "cache_control": {"type": "ephemeral"}
+                        },
+                        {
+                            "type": "text",
+                            "text": self._request_text(outfit_description, shortlist_text)
+                        }
+                    ]
+                }
+            ]
+        }
+        
+        return request_body, product_lists
+    
+    def _prepare_bundle_request(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories, images=None):
+        """
+        Bundling request body plus the ID -> product maps for its prompt.
+        With images (fused pipeline) the outfit images go in the same message and the
+        shortlist is ranked by the request context alone, as there is no description yet.
+        """
+        query = '' if images else outfit_description
+        if PROMPT_CACHING:
+            request_body, product_lists = self._cached_bundle_request(outfit_description, query)
+        else:
+            product_lists = self.shortlist_products(query, shoes, handbags, jewelry, clothing, other_accessories)
+            request_body = self._bundle_request_body(outfit_description, *product_lists)
+        if images:
+            # Ahead of the per-request text, after the cached catalog block if there is one
+            content = request_body['messages'][0]['content']
+            content[-1:-1] = self._image_blocks(images)
+        return request_body, self._product_maps(*product_lists)
+    
+    def _record_usage(self, stage, usage):
+        """Keep Bedrock token counts (including prompt cache reads/writes) per stage"""
+        with self._usage_lock:
+            totals = self.token_usage.setdefault(stage, {})
+            for key, value in usage.items():
+                if isinstance(value, int):
+                    totals[key] = totals.get(key, 0) + value
+                    self.metrics.add(f"{stage}_{key}", value)
+    
+    def pipeline_report(self):
+        """
+        Bedrock round trips and tokens of this request, comparable across pipeline modes.
+        model_call_ms sums the calls; model_wait_ms is the time at least one was in flight.
+        """
+        timings = self.metrics.timings()
+        calls = sorted((span['start_ms'], span['start_ms'] + span['ms']) for span in timings['spans']
+                       if span['name'] in MODEL_CALL_SPANS)
+        waited = 0
+        busy_until = 0
+        for start, end in calls:
+            waited += max(0, end - max(start, busy_until))
+            busy_until = max(busy_until, end)
+        
+        tokens = {}
+        with self._usage_lock:
+            for totals in self.token_usage.values():
+                for key, value in totals.items():
+                    tokens[key] = tokens.get(key, 0) + value
+        return {
+            'mode': self.pipeline,
+            'model_calls': timings['counters'].get('model_calls', 0),
+            'model_call_ms': round(sum(end - start for start, end in calls), 2),
+            'model_wait_ms': round(waited, 2),
+            'tokens': tokens
+        }
+    
+    def _product_maps(self, shoes, handbags, jewelry, clothing, other_accessories):
+        """Map the S1/H1/... IDs used in the prompt back to products"""
+        return {
+            'S': {f"S{i+1}": s for i, s in enumerate(shoes)},
+            'H': {f"H{i+1}": h for i, h in enumerate(handbags)},
+            'J': {f"J{i+1}": j for i, j in enumerate(jewelry)},
+            'C': {f"C{i+1}": c for i, c in enumerate(clothing)},
+            'A': {f"A{i+1}": a for i, a in enumerate(other_accessories)}
+        }
+    
+    def create_bundles(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories, images=None):
+        """Create outfit bundles using Claude (fused pipeline: pass the prepared outfit images)"""
+        request_body, product_maps = self._prepare_bundle_request(
+            outfit_description, shoes, handbags, jewelry, clothing, other_accessories, images)
+        stage = 'fused' if images else 'bundling'
+        
+        try:
+            body = json.dumps(request_body)
+            with self.metrics.span(f"{stage}_call", streamed=False):
+                raw = bedrock_gate.invoke(self.bedrock, MODEL_ID, body, deadline=self._call_deadline('bundling'),
+                                          metrics=self.metrics)
+            self.metrics.add('model_calls', 1)
+            self.metrics.add(f"{stage}_request_bytes", len(body))
+            self.metrics.add(f"{stage}_response_bytes", len(raw))
+            
+            response_body = json.loads(raw)
+            self._record_usage(stage, response_body.get('usage', {}))
+            analysis_text = response_body['content'][0]['text']
+            
+            # Extract the JSON array from the response, skipping any preamble
+            bundles = BundleStreamParser().feed(analysis_text)
+            
+            # Map IDs back to actual products and repair any bundle that misses its price window
+            with self.metrics.span('solver'):
+                solver = BundleSolver(self.budget, product_maps)
+                enriched_bundles = solver.solve(bundles)
+            
+            # Only reachable when the catalog has nothing that fits a window
+            counts = solver.counts()
+            if counts['within_budget'] != 2 or counts['premium'] != 1:
+                print(f"Warning: Bundle distribution not optimal. Got {counts['within_budget']} within budget, {counts['premium']} premium")
+            
+            return enriched_bundles
+            
+        except BedrockGateError:
+            # Overload or timeout - the caller reports it instead of an empty bundle list
+            raise
+            
+        except Exception as e:
+            print(f"Error creating bundles: {e}")
+            import traceback
+            traceback.print_exc()
+            return []
+    
+    def create_bundles_stream(self, outfit_description, shoes, handbags, jewelry, clothing, other_accessories, images=None):
+        """Create outfit bundles using Claude, yielding each bundle as soon as the model finishes it"""
+        request_body, product_maps = self._prepare_bundle_request(
+            outfit_description, shoes, handbags, jewelry, clothing, other_accessories, images)
+        stage = 'fused' if images else 'bundling'
+        solver = BundleSolver(self.budget, product_maps)
+        model_bundles = []
+        parser = BundleStreamParser()
+        
+        try:
+            body = json.dumps(request_body)
+            self.metrics.add(f"{stage}_request_bytes", len(body))
+            # Includes the time the consumer spends on each yielded bundle
+            with self.metrics.span(f"{stage}_call", streamed=True) as span:
+                started = time.perf_counter()
+                bedrock_response = bedrock_gate.stream(self.bedrock, MODEL_ID, body, deadline=self._call_deadline('bundling'),
+                                                       metrics=self.metrics)
+                self.metrics.add('model_calls', 1)
+                received_chars = 0
+                started_output_tokens = 0
+                
+                for event in bedrock_response['body']:
+                    chunk = event.get('chunk')
+                    if not chunk:
+                        continue
+                    
+                    self.metrics.add(f"{stage}_response_bytes", len(chunk['bytes']))
+                    data = json.loads(chunk['bytes'])
+                    if data.get('type') == 'message_start':
+                        usage = data['message'].get('usage', {})
+                        started_output_tokens = usage.get('output_tokens', 0)
+                        self._record_usage(stage, usage)
+                    elif data.get('type') == 'message_delta':
+                        self._record_usage(stage, data.get('usage', {}))
+                    if data.get('type') != 'content_block_delta':
+                        continue
+                    
+                    text = data['delta'].get('text', '')
+                    received_chars += len(text)
+                    for bundle in parser.feed(text):
+                        model_bundles.append(bundle)
+                        enriched = solver.accept(bundle)
+                        if enriched:
+                            span.setdefault('first_bundle_ms', round((time.perf_counter() - started) * 1000, 2))
+                            yield enriched
+                    
+                    # Stop generating once the distribution is complete or the array is closed
+                    if parser.finished or solver.complete():
+                        bedrock_response['body'].close()
+                        # The closing message_delta with the real output token count never arrives:
+                        # estimate the tokens received so far (~4 characters each) and report them as such
+                        estimate = max(0, received_chars // 4 - started_output_tokens)
+                        span['closed_early'] = True
+                        self.metrics.add(f"{stage}_streams_closed_early", 1)
+                        self._record_usage(stage, {'output_tokens': estimate, 'estimated_output_tokens': estimate})
+                        break
+            
+            # Repair or build whatever the model did not get right
+            with self.metrics.span('solver'):
+                created = solver.finish(model_bundles)
+            for enriched in created:
+                yield enriched
+            
+            counts = solver.counts()
+            if counts['within_budget'] != 2 or counts['premium'] != 1:
+                print(f"Warning: Bundle distribution not optimal. Got {counts['within_budget']} within budget, {counts['premium']} premium")
+            
+        except BedrockGateError:
+            raise
+            
+        except Exception as e:
+            print(f"Error streaming bundles: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    def format_bundles(self, bundles, outfit_names):
+        """Bundles and request context as a JSON-serializable dict"""
+        output = {
+            "outfits": outfit_names if isinstance(outfit_names, list) else [outfit_names],
+            "context": {
+                "age": self.age,
+                "gender": self.gender,
+                "occasion": self.occasion,
+                "season": self.season,
+                "budget": self.budget
+            },
+            "bundles": []
+        }
+        
+        for i, bundle in enumerate(bundles, 1):
+            items_data = []
+            
+            for item in bundle['items']:
+                product = item['product']
+                items_data.append({
+                    "category": item['category'],
+                    "product_name": product.get('product_name'),
+                    "price": product.get('price_float', 0),
+                    "product_id": product.get('product_id'),
+                    "product_url": product.get('product_url'),
+                    "image_url": product.get('original_image_url'),
+                    "reason": item['reason']
+                })
+            
+            bundle_data = {
+                "bundle_number": i,
+                "bundle_name": bundle['bundle_name'],
+                "bundle_type": bundle.get('bundle_type', 'standard'),
+                "match_score": bundle['match_score'],
+                "total_cost": bundle['total_cost'],
+                "items": items_data,
+                "styling_note": bundle['styling_note']
+            }
+            
+            output["bundles"].append(bundle_data)
+        
+        return output
+    
+    def display_bundles(self, bundles, outfit_names):
+        """Display the bundles in JSON format"""
+        print(json.dumps(self.format_bundles(bundles, outfit_names), indent=2))
+    
+    def recommend(self, images):
+        """
+        Analyze OutfitImages and create bundles that work for all of them.
+        Returns (bundles, names of the analyzed images); both empty if nothing could be done.
+        """
+        if self.pipeline == 'fused':
+            # One call sees the images and the catalog
+            products, fused_images = self.prepare_fused(images)
+            if not products[0] or not fused_images:
+                return [], []
+            bundles = self.create_bundles(self.fused_description(len(fused_images)), *products, images=fused_images)
+            return bundles, [image.name for image in fused_images]
+        
+        # Step 1: Analyze all outfits while the products load
+        products, descriptions = self.analyze_with_products(images)
+        shoes, handbags, jewelry, clothing, other_accessories = products
+        
+        if not shoes:
+            return [], []
+            
+        outfit_descriptions = []
+        valid_images = []
+        for image, outfit_description in zip(images, descriptions):
+            if outfit_description is None:
+                continue
+            outfit_descriptions.append(outfit_description)
+            valid_images.append(image.name)
+        
+        if not outfit_descriptions:
+            return [], []
+        
+        # Step 2: Combine all outfit descriptions
+        combined_description = "\n\n".join([
+            f"OUTFIT {i+1} ({valid_images[i]}):\n{desc}"
+            for i, desc in enumerate(outfit_descriptions)
+        ])
+        
+        # Step 3: Create bundles that work for all outfits
+        bundles = self.create_bundles(combined_description, shoes, handbags, jewelry, clothing, other_accessories)
+        
+        return bundles, valid_images
+    
+    def run(self, outfit_images):
+        """Main agent execution for multiple outfit images"""
+        try:
+            images = [OutfitImage.from_path(path) for path in outfit_images if os.path.exists(path)]
+            
+            bundles, valid_images = self.recommend(images)
+            if not valid_images:
+                return {}
+            
+            # Step 4: Display results
+            self.display_bundles(bundles, valid_images)
+            
+            return bundles
+            
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return {}
+
+
+def main():
+    import sys
+    
+    if len(sys.argv) < 2:
+        sys.exit(1)
+    
+    if sys.argv[1] == 'batch':
+        from outfit_bundle_batch import main as batch_main
+        batch_main(sys.argv[2:])
+        return
+    
+    # Parse command line arguments
+    import argparse
+    parser = argparse.ArgumentParser(description='Outfit Bundle Agent')
+    parser.add_argument('images', nargs='+', help='Outfit image paths')
+    parser.add_argument('--budget', type=int, default=200, help='Budget in dollars (default: 200)')
+    parser.add_argument('--age', type=str, help='Age or age range (e.g., "25" or "20-30")')
+    parser.add_argument('--gender', type=str, help='Gender (e.g., "female", "male", "unisex")')
+    parser.add_argument('--occasion', type=str, help='Occasion (e.g., "wedding", "birthday", "casual")')
+    parser.add_argument('--season', type=str, help='Season (e.g., "summer", "winter", "spring", "fall")')
+    parser.add_argument('--pipeline', choices=PIPELINE_MODES, default=PIPELINE_MODE,
+                        help=f"Pipeline mode (default: {PIPELINE_MODE})")
+    parser.add_argument('--init-report', action='store_true', help='Print cold-start timings to stderr when done')
+    
+    args = parser.parse_args()
+    
+    agent = OutfitBundleAgent(
+        budget=args.budget,
+        age=args.age,
+        gender=args.gender,
+        occasion=args.occasion,
+        season=args.season,
+        pipeline=args.pipeline
+    )
+    agent.run(args.images)
+    
+    if args.init_report:
+        print(json.dumps({'init_ms': init_report()}), file=sys.stderr)
+
+
+# CPU the process has used once this module is imported: interpreter start-up plus every import (boto3 included)
+_init_timings['import_cpu_ms'] = round(time.process_time() * 1000, 1)
+
+
+if __name__ == "__main__":
+    main()
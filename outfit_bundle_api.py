@@ -1,204 +1,378 @@
-"""
-Outfit Bundle API - Flask API for AWS Lambda + API Gateway
-"""
-import json
-import base64
-import tempfile
-import os
-from outfit_bundle_agent import OutfitBundleAgent
-
-def lambda_handler(event, context):
-    """
-    AWS Lambda handler for API Gateway
-    
-    Expected POST body:
-    {
-        "images": ["base64_encoded_image1", "base64_encoded_image2"],
-        "age": "25",
-        "gender": "female",
-        "occasion": "garden party",
-        "season": "summer",
-        "budget": 200
-    }
-    """
-    try:
-        # Parse request body
-        if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-        else:
-            body = event
-        
-        # Extract parameters
-        images_base64 = body.get('images', [])
-        age = body.get('age')
-        gender = body.get('gender')
-        occasion = body.get('occasion')
-        season = body.get('season')
-        budget = body.get('budget', 200)
-        
-        if not images_base64:
-            return {
-                'statusCode': 400,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'No images provided'})
-            }
-        
-        # Save base64 images to temporary files
-        temp_files = []
-        for i, img_base64 in enumerate(images_base64):
-            # Remove data URL prefix if present
-            if ',' in img_base64:
-                img_base64 = img_base64.split(',')[1]
-            
-            # Decode base64
-            img_data = base64.b64decode(img_base64)
-            
-            # Save to temp file
-            temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-            temp_file.write(img_data)
-            temp_file.close()
-            temp_files.append(temp_file.name)
-        
-        # Create agent and run
-        agent = OutfitBundleAgent(
-            budget=budget,
-            age=age,
-            gender=gender,
-            occasion=occasion,
-            season=season
-        )
-        
-        # Get products
-        shoes, handbags, jewelry, clothing, other_accessories = agent.get_products_from_dynamodb()
-        
-        if not shoes:
-            return {
-                'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({'error': 'No products found in database'})
-            }
-        
-        # Analyze all outfits
-        outfit_descriptions = []
-        for temp_file in temp_files:
-            outfit_description = agent.analyze_outfit(temp_file)
-            outfit_descriptions.append(outfit_description)
-        
-        # Combine descriptions
-        combined_description = "\n\n".join([
-            f"OUTFIT {i+1}:\n{desc}"
-            for i, desc in enumerate(outfit_descriptions)
-        ])
-        
-        # Create bundles
-        bundles = agent.create_bundles(combined_description, shoes, handbags, jewelry, clothing, other_accessories)
-        
-        # Build response
-        output = {
-            "outfits_count": len(temp_files),
-            "context": {
-                "age": age,
-                "gender": gender,
-                "occasion": occasion,
-                "season": season,
-                "budget": budget
-            },
-            "bundles": []
-        }
-        
-        for i, bundle in enumerate(bundles, 1):
-            items_data = []
-            
-            for item in bundle['items']:
-                product = item['product']
-                items_data.append({
-                    "category": item['category'],
-                    "product_name": product.get('product_name'),
-                    "price": product.get('price_float', 0),
-                    "product_id": product.get('product_id'),
-                    "product_url": product.get('product_url'),
-                    "image_url": product.get('original_image_url'),
-                    "reason": item['reason']
-                })
-            
-            bundle_data = {
-                "bundle_number": i,
-                "bundle_name": bundle['bundle_name'],
-                "bundle_type": bundle.get('bundle_type', 'standard'),
-                "match_score": bundle['match_score'],
-                "total_cost": bundle['total_cost'],
-                "items": items_data,
-                "styling_note": bundle['styling_note']
-            }
-            
-            output["bundles"].append(bundle_data)
-        
-        # Clean up temp files
-        for temp_file in temp_files:
-            try:
-                os.unlink(temp_file)
-            except:
-                pass
-        
-        return {
-            'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps(output)
-        }
-        
-    except Exception as e:
-        import traceback
-        error_trace = traceback.format_exc()
-        
-        return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'error': str(e),
-                'trace': error_trace
-            })
-        }
-
-
-# For local testing with Flask
-if __name__ == '__main__':
-    from flask import Flask, request, jsonify
-    from flask_cors import CORS
-    
-    app = Flask(__name__)
-    CORS(app)
-    
-    @app.route('/outfit-bundles', methods=['POST', 'OPTIONS'])
-    def outfit_bundles():
-        if request.method == 'OPTIONS':
-            return '', 200
-        
-        # Convert Flask request to Lambda event format
-        event = {
-            'body': json.dumps(request.get_json())
-        }
-        
-        # Call Lambda handler
-        response = lambda_handler(event, None)
-        
-        return jsonify(json.loads(response['body'])), response['statusCode']
-    
-    @app.route('/health', methods=['GET'])
-    def health():
-        return jsonify({'status': 'healthy'}), 200
-    
-    print("Starting Outfit Bundle API on http://localhost:5000")
-    print("POST to http://localhost:5000/outfit-bundles")
-    app.run(host='0.0.0.0', port=5000, debug=True)
+"""
+Outfit Bundle API - Flask API for AWS Lambda + API Gateway
+"""
+import json
+import os
+import time
+from api_payloads import RequestError, compress_response, json_images, parse_request, request_format
+from bedrock_gate import BedrockGateError, bedrock_gate
+from outfit_bundle_agent import PIPELINE_MODE, PIPELINE_MODES, REQUEST_TIMEOUT_SECONDS, OutfitBundleAgent, init_report
+from product_catalog import catalog_stats
+from request_metrics import RequestMetrics
+from response_cache import response_cache, response_key
+
+# The first invocation in a container logs where its cold start went
+_init_reported = False
+
+
+def _log_init_report():
+    global _init_reported
+    if not _init_reported:
+        _init_reported = True
+        print(json.dumps({'init_ms': init_report()}))
+
+
+# Seconds kept back from the Lambda timeout to build and return the response
+DEADLINE_MARGIN_SECONDS = 1.0
+
+# Suggested client wait after Bedrock overload
+RETRY_AFTER_SECONDS = 2
+
+
+def _json_response(status_code, payload, headers=None):
+    """API Gateway proxy response with a JSON body"""
+    return {
+        'statusCode': status_code,
+        'headers': dict({
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*'
+        }, **(headers or {})),
+        'body': json.dumps(payload)
+    }
+
+
+def _request_deadline(context):
+    """time.monotonic() deadline from the Lambda's remaining time, capped at REQUEST_TIMEOUT_SECONDS"""
+    budget = REQUEST_TIMEOUT_SECONDS
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        budget = min(budget, context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_SECONDS)
+    return time.monotonic() + max(budget, 0)
+
+
+def _request_agent(body, metrics=None, deadline=None):
+    """Agent configured with a request's context, budget and pipeline mode"""
+    pipeline = body.get('pipeline') or PIPELINE_MODE
+    if pipeline not in PIPELINE_MODES:
+        raise RequestError(400, f"pipeline must be one of {', '.join(PIPELINE_MODES)}")
+    return OutfitBundleAgent(
+        budget=body.get('budget', 200),
+        age=body.get('age'),
+        gender=body.get('gender'),
+        occasion=body.get('occasion'),
+        season=body.get('season'),
+        metrics=metrics,
+        deadline=deadline,
+        pipeline=pipeline
+    )
+
+
+def _wants_timings(event, body):
+    """True if the caller asked for the 'timings' section (body field or ?timings=1)"""
+    query = event.get('queryStringParameters') or {}
+    return body.get('timings') in (True, 1, '1', 'true') or query.get('timings') in ('1', 'true')
+
+
+def _request_cache_key(agent, images):
+    """Response cache key for a request, or None if it cannot be cached"""
+    # Before the first catalog load there is nothing to key on; waiting for the load
+    # here would keep it from overlapping the image analysis
+    snapshot = agent.catalog.peek()
+    if snapshot is None:
+        return None
+    try:
+        return response_key(
+            [image.data for image in images],
+            agent.age, agent.gender, agent.occasion, agent.season, agent.budget,
+            snapshot.version, agent.pipeline
+        )
+    except Exception as e:
+        print(f"Not caching response: {e}")
+        return None
+
+
+def _prepare_request(agent, images):
+    """
+    First half of the pipeline shared by the JSON and streaming endpoints: analyze the
+    outfit images and load the products.
+    Returns (products, combined_description, outfits_analyzed, images for a fused bundling call or None).
+    """
+    if agent.pipeline == 'fused':
+        # No analysis call - the bundling call gets the images themselves
+        products, fused_images = agent.prepare_fused(images)
+        if not products[0]:
+            raise RequestError(500, 'No products found in database')
+        if not fused_images:
+            raise RequestError(400, 'Could not decode any of the outfit images')
+        outfits_analyzed = agent.analysis_stats['decoded_images']
+        return products, agent.fused_description(len(fused_images)), outfits_analyzed, fused_images
+    
+    # Analyze all outfits while the products load
+    products, outfit_descriptions = agent.analyze_with_products(images)
+    
+    if not products[0]:
+        raise RequestError(500, 'No products found in database')
+    
+    # Drop images that could not be analyzed
+    outfit_descriptions = [desc for desc in outfit_descriptions if desc is not None]
+    
+    if not outfit_descriptions:
+        if agent.bedrock_error:
+            raise agent.bedrock_error
+        raise RequestError(502, 'Could not analyze any of the outfit images')
+    
+    # Combine descriptions
+    combined_description = "\n\n".join([
+        f"OUTFIT {i+1}:\n{desc}"
+        for i, desc in enumerate(outfit_descriptions)
+    ])
+    
+    return products, combined_description, len(outfit_descriptions), None
+
+
+def _build_response(agent, images):
+    """Run the full pipeline and build the response payload"""
+    products, combined_description, outfits_analyzed, fused_images = _prepare_request(agent, images)
+    
+    # Create bundles
+    bundles = agent.create_bundles(combined_description, *products, images=fused_images)
+    
+    # Build response
+    output = _response_header(agent, images, outfits_analyzed)
+    output["bundles"] = [_format_bundle(i, bundle) for i, bundle in enumerate(bundles, 1)]
+    output["usage"] = agent.token_usage
+    output["pipeline"] = agent.pipeline_report()
+    
+    return output
+
+
+def _cacheable(output):
+    """(output, cacheable) for the response cache: only complete responses - every outfit
+    analyzed and all three bundles built - are kept, so a transient failure is not replayed"""
+    return output, len(output['bundles']) == 3 and output['outfits_analyzed'] == output['outfits_count']
+
+
+def _response_header(agent, images, outfits_analyzed):
+    """Response fields that do not depend on the bundles"""
+    return {
+        "outfits_count": len(images),
+        "outfits_analyzed": outfits_analyzed,
+        "cache": agent.analysis_stats,
+        "context": {
+            "age": agent.age,
+            "gender": agent.gender,
+            "occasion": agent.occasion,
+            "season": agent.season,
+            "budget": agent.budget
+        }
+    }
+
+
+def _format_bundle(bundle_number, bundle):
+    """Bundle as returned to the client"""
+    items_data = []
+    
+    for item in bundle['items']:
+        product = item['product']
+        items_data.append({
+            "category": item['category'],
+            "product_name": product.get('product_name'),
+            "price": product.get('price_float', 0),
+            "product_id": product.get('product_id'),
+            "product_url": product.get('product_url'),
+            "image_url": product.get('original_image_url'),
+            "reason": item['reason']
+        })
+    
+    return {
+        "bundle_number": bundle_number,
+        "bundle_name": bundle['bundle_name'],
+        "bundle_type": bundle.get('bundle_type', 'standard'),
+        "match_score": bundle['match_score'],
+        "total_cost": bundle['total_cost'],
+        "items": items_data,
+        "styling_note": bundle['styling_note']
+    }
+
+
+def lambda_handler(event, context):
+    """
+    AWS Lambda handler for API Gateway
+    
+    Expected POST body:
+    {
+        "images": ["base64_encoded_image1", "base64_encoded_image2"],
+        "age": "25",
+        "gender": "female",
+        "occasion": "garden party",
+        "season": "summer",
+        "budget": 200,
+        "pipeline": "two_stage",  (optional - two_stage, multi_image or fused; see outfit_bundle_agent)
+        "timings": true  (optional - adds per-stage timings to the response)
+    }
+    
+    Images may also be uploaded as multipart/form-data or as a raw image body
+    (see api_payloads). Responses are gzip/br compressed when the client accepts it.
+    """
+    metrics = RequestMetrics()
+    response = None
+    try:
+        response = compress_response(_handle_request(event, context, metrics), event)
+        return response
+    
+    finally:
+        _log_init_report()
+        if response is not None:
+            metrics.set('status_code', response['statusCode'])
+            metrics.set('response_encoding', response['headers'].get('Content-Encoding', 'identity'))
+            metrics.add('response_bytes', len(response['body']))
+        metrics.emit()
+
+
+def _handle_request(event, context, metrics):
+    """lambda_handler without compression and metrics emission"""
+    try:
+        raw_body = event.get('body')
+        metrics.add('request_bytes', len(raw_body) if isinstance(raw_body, (str, bytes)) else 0)
+        metrics.set('request_format', request_format(event))
+        with metrics.span('parse'):
+            body, images = parse_request(event)
+        agent = _request_agent(body, metrics, _request_deadline(context))
+        
+        # Identical requests share one computation and its cached result
+        key = _request_cache_key(agent, images)
+        if key is None:
+            output, cache_status = _build_response(agent, images), 'bypass'
+        else:
+            output, cache_status = response_cache.get_or_compute(
+                key, lambda: _cacheable(_build_response(agent, images)))
+        metrics.set('response_cache', cache_status)
+        
+        output = dict(output, response_cache=cache_status)
+        if _wants_timings(event, body):
+            output['timings'] = metrics.timings()
+        return _json_response(200, output)
+        
+    except RequestError as e:
+        return _json_response(e.status_code, {'error': e.message})
+        
+    except BedrockGateError as e:
+        # Overloaded or out of time - tell the client to retry later instead of a 500
+        return _json_response(e.status_code, {'error': str(e)}, {'Retry-After': str(RETRY_AFTER_SECONDS)})
+        
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        
+        return _json_response(500, {
+            'error': str(e),
+            'trace': error_trace
+        })
+
+
+def stream_bundle_events(body, images=None, context=None):
+    """
+    Run the pipeline for a request body, yielding (event, data) pairs for server-sent events:
+    one 'context' event, a 'bundle' event per bundle as soon as it is generated, then 'done'
+    (or 'error'). images are taken from the body's base64 list unless already parsed; context
+    (Lambda-style) sets the request deadline as in lambda_handler.
+    """
+    metrics = RequestMetrics()
+    metrics.set('streamed', True)
+    try:
+        if images is None:
+            images = json_images(body)
+        agent = _request_agent(body, metrics, _request_deadline(context))
+        products, combined_description, outfits_analyzed, fused_images = _prepare_request(agent, images)
+        yield 'context', _response_header(agent, images, outfits_analyzed)
+        
+        bundles_count = 0
+        for bundle in agent.create_bundles_stream(combined_description, *products, images=fused_images):
+            bundles_count += 1
+            if bundles_count == 1:
+                metrics.set('first_bundle_ms', metrics.elapsed_ms())
+            yield 'bundle', _format_bundle(bundles_count, bundle)
+        
+        done = {'bundles_count': bundles_count, 'usage': agent.token_usage, 'pipeline': agent.pipeline_report()}
+        if _wants_timings({}, body):
+            done['timings'] = metrics.timings()
+        metrics.set('status_code', 200)
+        yield 'done', done
+        
+    except RequestError as e:
+        metrics.set('status_code', e.status_code)
+        yield 'error', {'error': e.message, 'status': e.status_code}
+        
+    except BedrockGateError as e:
+        metrics.set('status_code', e.status_code)
+        yield 'error', {'error': str(e), 'status': e.status_code, 'retry_after': RETRY_AFTER_SECONDS}
+        
+    except Exception as e:
+        metrics.set('status_code', 500)
+        yield 'error', {'error': str(e), 'status': 500}
+    
+    finally:
+        metrics.emit()
+
+
+def format_sse(event, data):
+    """Encode one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+# For local testing with Flask (production server mode: outfit_bundle_server.py)
+if __name__ == '__main__':
+    import base64
+    from flask import Flask, Response, request, jsonify, stream_with_context
+    from flask_cors import CORS
+    
+    app = Flask(__name__)
+    CORS(app)
+    
+    def _lambda_event(request):
+        # Binary passthrough, as API Gateway does with binary media types "*/*"
+        return {
+            'body': base64.b64encode(request.get_data()).decode('ascii'),
+            'isBase64Encoded': True,
+            'headers': dict(request.headers),
+            'queryStringParameters': request.args.to_dict()
+        }
+    
+    @app.route('/outfit-bundles', methods=['POST', 'OPTIONS'])
+    def outfit_bundles():
+        if request.method == 'OPTIONS':
+            return '', 200
+        
+        # Convert Flask request to Lambda event format
+        response = lambda_handler(_lambda_event(request), None)
+        
+        body = response['body']
+        if response.get('isBase64Encoded'):
+            body = base64.b64decode(body)
+        headers = {k: v for k, v in response['headers'].items()
+                   if k in ('Retry-After', 'Content-Encoding', 'Vary')}
+        return Response(body, response['statusCode'], headers, mimetype='application/json')
+    
+    @app.route('/outfit-bundles/stream', methods=['POST', 'OPTIONS'])
+    def outfit_bundles_stream():
+        if request.method == 'OPTIONS':
+            return '', 200
+        
+        try:
+            body, images = parse_request(_lambda_event(request))
+        except RequestError as e:
+            return jsonify({'error': e.message}), e.status_code
+        events = (format_sse(event, data) for event, data in stream_bundle_events(body, images))
+        
+        return Response(stream_with_context(events), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    @app.route('/health', methods=['GET'])
+    def health():
+        return jsonify({'status': 'healthy', 'catalog': catalog_stats(), 'response_cache': response_cache.stats(),
+                        'bedrock': bedrock_gate.stats()}), 200
+    
+    print("Starting Outfit Bundle API on http://localhost:5000")
+    print("POST to http://localhost:5000/outfit-bundles")
+    print("POST to http://localhost:5000/outfit-bundles/stream for server-sent events")
+    # The Werkzeug debugger runs arbitrary code for anyone who can reach it - opt in with FLASK_DEBUG=1
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('FLASK_DEBUG', '0') == '1')
@@ -0,0 +1,190 @@
+"""
+Outfit Bundle Batch - Precompute bundles for a JSONL file of requests
+
+Usage:
+    python outfit_bundle_agent.py batch requests.jsonl --output results.jsonl
+
+Each input line is a request such as:
+    {"id": "cust-42", "images": ["outfit1.jpg", "outfit2.jpg"], "budget": 200,
+     "age": "25", "gender": "female", "occasion": "wedding", "season": "summer"}
+and may pick a pipeline mode with "pipeline" (two_stage, multi_image or fused).
+
+Results are appended to the output file as each request completes. The output
+file doubles as the checkpoint: rerunning the same command skips every request
+that already has an "ok" result, so a crashed run resumes where it stopped.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from outfit_bundle_agent import OutfitBundleAgent
+from outfit_images import OutfitImage
+
+
+class RateLimiter:
+    """Token bucket shared by all worker threads: at most `rate` acquisitions per second"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_requests(input_path):
+    """
+    Yield (request_id, request, error) for every JSONL line; the id defaults to the line number.
+    A line that is not a JSON object gets request None and the reason in error.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                yield str(line_number), None, f"Malformed request line: {e}"
+                continue
+            if not isinstance(request, dict):
+                yield str(line_number), None, 'Malformed request line: not a JSON object'
+                continue
+            yield str(request.get('id', line_number)), request, None
+
+
+def completed_request_ids(output_path):
+    """IDs that already have a successful result in the output file"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash - that request is simply redone
+                continue
+            if result.get('status') == 'ok':
+                done.add(str(result.get('id')))
+    return done
+
+
+def process_request(request):
+    """Run one batch request through the agent and return its output dict"""
+    agent = OutfitBundleAgent(
+        budget=request.get('budget', 200),
+        age=request.get('age'),
+        gender=request.get('gender'),
+        occasion=request.get('occasion'),
+        season=request.get('season'),
+        pipeline=request.get('pipeline')
+    )
+    images = [OutfitImage.from_path(path) for path in request.get('images', []) if os.path.exists(path)]
+    if not images:
+        raise ValueError('No readable images')
+
+    bundles, valid_images = agent.recommend(images)
+    if not valid_images:
+        raise RuntimeError('No products found or no outfit could be analyzed')
+    if not bundles:
+        raise RuntimeError('No bundles created')
+
+    output = agent.format_bundles(bundles, valid_images)
+    output['cache'] = agent.analysis_stats
+    output['usage'] = agent.token_usage
+    output['pipeline'] = agent.pipeline_report()
+    output['timings'] = agent.metrics.timings()
+    return output
+
+
+def run_batch(input_path, output_path, concurrency=8, rate=0.0):
+    """Process every pending request with `concurrency` workers, starting at most `rate` per second"""
+    done = completed_request_ids(output_path)
+    limiter = RateLimiter(rate, burst=concurrency)
+    slots = threading.BoundedSemaphore(concurrency * 2)
+    write_lock = threading.Lock()
+    counts = {'ok': 0, 'error': 0, 'skipped': 0}
+    started = time.time()
+
+    # Make sure appended results start on a fresh line after a crash mid-write
+    if os.path.exists(output_path) and os.path.getsize(output_path):
+        with open(output_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        if needs_newline:
+            out.write('\n')
+
+        def write_result(result):
+            with write_lock:
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+                counts[result['status']] += 1
+                finished = counts['ok'] + counts['error']
+                if finished % 100 == 0:
+                    elapsed = time.time() - started
+                    print(f"{finished} requests done ({counts['error']} errors), {finished / elapsed:.1f}/s", file=sys.stderr)
+
+        def work(request_id, request):
+            try:
+                limiter.acquire()
+                result = {'id': request_id, 'status': 'ok', 'output': process_request(request)}
+            except Exception as e:
+                result = {'id': request_id, 'status': 'error', 'error': str(e)}
+            finally:
+                slots.release()
+            write_result(result)
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch') as pool:
+            for request_id, request, error in read_requests(input_path):
+                if request_id in done:
+                    counts['skipped'] += 1
+                    continue
+                if error:
+                    # Recorded like a failed request, so one bad line cannot stop the run
+                    write_result({'id': request_id, 'status': 'error', 'error': error})
+                    continue
+                # Bound the number of queued requests so huge inputs stream through
+                slots.acquire()
+                pool.submit(work, request_id, request)
+
+    counts['seconds'] = round(time.time() - started, 1)
+    return counts
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='outfit_bundle_agent.py batch', description='Precompute outfit bundles for a JSONL file of requests')
+    parser.add_argument('input', help='JSONL file of requests (images + context + budget)')
+    parser.add_argument('--output', required=True, help='JSONL results file, also used to resume')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests processed in parallel (default: 8)')
+    parser.add_argument('--rate', type=float, default=0.0, help='Max requests started per second across all workers (default: unlimited)')
+
+    args = parser.parse_args(argv)
+    counts = run_batch(args.input, args.output, concurrency=args.concurrency, rate=args.rate)
+    print(json.dumps(counts), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Outfit Bundle Server - ASGI server mode for the outfit bundle API
+
+Serves the same endpoints as the Lambda/Flask entry points from one long-lived
+process, sharing the Bedrock and DynamoDB clients, the catalog, the caches and
+the Bedrock gate across every request:
+
+    POST /outfit-bundles           JSON, multipart or raw image body (see api_payloads)
+    POST /outfit-bundles/stream    server-sent events (see stream_bundle_events)
+    GET  /health                   200 once the catalog is loaded, 503 while starting or draining
+
+boto3 is synchronous, so each request's pipeline runs on a bounded thread pool
+while the event loop only accepts, queues and writes responses. Requests beyond
+SERVER_MAX_ACTIVE wait in a queue of at most SERVER_MAX_QUEUED; when that is
+full, or a request waited SERVER_QUEUE_TIMEOUT_SECONDS, it gets 503 with
+Retry-After instead of piling up.
+
+Usage:
+    uvicorn outfit_bundle_server:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 30
+    python outfit_bundle_server.py --port 8000
+"""
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qsl
+
+from api_payloads import MAX_REQUEST_BYTES, RequestError, parse_request
+from bedrock_gate import bedrock_gate
+from outfit_bundle_agent import REQUEST_TIMEOUT_SECONDS
+from outfit_bundle_api import RETRY_AFTER_SECONDS, format_sse, lambda_handler, stream_bundle_events
+from product_catalog import catalog_stats
+from response_cache import response_cache
+
+# Requests running a pipeline at once (one pool thread each), and requests allowed to wait for one
+SERVER_MAX_ACTIVE = int(os.environ.get('SERVER_MAX_ACTIVE', '256'))
+SERVER_MAX_QUEUED = int(os.environ.get('SERVER_MAX_QUEUED', '512'))
+SERVER_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('SERVER_QUEUE_TIMEOUT_SECONDS', '5'))
+
+# How long shutdown waits for in-flight requests to finish
+SERVER_SHUTDOWN_GRACE_SECONDS = float(os.environ.get('SERVER_SHUTDOWN_GRACE_SECONDS', '25'))
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Accept-Encoding'
+}
+
+
+class Overloaded(Exception):
+    """No pipeline slot could be had - the request is turned away with 503"""
+
+
+class AdmissionQueue:
+    """At most max_active requests run; up to max_queued wait for a slot, the rest are rejected"""
+
+    def __init__(self, max_active=SERVER_MAX_ACTIVE, max_queued=SERVER_MAX_QUEUED):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.active = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(max_active)
+
+    @asynccontextmanager
+    async def slot(self, timeout=SERVER_QUEUE_TIMEOUT_SECONDS):
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+        elif self.queued >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded('Request queue is full')
+        else:
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.timed_out += 1
+                raise Overloaded(f"No capacity within {timeout:.0f}s")
+            finally:
+                self.queued -= 1
+
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {'active': self.active, 'queued': self.queued, 'max_active': self.max_active,
+                'max_queued': self.max_queued, 'rejected': self.rejected, 'timed_out': self.timed_out}
+
+
+class _RequestContext:
+    """Lambda-style context so a request's deadline starts when it arrived, not when it left the queue"""
+
+    def __init__(self, arrived):
+        self.arrived = arrived
+
+    def get_remaining_time_in_millis(self):
+        return (REQUEST_TIMEOUT_SECONDS - (time.monotonic() - self.arrived)) * 1000
+
+
+class BundleServer:
+    """The ASGI application; one instance per process (see app)"""
+
+    def __init__(self, max_active=SERVER_MAX_ACTIVE, max_queued=SERVER_MAX_QUEUED):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.admission = None
+        self.executor = None
+        self.draining = False
+        self.catalog_error = None
+        self.requests = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        self._ensure_started()
+
+        method, path = scope['method'], scope['path'].rstrip('/') or '/'
+        if method == 'OPTIONS':
+            await _respond(send, 204, b'', CORS_HEADERS)
+        elif path == '/health' and method == 'GET':
+            await self._health(send)
+        elif path in ('/outfit-bundles', '/outfit-bundles/stream') and method == 'POST':
+            await self._bundles(scope, receive, send, stream=path.endswith('/stream'))
+        else:
+            await _respond_json(send, 404, {'error': f"No route for {method} {path}"})
+
+    def stats(self):
+        return dict(self.admission.stats() if self.admission else {}, requests=self.requests, draining=self.draining)
+
+    def _ensure_started(self):
+        # Servers without lifespan support start lazily on the first request
+        if self.executor is None:
+            self.admission = AdmissionQueue(self.max_active, self.max_queued)
+            self.executor = ThreadPoolExecutor(max_workers=self.max_active, thread_name_prefix='bundle-request')
+            asyncio.get_running_loop().run_in_executor(self.executor, self._warm_catalog)
+
+    def _warm_catalog(self):
+        """Load the catalog before the first request needs it; /health reports ready once it has"""
+        from outfit_bundle_agent import get_product_table
+        from product_catalog import get_catalog_cache
+        try:
+            get_catalog_cache(get_product_table()).get()
+        except Exception as e:
+            print(f"Error loading catalog at startup: {e}")
+            self.catalog_error = str(e)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self._ensure_started()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self._shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _shutdown(self):
+        """Stop admitting requests and give in-flight ones SERVER_SHUTDOWN_GRACE_SECONDS to finish"""
+        self.draining = True
+        deadline = time.monotonic() + SERVER_SHUTDOWN_GRACE_SECONDS
+        while self.admission and (self.admission.active or self.admission.queued) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.admission and self.admission.active:
+            print(f"Shutting down with {self.admission.active} requests still running")
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _health(self, send):
+        catalogs = catalog_stats()
+        ready = any(stats['version'] is not None for stats in catalogs.values())
+        status = 'draining' if self.draining else 'healthy' if ready else 'starting'
+        payload = {'status': status, 'catalog': catalogs, 'catalog_error': self.catalog_error,
+                   'server': self.stats(), 'response_cache': response_cache.stats(), 'bedrock': bedrock_gate.stats()}
+        await _respond_json(send, 200 if status == 'healthy' else 503, payload)
+
+    async def _bundles(self, scope, receive, send, stream):
+        arrived = time.monotonic()
+        self.requests += 1
+        if self.draining:
+            await _respond_json(send, 503, {'error': 'Server is shutting down'}, _retry_after())
+            return
+
+        headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+        try:
+            body = await _read_body(receive, headers)
+        except RequestError as e:
+            await _respond_json(send, e.status_code, {'error': e.message})
+            return
+
+        event = {
+            'body': base64.b64encode(body).decode('ascii'),
+            'isBase64Encoded': True,
+            'headers': headers,
+            'queryStringParameters': dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            async with self.admission.slot():
+                if stream:
+                    await self._stream(event, receive, send, _RequestContext(arrived))
+                else:
+                    response = await loop.run_in_executor(self.executor, lambda_handler, event, _RequestContext(arrived))
+                    await _respond_lambda(send, response)
+        except Overloaded as e:
+            await _respond_json(send, 503, {'error': str(e)}, _retry_after())
+
+    async def _stream(self, event, receive, send, context):
+        loop = asyncio.get_running_loop()
+        try:
+            body, images = await loop.run_in_executor(self.executor, parse_request, event)
+        except RequestError as e:
+            await _respond_json(send, e.status_code, {'error': e.message})
+            return
+
+        events = asyncio.Queue()
+        stopped = threading.Event()
+
+        def produce():
+            generator = stream_bundle_events(body, images, context)
+            try:
+                for item in generator:
+                    if stopped.is_set():
+                        break
+                    loop.call_soon_threadsafe(events.put_nowait, item)
+            finally:
+                generator.close()
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            stopped.set()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        loop.run_in_executor(self.executor, produce)
+        headers = dict(CORS_HEADERS)
+        headers.update({'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+        await send({'type': 'http.response.start', 'status': 200, 'headers': _encode_headers(headers)})
+        try:
+            while (item := await events.get()) is not None:
+                await send({'type': 'http.response.body', 'body': format_sse(*item).encode('utf-8'), 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            stopped.set()
+            watcher.cancel()
+
+
+def _retry_after():
+    return {'Retry-After': str(RETRY_AFTER_SECONDS)}
+
+
+async def _read_body(receive, headers):
+    """Request body, refused with 413 as soon as it is known to exceed MAX_REQUEST_BYTES"""
+    declared = headers.get('content-length')
+    if declared and declared.isdigit() and int(declared) > MAX_REQUEST_BYTES:
+        raise RequestError(413, f"Request body is too large ({int(declared):,} bytes, max {MAX_REQUEST_BYTES:,})")
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise RequestError(400, 'Client disconnected')
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_REQUEST_BYTES:
+            raise RequestError(413, f"Request body is too large (max {MAX_REQUEST_BYTES:,} bytes)")
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _encode_headers(headers):
+    return [(key.lower().encode('latin-1'), str(value).encode('latin-1')) for key, value in headers.items()]
+
+
+async def _respond(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _respond_json(send, status, payload, headers=None):
+    headers = dict(CORS_HEADERS, **(headers or {}))
+    headers['Content-Type'] = 'application/json'
+    await _respond(send, status, json.dumps(payload, default=str).encode('utf-8'), headers)
+
+
+async def _respond_lambda(send, response):
+    """Send an API Gateway proxy response"""
+    body = response['body']
+    body = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+    await _respond(send, response['statusCode'], body, dict(CORS_HEADERS, **response['headers']))
+
+
+# Process-wide ASGI application
+app = BundleServer()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='Run the outfit bundle API as an ASGI server')
+    parser.add_argument('--host', default='0.0.0.0', help='Bind address (default: 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=8000, help='Port (default: 8000)')
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    print(f"Starting Outfit Bundle API on http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port, timeout_graceful_shutdown=int(SERVER_SHUTDOWN_GRACE_SECONDS) + 5)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Outfit Images - In-memory handling of uploaded outfit images
+"""
+import base64
+import os
+from io import BytesIO
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional - images are then sent as uploaded
+    Image = None
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+    HEIF_SUPPORT = True
+except ImportError:  # without pillow_heif HEIC uploads are rejected, since Bedrock does not take them
+    HEIF_SUPPORT = False
+
+# Downscaling before vision calls - colors and formality survive easily at this size
+IMAGE_MAX_EDGE = int(os.environ.get('IMAGE_MAX_EDGE', '1568'))
+IMAGE_JPEG_QUALITY = int(os.environ.get('IMAGE_JPEG_QUALITY', '85'))
+IMAGE_STRIP_METADATA = os.environ.get('IMAGE_STRIP_METADATA', '1') != '0'
+
+EXIF_ORIENTATION = 0x0112
+
+# Media types Bedrock accepts in image blocks
+BEDROCK_MEDIA_TYPES = ('image/jpeg', 'image/png', 'image/gif', 'image/webp')
+
+# Leading bytes of the image formats we recognize
+MAGIC_MEDIA_TYPES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+)
+
+
+def detect_media_type(header, default='image/jpeg'):
+    """Detect an image media type from its first bytes"""
+    for magic, media_type in MAGIC_MEDIA_TYPES:
+        if header.startswith(magic):
+            return media_type
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    if header[4:8] == b'ftyp' and header[8:12] in (b'heic', b'heix', b'mif1', b'msf1'):
+        return 'image/heic'
+    return default
+
+
+def can_send(media_type):
+    """True if an image of this media type can go to Bedrock, as it is or converted to JPEG"""
+    return media_type in BEDROCK_MEDIA_TYPES or (media_type == 'image/heic' and HEIF_SUPPORT)
+
+
+def preprocess_signature(max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY, strip_metadata=IMAGE_STRIP_METADATA):
+    """Short string identifying the preprocessing settings, for cache keys"""
+    if Image is None:
+        return 'original'
+    return f"{max_edge}q{quality}{'s' if strip_metadata else ''}"
+
+
+def preprocess_image(image, max_edge=IMAGE_MAX_EDGE, quality=IMAGE_JPEG_QUALITY, strip_metadata=IMAGE_STRIP_METADATA):
+    """
+    Downscale and re-encode an OutfitImage before it is sent to Bedrock.
+
+    Applies the EXIF orientation, caps the long edge at max_edge and
+    re-encodes as JPEG. Returns (image, stats), where image is the original
+    when Pillow is missing, decoding fails or nothing needs to change. With
+    strip_metadata the re-encoded image is sent even if it is larger, so
+    EXIF (GPS position, camera serial) never leaves with the upload.
+    Raises ValueError for an image Bedrock cannot take (HEIC) that could not
+    be converted.
+    """
+    original_size = len(image.data)
+    stats = {
+        'name': image.name,
+        'original_bytes': original_size,
+        'sent_bytes': original_size,
+        'bytes_saved': 0,
+        'resized': False
+    }
+    must_convert = image.media_type not in BEDROCK_MEDIA_TYPES
+    if Image is None:
+        if must_convert:
+            raise ValueError(f"{image.name} is {image.media_type}, which cannot be converted without Pillow")
+        return image, stats
+
+    try:
+        img = Image.open(BytesIO(image.data))
+        # Let the JPEG decoder downscale by a power of two while decoding
+        img.draft('RGB', (max_edge, max_edge))
+        rotated = img.getexif().get(EXIF_ORIENTATION, 1) != 1
+        if rotated:
+            img = ImageOps.exif_transpose(img)
+        exif = img.info.get('exif')
+
+        if max(img.size) > max_edge:
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            stats['resized'] = True
+
+        if not (stats['resized'] or rotated or strip_metadata or must_convert):
+            return image, stats
+
+        if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+            # JPEG has no alpha - flatten transparent product shots onto white, not black
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel('A'))
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        save_kwargs = {'quality': quality, 'optimize': True}
+        if exif and not strip_metadata:
+            save_kwargs['exif'] = exif
+
+        output = BytesIO()
+        img.save(output, format='JPEG', **save_kwargs)
+        processed = output.getvalue()
+    except Exception as e:
+        if must_convert:
+            raise ValueError(f"Could not convert {image.media_type} image {image.name}: {e}")
+        print(f"Error preprocessing outfit image {image.name}: {e}")
+        return image, stats
+
+    stats['sent_bytes'] = len(processed)
+    stats['bytes_saved'] = original_size - len(processed)
+    return OutfitImage(data=processed, name=image.name), stats
+
+
+class OutfitImage:
+    """
+    An outfit image held in memory as raw bytes and/or base64 text.
+
+    Whichever form the image arrives in is kept as-is and the other one is
+    only produced if something asks for it, so an upload that is already
+    base64 is never decoded and encoded again just to be carried around.
+    (preprocess_image may still re-encode it before the vision call.)
+    """
+
+    def __init__(self, data=None, base64_data=None, name=None):
+        if data is None and base64_data is None:
+            raise ValueError("OutfitImage needs raw bytes or base64 data")
+        self._data = data
+        self._base64 = base64_data
+        self._media_type = None
+        self.name = name
+
+    @classmethod
+    def from_path(cls, path):
+        """Read an image file (used by the CLI)"""
+        with open(path, 'rb') as f:
+            return cls(data=f.read(), name=os.path.basename(path))
+
+    @classmethod
+    def from_base64(cls, base64_data, name=None):
+        """Wrap base64 text or a data URL such as 'data:image/png;base64,....'"""
+        if isinstance(base64_data, (bytes, bytearray)):
+            base64_data = base64_data.decode('ascii')
+        # Remove data URL prefix if present
+        if ',' in base64_data:
+            base64_data = base64_data.split(',', 1)[1]
+        return cls(base64_data=base64_data, name=name)
+
+    @property
+    def data(self):
+        """Raw image bytes"""
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def base64(self):
+        """Base64 text of the image, as sent to Bedrock"""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode('ascii')
+        return self._base64
+
+    @property
+    def media_type(self):
+        """Media type detected from the image's magic bytes"""
+        if self._media_type is None:
+            if self._data is not None:
+                header = self._data[:16]
+            else:
+                try:
+                    # 16 base64 characters decode to the first 12 bytes
+                    header = base64.b64decode(self._base64[:16])
+                except ValueError:
+                    header = self.data[:16]
+            self._media_type = detect_media_type(header)
+        return self._media_type
@@ -0,0 +1,494 @@
+"""
+Product Catalog - Process-wide snapshot of the product table shared by all agents
+"""
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from product_classifier import get_classifier
+from product_record import ProductRecord, records_from_items
+from product_search import ProductSearchIndex
+
+# How long a snapshot is served as fresh before a background refresh is started
+CATALOG_TTL_SECONDS = float(os.environ.get('CATALOG_TTL_SECONDS', '300'))
+
+# Parallel scan settings - segments map to concurrent Scan workers
+CATALOG_SCAN_SEGMENTS = int(os.environ.get('CATALOG_SCAN_SEGMENTS', '4'))
+CATALOG_SCAN_PAGE_SIZE = int(os.environ.get('CATALOG_SCAN_PAGE_SIZE', '1000'))
+
+# Only the attributes the agent and API actually read
+CATALOG_FIELDS = ('product_id', 'product_name', 'price', 'product_type',
+                  'description', 'product_url', 'original_image_url')
+
+CATEGORIES = ('shoes', 'handbags', 'jewelry', 'clothing', 'other_accessories')
+
+# Partition key of the product table - change feed records are matched on it
+CATALOG_KEY = os.environ.get('CATALOG_KEY', 'product_id')
+
+
+def parse_price(value):
+    """Parse a price attribute such as '$1,299.00' into a float (None if unparseable)"""
+    try:
+        return float(str(value).replace('$', '').replace(',', ''))
+    except ValueError:
+        return None
+
+
+def categorize_product(item):
+    """Return the category a catalog item belongs to, or None"""
+    return get_classifier().primary(item)
+
+
+def scan_catalog(table, segments=CATALOG_SCAN_SEGMENTS, page_size=CATALOG_SCAN_PAGE_SIZE):
+    """Read the whole table with a parallel segmented scan, projected to CATALOG_FIELDS, as ProductRecords"""
+    from boto3.dynamodb.types import TypeDeserializer
+
+    # The low-level client is thread-safe, Table resources are not
+    client = table.meta.client
+    deserializer = TypeDeserializer()
+    attribute_names = {f'#f{i}': field for i, field in enumerate(CATALOG_FIELDS)}
+    # One table for the whole scan, so equal names and descriptions on different pages share one string
+    shared = {}
+
+    def scan_segment(segment):
+        items = []
+        kwargs = {
+            'TableName': table.name,
+            'Segment': segment,
+            'TotalSegments': segments,
+            'ProjectionExpression': ', '.join(attribute_names),
+            'ExpressionAttributeNames': attribute_names,
+            'Limit': page_size
+        }
+        while True:
+            response = client.scan(**kwargs)
+            # Converted page by page, so the scanned dicts never all exist at once
+            page = [{k: deserializer.deserialize(v) for k, v in raw.items()} for raw in response.get('Items', [])]
+            items.extend(to_records(page, shared))
+
+            last_key = response.get('LastEvaluatedKey')
+            if not last_key:
+                return items
+            kwargs['ExclusiveStartKey'] = last_key
+
+    with ThreadPoolExecutor(max_workers=segments, thread_name_prefix='catalog-scan') as pool:
+        segment_items = list(pool.map(scan_segment, range(segments)))
+
+    return [item for items in segment_items for item in items]
+
+
+def _spread_order(n):
+    """Indices 0..n-1 ordered coarse-to-fine so every prefix spans the whole range"""
+    order = []
+    seen = set()
+    step = 1 << n.bit_length()
+    while step:
+        for i in range(0, n, step):
+            if i not in seen:
+                seen.add(i)
+                order.append(i)
+        step >>= 1
+    return order
+
+
+class CategoryIndex:
+    """Products of one category sorted by price, answering price windows by bisection"""
+
+    def __init__(self, products):
+        self.products = sorted(products, key=lambda p: p['price_float'])
+        self.prices = array('d', (p['price_float'] for p in self.products))
+
+    @classmethod
+    def presorted(cls, products, prices):
+        """Index over sequences already sorted by price (e.g. columns of a catalog file)"""
+        index = cls.__new__(cls)
+        index.products = products
+        index.prices = prices
+        return index
+
+    def __len__(self):
+        return len(self.products)
+
+    def updated(self, removed, added):
+        """
+        Copy of this index with products removed and added, still price-sorted.
+
+        Removed products are found by key within their price run, so they only
+        need the price they were indexed at. The copy keeps readers of the old
+        index (and the snapshots sharing it) consistent while it is built.
+        """
+        products = list(self.products)
+        prices = array('d', self.prices)
+        for product in removed:
+            key = product.get(CATALOG_KEY)
+            price = product['price_float']
+            for i in range(bisect_left(prices, price), bisect_right(prices, price)):
+                if products[i].get(CATALOG_KEY) == key:
+                    del products[i]
+                    del prices[i]
+                    break
+        for product in added:
+            i = bisect_right(prices, product['price_float'])
+            products.insert(i, product)
+            prices.insert(i, product['price_float'])
+        return CategoryIndex.presorted(products, prices)
+
+    def _bounds(self, low, high):
+        start = bisect_left(self.prices, low) if low is not None else 0
+        stop = bisect_right(self.prices, high) if high is not None else len(self.prices)
+        return start, max(start, stop)
+
+    def count(self, low=None, high=None):
+        """Number of products priced in [low, high]"""
+        start, stop = self._bounds(low, high)
+        return stop - start
+
+    def between(self, low=None, high=None):
+        """Products priced in [low, high], cheapest first"""
+        start, stop = self._bounds(low, high)
+        return self.products[start:stop]
+
+    def sample(self, low, high, k):
+        """
+        Up to k products spread evenly over the price band [low, high].
+
+        The result is ordered coarse-to-fine, so any prefix of it is still
+        spread over the whole band rather than bunched at the cheap end.
+        """
+        start, stop = self._bounds(low, high)
+        n = stop - start
+        if n <= k:
+            positions = list(range(start, stop))
+        else:
+            positions = [start + (2 * i + 1) * n // (2 * k) for i in range(k)]
+        return [self.products[positions[i]] for i in _spread_order(len(positions))]
+
+
+def to_records(items, shared=None):
+    """
+    ProductRecords for scanned items, categorized in one classifier pass and
+    converted in one batch. Items without a parseable price get price_float
+    None; records pass through as they are. Calls that pass the same shared
+    dict share equal strings across batches (see records_from_items).
+    """
+    items = list(items)
+    pending = [item for item in items if not isinstance(item, ProductRecord)]
+    converted = iter(records_from_items(
+        pending,
+        [parse_price(item.get('price', '0')) for item in pending],
+        get_classifier().classify_many(pending),
+        shared
+    ))
+    return [item if isinstance(item, ProductRecord) else next(converted) for item in items]
+
+
+class CatalogSnapshot:
+    """Parsed, categorized and price-indexed view of the catalog as of one table scan"""
+
+    _versions = iter(range(1, 1 << 62))
+
+    def __init__(self, items, loaded_at=None):
+        self.loaded_at = loaded_at if loaded_at is not None else time.time()
+        self.version = next(self._versions)
+        records = to_records(items)
+        self.scanned_count = len(records)
+        self.items = [record for record in records if record.price_float is not None]
+        by_category = {category: [] for category in CATEGORIES}
+
+        # Rule tables may name other categories
+        for record in self.items:
+            if record.category in by_category:
+                by_category[record.category].append(record)
+
+        self.index = {category: CategoryIndex(products) for category, products in by_category.items()}
+        self.search = ProductSearchIndex(self.items)
+
+    @classmethod
+    def prebuilt(cls, items, index, search, loaded_at, scanned_count):
+        """Snapshot from an already categorized and indexed catalog (see catalog_file)"""
+        snapshot = cls.__new__(cls)
+        snapshot.loaded_at = loaded_at
+        snapshot.version = next(cls._versions)
+        snapshot.items = items
+        snapshot.scanned_count = scanned_count
+        # An empty index is falsy, so test for None to keep sharing it
+        snapshot.index = {category: index[category] if index.get(category) is not None else CategoryIndex([])
+                          for category in CATEGORIES}
+        snapshot.search = search
+        return snapshot
+
+    def age(self):
+        """Seconds since this snapshot was loaded"""
+        return time.time() - self.loaded_at
+
+    def by_key(self):
+        """Products keyed by CATALOG_KEY, built on first use"""
+        products = getattr(self, '_by_key', None)
+        if products is None:
+            products = self._by_key = {product.get(CATALOG_KEY): product for product in self.items}
+        return products
+
+    def with_changes(self, changes):
+        """
+        New snapshot with (key, item) upserts and (key, None) removals applied.
+
+        A product whose price or category changed is moved between price runs
+        and category indexes; categories without changes share their index with
+        this snapshot. Search corpus statistics are kept as they are until the
+        next full load.
+        """
+        products = dict(self.by_key())
+        classifier = get_classifier()
+        # Only the last change to a key in a batch matters
+        changes = dict(changes)
+        upserts = {key: item for key, item in changes.items() if item is not None}
+        upserts = dict(zip(upserts, to_records(upserts.values())))
+        removed = {category: [] for category in CATEGORIES}
+        added = {category: [] for category in CATEGORIES}
+        scanned_count = self.scanned_count
+
+        for key, item in changes.items():
+            old = products.pop(key, None)
+            if old is not None:
+                scanned_count -= 1
+                # Catalog file rows carry no category
+                category = old.category if isinstance(old, ProductRecord) else classifier.primary(old)
+                if category in removed:
+                    removed[category].append(old)
+            if item is None:
+                continue
+            scanned_count += 1
+            record = upserts[key]
+            if record.price_float is None:
+                continue
+            products[key] = record
+            if record.category in added:
+                added[record.category].append(record)
+
+        index = {
+            category: self.index[category].updated(removed[category], added[category])
+            if removed[category] or added[category] else self.index[category]
+            for category in CATEGORIES
+        }
+        snapshot = CatalogSnapshot.prebuilt(list(products.values()), index, self.search, self.loaded_at, scanned_count)
+        snapshot._by_key = products
+        return snapshot
+
+
+class CatalogCache:
+    """
+    Stale-while-revalidate cache around a catalog loader.
+
+    Only the very first request in a process waits on the loader. After that an
+    expired snapshot keeps being served while a single background thread
+    replaces it, so no request blocks on a table scan.
+
+    With a change feed attached (see catalog_changes), apply_changes() keeps
+    the snapshot current and fresh, and the TTL rescan only runs if the feed
+    stops. Changes applied while a rescan is running are replayed onto its
+    result, since the scan may have read those items before they changed.
+    """
+
+    def __init__(self, loader, ttl=CATALOG_TTL_SECONDS, seed=None, on_load=None):
+        # seed() may return a ready snapshot for the cold start (e.g. from a catalog file);
+        # on_load(snapshot) is called after every snapshot built from the loader
+        self.loader = loader
+        self.ttl = ttl
+        self.seed = seed
+        self.on_load = on_load
+        self.change_feed = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+        self._refreshing = False
+        self._replay = []
+        self._hits = 0
+        self._stale_hits = 0
+        self._misses = 0
+        self._refreshes = 0
+        self._refresh_errors = 0
+        self._first_load_seconds = None
+        self._last_load_seconds = None
+        self._changes_applied = 0
+        self._last_change_at = None
+
+    def get(self):
+        """Return the current snapshot, loading it synchronously only on a cold start"""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                if snapshot.age() < self.ttl:
+                    self._hits += 1
+                else:
+                    self._stale_hits += 1
+                    self._start_refresh()
+                return snapshot
+            self._misses += 1
+
+        # Cold start - concurrent callers wait for one shared load
+        with self._load_lock:
+            if self._snapshot is None:
+                self._swap_in(self._seed() or self._load())
+            return self._snapshot
+
+    def peek(self):
+        """The current snapshot, stale or not, without loading or refreshing it (None before the first load)"""
+        with self._lock:
+            return self._snapshot
+
+    def apply_changes(self, changes):
+        """
+        Apply (key, item) upserts and (key, None) removals to the current snapshot.
+
+        Applied changes keep a fresh snapshot fresh; a stale one (e.g. an old seed)
+        stays due for a rescan, since the feed only covers changes made after it
+        started. An empty batch changes nothing: a feed that delivers no records
+        (a wrong path, a stalled producer) cannot be told from an idle one, so the
+        TTL rescan still runs while the feed is quiet.
+        """
+        with self._apply_lock:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or self._refreshing:
+                    # The load in progress may have read these items before they changed
+                    self._replay.extend(changes)
+            if snapshot is None:
+                return None
+
+            if not changes:
+                return snapshot
+
+            updated = snapshot.with_changes(changes)
+            if snapshot.age() < self.ttl:
+                updated.loaded_at = time.time()
+
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._snapshot = updated
+                self._changes_applied += len(changes)
+                self._last_change_at = time.time()
+            return updated
+
+    def invalidate(self):
+        """Drop the current snapshot so the next get() reloads it"""
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self):
+        """Hit/miss counters and the age of the current snapshot"""
+        change_feed = self.change_feed.stats() if self.change_feed is not None else None
+        with self._lock:
+            snapshot = self._snapshot
+            return {
+                'hits': self._hits,
+                'stale_hits': self._stale_hits,
+                'misses': self._misses,
+                'refreshes': self._refreshes,
+                'refresh_errors': self._refresh_errors,
+                'refreshing': self._refreshing,
+                'ttl_seconds': self.ttl,
+                'version': snapshot.version if snapshot else None,
+                'item_count': len(snapshot.items) if snapshot else 0,
+                'age_seconds': round(snapshot.age(), 3) if snapshot else None,
+                'first_load_seconds': self._first_load_seconds,
+                'last_load_seconds': self._last_load_seconds,
+                'changes_applied': self._changes_applied,
+                'last_change_age_seconds': round(time.time() - self._last_change_at, 3) if self._last_change_at else None,
+                'change_feed': change_feed
+            }
+
+    def _seed(self):
+        if self.seed is None:
+            return None
+        started = time.perf_counter()
+        try:
+            snapshot = self.seed()
+        except Exception as e:
+            print(f"Error loading seed catalog: {e}")
+            return None
+        if snapshot is not None:
+            self._first_load_seconds = time.perf_counter() - started
+            self._last_load_seconds = self._first_load_seconds
+        # loaded_at is when the seed was built, so an old seed is refreshed by the next get()
+        return snapshot
+
+    def _load(self):
+        started = time.perf_counter()
+        snapshot = CatalogSnapshot(self.loader())
+        self._last_load_seconds = time.perf_counter() - started
+        if self._first_load_seconds is None:
+            self._first_load_seconds = self._last_load_seconds
+        if self.on_load is not None:
+            self.on_load(snapshot)
+        return snapshot
+
+    def _swap_in(self, snapshot):
+        """Make a loaded snapshot current, replaying changes applied while it loaded"""
+        # No change can be applied between taking the replay and the swap
+        with self._apply_lock:
+            with self._lock:
+                replay, self._replay = self._replay, []
+            if replay:
+                loaded_at = snapshot.loaded_at
+                snapshot = snapshot.with_changes(replay)
+                snapshot.loaded_at = loaded_at
+            with self._lock:
+                self._snapshot = snapshot
+
+    def _start_refresh(self):
+        # Caller holds self._lock
+        if self._refreshing:
+            return
+        self._refreshing = True
+        self._replay = []
+        threading.Thread(target=self._refresh, name='catalog-refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self._swap_in(self._load())
+            with self._lock:
+                self._refreshes += 1
+        except Exception as e:
+            # Keep serving the stale snapshot; the next expired get() retries
+            print(f"Error refreshing catalog: {e}")
+            with self._lock:
+                self._refresh_errors += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_catalog_cache(table, ttl=CATALOG_TTL_SECONDS):
+    """Return the process-wide catalog cache for a DynamoDB table"""
+    with _caches_lock:
+        cache = _caches.get(table.name)
+        if cache is None:
+            from catalog_file import CATALOG_FILE, export_in_background, load_fresh_snapshot
+            if CATALOG_FILE:
+                cache = CatalogCache(
+                    lambda: scan_catalog(table), ttl=ttl,
+                    seed=lambda: load_fresh_snapshot(CATALOG_FILE, table),
+                    on_load=lambda snapshot: export_in_background(snapshot, CATALOG_FILE, table.name)
+                )
+            else:
+                cache = CatalogCache(lambda: scan_catalog(table), ttl=ttl)
+
+            from catalog_changes import CATALOG_CHANGE_FEED, ChangeFeedConsumer, FileChangeFeed
+            if CATALOG_CHANGE_FEED:
+                cache.change_feed = ChangeFeedConsumer(cache, FileChangeFeed(CATALOG_CHANGE_FEED)).start()
+            _caches[table.name] = cache
+        return cache
+
+
+def catalog_stats():
+    """Stats for every catalog cache in this process, keyed by table name"""
+    with _caches_lock:
+        caches = dict(_caches)
+    return {name: cache.stats() for name, cache in caches.items()}
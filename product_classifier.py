@@ -0,0 +1,165 @@
+"""
+Product Classifier - Compiled keyword rules that assign catalog items to categories
+"""
+import json
+import os
+import re
+import threading
+
+# JSON file with the same shape as DEFAULT_RULES; empty means the built-in rules
+PRODUCT_RULES_PATH = os.environ.get('PRODUCT_RULES_PATH', '')
+
+# Category -> product_type values and product name keywords, in priority order.
+# Keywords match whole words in the singular or a plural form ("earrings" but not
+# "spring", "hats" but not "hates"). Regular plurals are derived; "plurals" lists
+# the forms of keywords that do not follow the rules (an empty list: no plural).
+DEFAULT_RULES = {
+    'shoes': {
+        'product_types': ['FOOTWEAR'],
+        'keywords': []
+    },
+    'handbags': {
+        'product_types': ['BAG', 'HANDBAG', 'HANDBAGS'],
+        'keywords': ['bag', 'handbag', 'tote', 'purse', 'clutch', 'crossbody']
+    },
+    'jewelry': {
+        'product_types': ['JEWELRY', 'JEWELLERY'],
+        'keywords': ['necklace', 'earring', 'bracelet', 'ring', 'jewelry', 'jewellery']
+    },
+    'clothing': {
+        'product_types': ['CLOTHING', 'APPAREL', 'TOP', 'BOTTOM', 'DRESS'],
+        'keywords': []
+    },
+    'other_accessories': {
+        'product_types': ['ACCESSORIES', 'ACCESSORY'],
+        'keywords': ['scarf', 'hat', 'belt', 'sunglasses', 'wallet'],
+        'plurals': {'scarf': ['scarfs', 'scarves'], 'sunglasses': []}
+    }
+}
+
+
+def _regular_plural(word):
+    if word.endswith(('s', 'x', 'z', 'ch', 'sh')):
+        return word + 'es'
+    if len(word) > 1 and word.endswith('y') and word[-2] not in 'aeiou':
+        return word[:-1] + 'ies'
+    return word + 's'
+
+
+def _keyword_forms(keyword, plurals=None):
+    """Singular and plural forms of a keyword, lowercased"""
+    keyword = keyword.lower()
+    forms = (plurals or {}).get(keyword)
+    if forms is None:
+        forms = [_regular_plural(keyword)]
+    return {keyword, *(form.lower() for form in forms)}
+
+
+class ProductClassifier:
+    """
+    Category rules compiled once: a product_type lookup plus a word-boundary regex per category.
+
+    classify() returns every matching category (multi-label) in rule order;
+    primary() picks the product_type category when there is one, otherwise
+    the first keyword category. Names are screened with plain substring checks
+    first, so the regex only runs on names that contain a keyword somewhere.
+    """
+
+    def __init__(self, rules):
+        self.categories = list(rules)
+        self.type_categories = {}
+        self.keyword_rules = []
+        for position, (category, rule) in enumerate(rules.items()):
+            for product_type in rule.get('product_types', []):
+                self.type_categories.setdefault(product_type.upper(), position)
+            plurals = {keyword.lower(): forms for keyword, forms in rule.get('plurals', {}).items()}
+            forms = set()
+            for keyword in rule.get('keywords', []):
+                forms |= _keyword_forms(keyword, plurals)
+            if forms:
+                forms = sorted(forms, key=lambda form: (-len(form), form))
+                pattern = re.compile(r"\b(?:%s)\b" % '|'.join(re.escape(form) for form in forms))
+                # Substring screen: forms containing a shorter form ("hats" - "hat") add nothing
+                screen = tuple(form for form in forms if not any(other != form and other in form for other in forms))
+                self.keyword_rules.append((position, screen, pattern))
+
+    @classmethod
+    def from_file(cls, path):
+        """Classifier from a JSON rule table"""
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def _type_position(self, item):
+        return self.type_categories.get(str(item.get('product_type', '')).upper())
+
+    def _name_positions(self, name, first_only=False):
+        """Rule positions whose keywords occur in the name as whole words"""
+        positions = []
+        for position, keywords, pattern in self.keyword_rules:
+            for keyword in keywords:
+                if keyword in name:
+                    # A substring hit may still be inside another word ("spring")
+                    if pattern.search(name):
+                        positions.append(position)
+                        if first_only:
+                            return positions
+                    break
+        return positions
+
+    def classify(self, item):
+        """Every category an item matches, in rule order"""
+        positions = set(self._name_positions(str(item.get('product_name', '')).lower()))
+        type_position = self._type_position(item)
+        if type_position is not None:
+            positions.add(type_position)
+        return tuple(self.categories[position] for position in sorted(positions))
+
+    def primary(self, item):
+        """The single category an item is listed under, or None"""
+        type_position = self._type_position(item)
+        if type_position is None:
+            positions = self._name_positions(str(item.get('product_name', '')).lower(), first_only=True)
+            type_position = positions[0] if positions else None
+        return self.categories[type_position] if type_position is not None else None
+
+    def classify_many(self, items, multi_label=False):
+        """Classify a batch in one pass: label tuples per item (multi_label) or primary categories"""
+        if multi_label:
+            return [self.classify(item) for item in items]
+
+        # primary() inlined with locals - this runs over the whole catalog on every refresh
+        categories = self.categories
+        type_categories = self.type_categories
+        keyword_rules = self.keyword_rules
+        results = []
+        for item in items:
+            position = type_categories.get(str(item.get('product_type', '')).upper())
+            if position is None:
+                name = str(item.get('product_name', '')).lower()
+                for rule_position, keywords, pattern in keyword_rules:
+                    for keyword in keywords:
+                        if keyword in name:
+                            if pattern.search(name):
+                                position = rule_position
+                            break
+                    if position is not None:
+                        break
+            results.append(categories[position] if position is not None else None)
+        return results
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier():
+    """Process-wide classifier built from PRODUCT_RULES_PATH (or DEFAULT_RULES)"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            try:
+                _classifier = ProductClassifier.from_file(PRODUCT_RULES_PATH) if PRODUCT_RULES_PATH else ProductClassifier(DEFAULT_RULES)
+            except (OSError, ValueError) as e:
+                print(f"Error loading product rules from {PRODUCT_RULES_PATH}: {e}")
+                _classifier = ProductClassifier(DEFAULT_RULES)
+        return _classifier
@@ -0,0 +1,107 @@
+"""
+Product Record - Compact read-only catalog products
+"""
+import sys
+
+# The attributes kept per product; price is kept only as price_float
+RECORD_FIELDS = ('product_id', 'product_name', 'price_float', 'product_type', 'description',
+                 'product_url', 'original_image_url', 'category')
+
+_FIELD_SET = frozenset(RECORD_FIELDS)
+_MISSING = object()
+
+
+class ProductRecord:
+    """
+    One catalog product in __slots__, with the dict get()/[] interface.
+
+    A record has no per-item hash table and no attributes the agent never
+    reads, and equal product_type, category, name and description strings
+    are shared between records. Records cannot be modified; 'price' is formatted from
+    price_float and 'category' is the category assigned when it was built.
+    """
+
+    __slots__ = RECORD_FIELDS
+
+    def get(self, key, default=None):
+        if key in _FIELD_SET:
+            value = getattr(self, key)
+            return default if value is None else value
+        if key == 'price' and self.price_float is not None:
+            return f"${self.price_float:,.2f}"
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def keys(self):
+        return [key for key in (*RECORD_FIELDS, 'price') if key in self]
+
+    def to_dict(self):
+        return {key: self.get(key) for key in self.keys()}
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ProductRecord is read-only ({name})")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ProductRecord is read-only ({name})")
+
+    def __reduce__(self):
+        return _from_values, (tuple(getattr(self, field) for field in RECORD_FIELDS),)
+
+    def __repr__(self):
+        return f"ProductRecord({self.product_id!r}, {self.product_name!r}, {self.price_float!r})"
+
+
+# Slot setters bypass the read-only __setattr__ while a record is built
+_SETTERS = tuple(ProductRecord.__dict__[field].__set__ for field in RECORD_FIELDS)
+
+
+def _from_values(values):
+    record = object.__new__(ProductRecord)
+    for setter, value in zip(_SETTERS, values):
+        setter(record, value)
+    return record
+
+
+def _text(value):
+    # Scans deserialize numbers as Decimal; every kept field is text
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def records_from_items(items, prices, categories, shared=None):
+    """
+    Records for scanned items in one pass, given each item's parsed price (or None) and category.
+    Equal product_type, category, name and description strings become one shared object; pass
+    the same shared dict to every batch of one catalog build to share them across batches.
+    """
+    if shared is None:
+        shared = {}
+    share = shared.setdefault
+    intern = sys.intern
+    (set_id, set_name, set_price, set_type, set_description, set_url, set_image_url, set_category) = _SETTERS
+    new = object.__new__
+
+    records = []
+    for item, price, category in zip(items, prices, categories):
+        get = item.get
+        record = new(ProductRecord)
+        set_id(record, _text(get('product_id')))
+        name = _text(get('product_name'))
+        set_name(record, share(name, name) if name is not None else None)
+        set_price(record, float(price) if price is not None else None)
+        product_type = _text(get('product_type'))
+        set_type(record, intern(product_type) if product_type is not None else None)
+        description = _text(get('description'))
+        set_description(record, share(description, description) if description is not None else None)
+        set_url(record, _text(get('product_url')))
+        set_image_url(record, _text(get('original_image_url')))
+        set_category(record, intern(category) if category is not None else None)
+        records.append(record)
+    return records
@@ -0,0 +1,83 @@
+"""
+Product Search - BM25 relevance of catalog products to outfit descriptions
+"""
+import math
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can for from has have in into is it its of on or
+that the their this to with will which what would your you outfit
+""".split())
+
+# Standard BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords"""
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS and len(token) > 1]
+
+
+def product_text(product):
+    """Text a product is matched on"""
+    return f"{product.get('product_name', '')} {product.get('description', '')}"
+
+
+class ProductSearchIndex:
+    """
+    BM25 corpus statistics (document frequencies, average length) for one catalog snapshot.
+
+    The statistics are computed once when a snapshot is built. Scoring only
+    touches the candidate products passed in, so a request costs time
+    proportional to its candidate pool rather than to the catalog.
+    """
+
+    def __init__(self, products):
+        document_frequency = Counter()
+        total_length = 0
+
+        for product in products:
+            tokens = tokenize(product_text(product))
+            total_length += len(tokens)
+            document_frequency.update(set(tokens))
+
+        self.doc_count = len(products)
+        self.average_length = (total_length / self.doc_count) if self.doc_count else 1.0
+        self.idf = {
+            term: math.log(1 + (self.doc_count - count + 0.5) / (count + 0.5))
+            for term, count in document_frequency.items()
+        }
+
+    @classmethod
+    def from_stats(cls, doc_count, average_length, idf):
+        """Index from previously computed statistics (see stats())"""
+        index = cls.__new__(cls)
+        index.doc_count = doc_count
+        index.average_length = average_length
+        index.idf = idf
+        return index
+
+    def stats(self):
+        """Corpus statistics as plain data, for storing next to the catalog"""
+        return {'doc_count': self.doc_count, 'average_length': self.average_length, 'idf': self.idf}
+
+    def score(self, query_text, products):
+        """BM25 score of each product against the query, in input order"""
+        query = [(term, count * self.idf[term]) for term, count in Counter(tokenize(query_text)).items() if term in self.idf]
+        if not query:
+            return [0.0] * len(products)
+
+        scores = []
+        for product in products:
+            tokens = tokenize(product_text(product))
+            counts = Counter(tokens)
+            norm = K1 * (1 - B + B * len(tokens) / self.average_length)
+            scores.append(sum(
+                weight * counts[term] * (K1 + 1) / (counts[term] + norm)
+                for term, weight in query if term in counts
+            ))
+        return scores
@@ -0,0 +1,135 @@
+"""
+Request Metrics - Per-request timing spans and counters, logged as CloudWatch EMF
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# 'emf' (CloudWatch Embedded Metric Format), 'json' (plain structured line) or 'off'
+METRICS_FORMAT = os.environ.get('METRICS_FORMAT', 'emf')
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'OutfitBundles')
+METRICS_SERVICE = os.environ.get('METRICS_SERVICE', 'outfit-bundle-api')
+
+# CloudWatch allows at most 100 metrics per EMF document
+EMF_MAX_METRICS = 100
+
+
+def _unit(name):
+    if name.endswith('_ms'):
+        return 'Milliseconds'
+    if name.endswith('_bytes'):
+        return 'Bytes'
+    return 'Count'
+
+
+class RequestMetrics:
+    """
+    Timing spans, counters and properties collected while serving one request.
+
+    Spans may be recorded from several threads (the image analysis pool and the
+    catalog load run concurrently), so every update takes a lock. Stage totals
+    are the summed span durations per name, which can exceed the wall time when
+    stages overlap.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.timestamp = int(time.time() * 1000)
+        self.spans = []
+        self.counters = {}
+        self.properties = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time a block; the yielded dict can be filled with attributes while it runs"""
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException:
+            attributes['error'] = True
+            raise
+        finally:
+            finished = time.perf_counter()
+            span = {
+                'name': name,
+                'start_ms': round((started - self.started) * 1000, 2),
+                'ms': round((finished - started) * 1000, 2)
+            }
+            span.update(attributes)
+            with self._lock:
+                self.spans.append(span)
+
+    def add(self, name, value):
+        """Add to a counter such as bundling_input_tokens or request_bytes"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        """Record a request property such as catalog_size or a cache flag"""
+        with self._lock:
+            self.properties[name] = value
+
+    def elapsed_ms(self):
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+    def stage_totals(self):
+        """Milliseconds per span name"""
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for span in spans:
+            totals[span['name']] = round(totals.get(span['name'], 0) + span['ms'], 2)
+        return totals
+
+    def timings(self):
+        """The optional 'timings' section of an API response"""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start_ms'])
+            counters = dict(self.counters)
+        return {
+            'total_ms': self.elapsed_ms(),
+            'stages': self.stage_totals(),
+            'spans': spans,
+            'counters': counters
+        }
+
+    def emf(self):
+        """CloudWatch Embedded Metric Format document for this request"""
+        values = {'total_ms': self.elapsed_ms()}
+        for name, ms in self.stage_totals().items():
+            values[f"{name}_ms"] = ms
+        with self._lock:
+            values.update(self.counters)
+            properties = dict(self.properties)
+            spans = list(self.spans)
+
+        metric_names = list(values)[:EMF_MAX_METRICS]
+        document = {
+            '_aws': {
+                'Timestamp': self.timestamp,
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['Service']],
+                    'Metrics': [{'Name': name, 'Unit': _unit(name)} for name in metric_names]
+                }]
+            },
+            'Service': METRICS_SERVICE
+        }
+        document.update(properties)
+        document.update(values)
+        # Not metrics, but searchable in CloudWatch Logs Insights
+        document['spans'] = spans
+        return document
+
+    def emit(self):
+        """Write this request's metrics as one log line (see METRICS_FORMAT)"""
+        if METRICS_FORMAT == 'off':
+            return
+        if METRICS_FORMAT == 'json':
+            line = dict(self.properties, **self.timings())
+        else:
+            line = self.emf()
+        print(json.dumps(line, default=str))
@@ -0,0 +1,119 @@
+"""
+Response Cache - End-to-end cache of bundle responses with single-flight coalescing
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', '600'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '256'))
+
+
+def _normalize(value):
+    if isinstance(value, str):
+        return ' '.join(value.lower().split()) or None
+    return value
+
+
+def response_key(image_data_list, age, gender, occasion, season, budget, catalog_version, pipeline='two_stage'):
+    """Cache key from image contents, the normalized request context, the catalog snapshot and the pipeline mode"""
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        pass
+    key_data = {
+        'images': [hashlib.sha256(image_data).hexdigest() for image_data in image_data_list],
+        'context': [_normalize(age), _normalize(gender), _normalize(occasion), _normalize(season), budget],
+        'catalog': catalog_version,
+        'pipeline': pipeline
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of computed responses.
+
+    Concurrent callers with the same key share one computation: the first
+    caller runs it and the rest wait on its result instead of racing.
+    """
+
+    def __init__(self, ttl=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._coalesced = 0
+        self._misses = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Return (value, status) where status is 'hit', 'coalesced' or 'miss'.
+        compute() returns (value, cacheable); exceptions reach every waiting caller.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return value, 'hit'
+                del self._entries[key]
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self._coalesced += 1
+                leader = False
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self._misses += 1
+                leader = True
+
+        if not leader:
+            return future.result(), 'coalesced'
+
+        try:
+            value, cacheable = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if cacheable:
+                self._entries[key] = (time.time() + self.ttl, value)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        future.set_result(value)
+        return value, 'miss'
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/coalesced/miss counters and current size"""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'coalesced': self._coalesced,
+                'misses': self._misses,
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl
+            }
+
+
+# Process-wide cache shared by all requests
+response_cache = ResponseCache()
@@ -0,0 +1,127 @@
+"""
+parse_multipart / parse_request: every upload format decodes to the same fields and images
+"""
+import base64
+import json
+
+import pytest
+
+import outfit_images
+from api_payloads import MAX_IMAGES, RequestError, parse_multipart, parse_request
+
+BOUNDARY = 'XyZ-boundary-123'
+JPEG = b'\xff\xd8\xff\xe0 fake jpeg \r\n--not-the-boundary\r\n \x00\xff\xd9'
+PNG = b'\x89PNG\r\n\x1a\n fake png'
+HEIC = b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic fake heic'
+
+
+def part(name, content, filename=None, content_type=None):
+    disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+    head = f'Content-Disposition: {disposition}\r\n'
+    if content_type:
+        head += f'Content-Type: {content_type}\r\n'
+    return head.encode('latin-1') + b'\r\n' + content
+
+
+def multipart(*parts, boundary=BOUNDARY):
+    delimiter = b'--' + boundary.encode('latin-1')
+    body = b''.join(delimiter + b'\r\n' + p + b'\r\n' for p in parts)
+    return body + delimiter + b'--\r\n'
+
+
+def test_multipart_fields_and_images():
+    data = multipart(
+        part('age', b'25'),
+        part('budget', b'149.5'),
+        part('photo', JPEG, filename='look.jpg', content_type='image/jpeg'),
+        part('request', json.dumps({'occasion': 'wedding', 'timings': True}).encode()),
+        part('second', PNG, content_type='image/png'),
+    )
+    fields, images = parse_multipart(data, BOUNDARY)
+
+    assert fields == {'age': '25', 'budget': 149.5, 'occasion': 'wedding', 'timings': True}
+    assert [image.data for image in images] == [JPEG, PNG]
+    assert [image.name for image in images] == ['look.jpg', 'outfit_2']
+
+
+def test_multipart_without_images_is_rejected():
+    with pytest.raises(RequestError) as error:
+        parse_multipart(multipart(part('age', b'25')), BOUNDARY)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('data, boundary', [
+    (b'no delimiter here', BOUNDARY),
+    (b'--' + BOUNDARY.encode() + b'\r\nContent-Disposition: form-data; name="a"\r\n\r\nunterminated', BOUNDARY),
+    (multipart(part('photo', JPEG, filename='a.jpg')), None),
+])
+def test_malformed_multipart_is_rejected(data, boundary):
+    with pytest.raises(RequestError) as error:
+        parse_multipart(data, boundary)
+    assert error.value.status_code == 400
+
+
+def test_invalid_number_and_request_part_are_rejected():
+    for bad in (part('budget', b'lots'), part('request', b'{not json')):
+        with pytest.raises(RequestError) as error:
+            parse_multipart(multipart(bad, part('photo', JPEG, filename='a.jpg')), BOUNDARY)
+        assert error.value.status_code == 400
+
+
+def test_too_many_images_is_rejected():
+    parts = [part(f'p{i}', JPEG, filename=f'{i}.jpg') for i in range(MAX_IMAGES + 1)]
+    with pytest.raises(RequestError) as error:
+        parse_multipart(multipart(*parts), BOUNDARY)
+    assert error.value.status_code == 413
+
+
+def test_formats_agree():
+    encoded = base64.b64encode(JPEG).decode('ascii')
+    events = [
+        {'body': json.dumps({'images': [encoded], 'age': '25'})},
+        {'body': base64.b64encode(multipart(part('age', b'25'), part('photo', JPEG, filename='a.jpg'))).decode('ascii'),
+         'isBase64Encoded': True,
+         'headers': {'content-type': f'multipart/form-data; boundary="{BOUNDARY}"'}},
+        {'body': encoded, 'isBase64Encoded': True,
+         'headers': {'Content-Type': 'image/jpeg'}, 'queryStringParameters': {'age': '25'}},
+    ]
+    for event in events:
+        fields, images = parse_request(event)
+        assert fields['age'] == '25'
+        assert [image.data for image in images] == [JPEG]
+
+
+@pytest.mark.parametrize('event', [
+    {'body': None},
+    {'body': '[1, 2]'},
+    {'body': '{"images": []}'},
+    {'body': '{"images": [42]}'},
+    {'body': 'not json'},
+])
+def test_bad_json_requests_are_rejected(event):
+    with pytest.raises(RequestError) as error:
+        parse_request(event)
+    assert error.value.status_code == 400
+
+
+def test_heic_without_decoder_is_rejected_by_name(monkeypatch):
+    monkeypatch.setattr(outfit_images, 'HEIF_SUPPORT', False)
+    encoded = base64.b64encode(HEIC).decode('ascii')
+    events = [
+        {'body': json.dumps({'images': [base64.b64encode(JPEG).decode('ascii'), encoded]})},
+        {'body': base64.b64encode(multipart(part('photo', HEIC, filename='IMG_0001.HEIC'))).decode('ascii'),
+         'isBase64Encoded': True, 'headers': {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}},
+        {'body': encoded, 'isBase64Encoded': True, 'headers': {'Content-Type': 'image/heic'}},
+    ]
+    for event in events:
+        with pytest.raises(RequestError) as error:
+            parse_request(event)
+        assert error.value.status_code == 400
+        assert 'image/heic' in error.value.message
+
+
+def test_heic_is_accepted_with_decoder(monkeypatch):
+    monkeypatch.setattr(outfit_images, 'HEIF_SUPPORT', True)
+    _, images = parse_request({'body': json.dumps({'images': [base64.b64encode(HEIC).decode('ascii')]})})
+
+    assert images[0].media_type == 'image/heic'
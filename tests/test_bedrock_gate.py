@@ -0,0 +1,195 @@
+"""
+AdaptiveLimiter and BedrockGate: AIMD window, retries, deadlines and hedging
+"""
+import io
+import threading
+import time
+
+import pytest
+
+import bedrock_gate
+from bedrock_gate import AdaptiveLimiter, BedrockDeadlineExceeded, BedrockGate, BedrockThrottled
+
+
+class FakeClientError(Exception):
+    """Shaped like botocore's ClientError, which the gate reads the error code from"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.response = {'Error': {'Code': code}}
+
+
+class ScriptedClient:
+    """
+    invoke_model stand-in: each call takes the next step of the script (the
+    last one repeats). A step is an error code to raise, or (seconds, body).
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke_model(self, modelId, body):
+        with self._lock:
+            step = self.script[min(self.calls, len(self.script) - 1)]
+            self.calls += 1
+        if isinstance(step, str):
+            raise FakeClientError(step)
+        seconds, data = step
+        time.sleep(seconds)
+        return {'body': io.BytesIO(data)}
+
+
+def gate(limiter=None, **kwargs):
+    kwargs.setdefault('backoff_base', 0.001)
+    kwargs.setdefault('backoff_cap', 0.01)
+    return BedrockGate(limiter=limiter or AdaptiveLimiter(initial=8, minimum=1, maximum=16), **kwargs)
+
+
+def test_limit_halves_on_throttle_and_recovers_additively():
+    limiter = AdaptiveLimiter(initial=8, minimum=1, maximum=16)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+
+    limiter.release('throttled', started)
+    assert limiter.limit == 4
+    # Same burst - started before the decrease, so it does not count again
+    limiter.release('throttled', started)
+    assert limiter.limit == 4
+    limiter.release('error', started)
+    assert limiter.limit == 4
+
+    successes = 0
+    while limiter.limit < 8:
+        limiter.acquire()
+        limiter.release('ok', time.monotonic())
+        successes += 1
+    # About one step per window of successes: 4 -> 8 takes roughly 4 + 5 + 6 + 7
+    assert 18 <= successes <= 26
+
+    # A call started after the last decrease halves it again
+    recovered = limiter.limit
+    limiter.acquire()
+    limiter.release('throttled', time.monotonic())
+    assert limiter.limit == pytest.approx(recovered / 2)
+
+
+def test_limit_stays_within_bounds():
+    limiter = AdaptiveLimiter(initial=2, minimum=2, maximum=3)
+    for _ in range(5):
+        limiter.acquire()
+        limiter.release('throttled', time.monotonic())
+    assert limiter.limit == 2
+
+    for _ in range(50):
+        limiter.acquire()
+        limiter.release('ok', time.monotonic())
+    assert limiter.limit == 3
+
+
+def test_acquire_waits_for_a_slot_until_its_deadline():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+    assert limiter.acquire()
+    assert not limiter.try_acquire()
+
+    started = time.monotonic()
+    assert not limiter.acquire(deadline=started + 0.05)
+    assert 0.04 <= time.monotonic() - started < 1
+
+    threading.Timer(0.05, limiter.release, args=('ok',)).start()
+    assert limiter.acquire(deadline=time.monotonic() + 5)
+    assert limiter.in_flight == 1
+
+
+def test_throttled_call_is_retried_and_narrows_the_window():
+    bedrock = gate()
+    client = ScriptedClient('ThrottlingException', 'ThrottlingException', (0, b'{"ok": true}'))
+
+    assert bedrock.invoke(client, 'model', '{}') == b'{"ok": true}'
+    stats = bedrock.stats()
+    assert client.calls == 3
+    assert stats['throttles'] == 2 and stats['retries'] == 2
+    assert stats['limit'] < 8
+    assert stats['in_flight'] == 0
+
+
+def test_gives_up_after_max_attempts():
+    bedrock = gate(max_attempts=3)
+    client = ScriptedClient('ServiceUnavailableException')
+
+    with pytest.raises(BedrockThrottled):
+        bedrock.invoke(client, 'model', '{}')
+    assert client.calls == 3
+    assert bedrock.stats()['gave_up'] == 1
+
+
+def test_other_errors_are_not_retried():
+    bedrock = gate()
+    client = ScriptedClient('ValidationException')
+
+    with pytest.raises(FakeClientError):
+        bedrock.invoke(client, 'model', '{}')
+    assert client.calls == 1
+
+
+def test_slow_call_raises_at_its_deadline():
+    bedrock = gate()
+    client = ScriptedClient((0.5, b'late'))
+
+    started = time.monotonic()
+    with pytest.raises(BedrockDeadlineExceeded):
+        bedrock.invoke(client, 'model', '{}', deadline=started + 0.05)
+    assert time.monotonic() - started < 0.4
+    assert bedrock.stats()['deadline_exceeded'] == 1
+
+
+def test_deadline_while_waiting_for_a_slot():
+    limiter = AdaptiveLimiter(initial=1, minimum=1, maximum=1)
+    bedrock = gate(limiter)
+    limiter.acquire()
+
+    with pytest.raises(BedrockDeadlineExceeded):
+        bedrock.invoke(ScriptedClient((0, b'ok')), 'model', '{}', deadline=time.monotonic() + 0.05)
+
+
+def test_no_retry_past_the_deadline(monkeypatch):
+    # Longest backoff every time: 1s, well past the deadline
+    monkeypatch.setattr(bedrock_gate.random, 'uniform', lambda low, high: high)
+    bedrock = gate(backoff_base=1, backoff_cap=8)
+    client = ScriptedClient('ThrottlingException', (0, b'ok'))
+
+    started = time.monotonic()
+    with pytest.raises(BedrockDeadlineExceeded):
+        bedrock.invoke(client, 'model', '{}', deadline=started + 0.2)
+    assert client.calls == 1
+    assert time.monotonic() - started < 0.2
+
+
+def test_hedge_wins_when_a_slot_is_spare():
+    bedrock = gate(hedge_after=0.05)
+    client = ScriptedClient((0.5, b'slow'), (0, b'fast'))
+
+    started = time.monotonic()
+    assert bedrock.invoke(client, 'model', '{}', hedge=True) == b'fast'
+    assert time.monotonic() - started < 0.4
+    stats = bedrock.stats()
+    assert stats['hedges'] == 1 and stats['hedge_wins'] == 1
+
+
+def test_no_hedge_without_a_spare_slot():
+    bedrock = gate(AdaptiveLimiter(initial=1, minimum=1, maximum=1), hedge_after=0.02)
+    client = ScriptedClient((0.1, b'only'), (0, b'hedge'))
+
+    assert bedrock.invoke(client, 'model', '{}', hedge=True) == b'only'
+    assert client.calls == 1
+    assert bedrock.stats()['hedges'] == 0
+
+
+def test_hedging_is_off_for_unhedged_calls():
+    bedrock = gate(hedge_after=0.02)
+    client = ScriptedClient((0.1, b'only'), (0, b'hedge'))
+
+    assert bedrock.invoke(client, 'model', '{}') == b'only'
+    assert client.calls == 1
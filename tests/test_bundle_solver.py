@@ -0,0 +1,152 @@
+"""
+BundleSolver: every bundle it returns fits its price window
+"""
+import itertools
+import random
+
+import pytest
+
+from bundle_solver import MAX_EXTRAS, BundleSolver
+
+BUDGET = 200.0
+
+
+def product_maps(prices):
+    """{'S': {'S1': product, ...}, ...} from {'S': [price, ...], ...}"""
+    return {
+        prefix: {f"{prefix}{i + 1}": {'product_id': f"{prefix}{i + 1}", 'product_name': f"{prefix}{i + 1}", 'price_float': price}
+                 for i, price in enumerate(prefix_prices)}
+        for prefix, prefix_prices in prices.items()
+    }
+
+
+def model_bundle(*item_ids, score=8, name='Bundle'):
+    return {'bundle_name': name, 'match_score': score, 'styling_note': 'note',
+            'items': [{'id': item_id, 'category': 'x', 'reason': 'fits'} for item_id in item_ids]}
+
+
+def assert_in_windows(bundles, budget=BUDGET):
+    assert [bundle['bundle_type'] for bundle in bundles] == ['within_budget', 'within_budget', 'premium']
+    for bundle in bundles:
+        cost = sum(item['product']['price_float'] for item in bundle['items'])
+        assert bundle['total_cost'] == round(cost, 2)
+        shoes = [item for item in bundle['items'] if item['product']['product_id'].startswith('S')]
+        assert len(shoes) == 1
+        assert len(bundle['items']) <= 1 + MAX_EXTRAS
+        if bundle['bundle_type'] == 'premium':
+            assert budget + 50 - 0.005 <= cost <= budget + 75 + 0.005
+        else:
+            assert cost < budget
+
+
+PRICES = {
+    'S': [60.0, 90.0, 150.0, 210.0, 240.0],
+    'H': [40.0, 80.0, 120.0],
+    'J': [15.0, 30.0, 55.0],
+}
+
+
+def test_model_bundles_that_fit_are_kept():
+    solver = BundleSolver(BUDGET, product_maps(PRICES))
+    bundles = solver.solve([model_bundle('S1', 'H1'), model_bundle('S2', 'J2'), model_bundle('S3', 'H2', 'J2')])
+
+    assert_in_windows(bundles)
+    assert [bundle['source'] for bundle in bundles] == ['model', 'model', 'model']
+    assert [bundle['styling_note'] for bundle in bundles] == ['note', 'note', 'note']
+    assert solver.counts() == {'within_budget': 2, 'premium': 1}
+
+
+def test_non_numeric_match_scores_fall_back():
+    solver = BundleSolver(BUDGET, product_maps(PRICES))
+    bundles = solver.solve([model_bundle('S3', 'H2', 'J2', score=7), model_bundle('S1', 'H1', score='9/10'),
+                            model_bundle('S2', 'J2', score='high')])
+
+    assert_in_windows(bundles)
+    assert [bundle['source'] for bundle in bundles] == ['model', 'model', 'model']
+    assert [bundle['match_score'] for bundle in bundles] == [7, 7, 7]
+    assert solver.preference['S1'] == 5
+
+
+def test_bundles_missing_their_window_are_repaired():
+    # All over budget and none in the premium window
+    solver = BundleSolver(BUDGET, product_maps(PRICES))
+    model = [model_bundle('S5', 'H3'), model_bundle('S4', 'H3', 'J3'), model_bundle('S5', 'H3', 'J3')]
+    bundles = solver.solve(model)
+
+    assert_in_windows(bundles)
+    assert all(bundle['source'] == 'repaired' for bundle in bundles)
+    # Repairs keep at least one of the model's items where the window allows it
+    for bundle in bundles:
+        kept = {item['product']['product_id'] for item in bundle['items']}
+        assert kept & {'S4', 'S5', 'H3', 'J3'}
+    # The model's text described other items
+    assert [bundle['bundle_name'] for bundle in bundles] == ['Within Budget Bundle 1', 'Within Budget Bundle 2',
+                                                             'Premium Bundle']
+    assert [bundle['styling_note'] for bundle in bundles] == ['', '', '']
+    assert [bundle['match_score'] for bundle in bundles] == [8, 8, 8]
+
+
+def test_unusable_model_output_is_built_from_scratch():
+    solver = BundleSolver(BUDGET, product_maps(PRICES))
+    bundles = solver.solve([model_bundle('X9'), {'items': []}, model_bundle('S99', 'H42')])
+
+    assert_in_windows(bundles)
+    assert [bundle['source'] for bundle in bundles] == ['solver', 'solver', 'solver']
+
+
+def test_bundles_prefer_different_shoes():
+    solver = BundleSolver(BUDGET, product_maps(PRICES))
+    bundles = solver.solve([])
+
+    shoes = [item['product']['product_id'] for bundle in bundles for item in bundle['items']
+             if item['product']['product_id'].startswith('S')]
+    assert len(set(shoes)) == len(shoes)
+
+
+def test_impossible_window_is_left_empty():
+    # Nothing combines into $250-$275
+    solver = BundleSolver(BUDGET, product_maps({'S': [20.0, 30.0], 'J': [10.0]}))
+    bundles = solver.solve([])
+
+    assert [bundle['bundle_type'] for bundle in bundles] == ['within_budget', 'within_budget']
+    assert solver.counts() == {'within_budget': 2, 'premium': 0}
+    assert not solver.complete()
+
+
+def _exhaustive(solver, low, high, keep):
+    """Best (score, ids) over every shoe + 0-2 extras, the way _search scores them"""
+    used_shoes = {item_id for item_ids in solver.filled_ids if item_ids for item_id in item_ids if item_id.startswith('S')}
+    best = None
+    for shoe_id in solver.shoe_ids:
+        for count in range(MAX_EXTRAS + 1):
+            for extras in itertools.combinations(solver.extra_ids, count):
+                item_ids = [shoe_id, *extras]
+                cost = sum(solver.price(item_id) for item_id in item_ids)
+                if low <= cost <= high:
+                    score = sum(solver._score(item_id, keep, used_shoes) for item_id in item_ids)
+                    if best is None or score > best[0]:
+                        best = (score, item_ids)
+    return best
+
+
+@pytest.mark.parametrize('seed', range(25))
+def test_search_matches_exhaustive_search(seed):
+    rng = random.Random(seed)
+    prices = {prefix: [round(rng.uniform(5, 260), 2) for _ in range(rng.randint(0, 6))] for prefix in 'HJCA'}
+    prices['S'] = [round(rng.uniform(20, 260), 2) for _ in range(rng.randint(1, 6))]
+    solver = BundleSolver(BUDGET, product_maps(prices))
+    ids = list(solver.products)
+    for _ in range(3):
+        solver._note_model_bundle(model_bundle(*rng.sample(ids, min(3, len(ids))), score=rng.randint(1, 10)))
+    keep = set(rng.sample(ids, min(2, len(ids))))
+
+    for _, low, high in solver.slots:
+        found = solver._search(low, high, keep)
+        expected = _exhaustive(solver, low, high, keep)
+        if expected is None:
+            assert found is None
+            continue
+        cost = sum(solver.price(item_id) for item_id in found)
+        assert low <= cost <= high
+        score = sum(solver._score(item_id, keep, set()) for item_id in found)
+        assert score == pytest.approx(expected[0])
@@ -0,0 +1,74 @@
+"""
+BundleStreamParser: bundle objects come out as soon as they close, however the text is chunked
+"""
+import json
+
+import pytest
+
+from bundle_stream import BundleStreamParser
+
+BUNDLES = [
+    {'bundle_name': 'City [Edit]', 'items': [{'id': 'S1', 'reason': 'a "classic" pick'}]},
+    {'bundle_name': 'Weekend', 'items': [{'id': 'S2', 'reason': 'braces {} and ] in text'}, {'id': 'H1'}]},
+    {'bundle_name': 'Gala \\ Night', 'items': [{'id': 'S3'}, {'id': 'J1'}]},
+]
+
+REPLY = ("Here [are] the three [bundles] for you:\n[\n  "
+         + ",\n  ".join(json.dumps(bundle) for bundle in BUNDLES)
+         + "\n]\nHope these [work]! [{\"not\": \"a bundle\"}]")
+
+
+def feed_in_chunks(text, size):
+    parser = BundleStreamParser()
+    objects = []
+    for i in range(0, len(text), size):
+        objects.extend(parser.feed(text[i:i + size]))
+    return parser, objects
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, len(REPLY)])
+def test_chunking_does_not_change_result(size):
+    parser, objects = feed_in_chunks(REPLY, size)
+
+    assert objects == BUNDLES
+    assert parser.finished
+
+
+def test_objects_are_returned_as_they_close():
+    parser = BundleStreamParser()
+    first = json.dumps(BUNDLES[0])
+
+    assert parser.feed('[' + first[:-1]) == []
+    assert parser.feed(first[-1] + ', ') == [BUNDLES[0]]
+    assert not parser.finished
+
+
+def test_preamble_brackets_are_skipped():
+    parser = BundleStreamParser()
+    objects = parser.feed('Options [1] and [ 2 ] below: [ \n {"id": 1}]')
+
+    assert objects == [{'id': 1}]
+    assert parser.finished
+
+
+def test_bracket_split_across_chunks_still_opens_array():
+    parser = BundleStreamParser()
+
+    assert parser.feed('Bundles: [') == []
+    assert parser.feed('  ') == []
+    assert parser.feed('{"id": 1}]') == [{'id': 1}]
+
+
+def test_malformed_object_is_skipped():
+    parser = BundleStreamParser()
+    objects = parser.feed('[{"id": 1,}, {"id": 2}]')
+
+    assert objects == [{'id': 2}]
+    assert parser.finished
+
+
+def test_text_without_array_yields_nothing():
+    parser = BundleStreamParser()
+
+    assert parser.feed('Sorry, I could not put together [any] bundles.') == []
+    assert not parser.finished
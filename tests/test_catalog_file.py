@@ -0,0 +1,114 @@
+"""
+Catalog file: a written snapshot maps back to the same products, indexes and search statistics
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from catalog_file import CatalogFile, check_freshness, write_catalog_file
+from product_catalog import CATEGORIES, CatalogSnapshot
+
+ITEMS = [
+    {'product_id': 'S1', 'product_name': 'Ankle boot', 'price': '$120.00', 'product_type': 'FOOTWEAR',
+     'description': 'Suede ankle boot – café brown', 'product_url': 'https://example.com/s1'},
+    {'product_id': 'S2', 'product_name': 'Loafer', 'price': '$80.00', 'product_type': 'FOOTWEAR',
+     'description': 'Leather loafer'},
+    {'product_id': 'S3', 'product_name': 'Loafer', 'price': '$80.00', 'product_type': 'FOOTWEAR',
+     'description': 'Leather loafer'},
+    {'product_id': 'H1', 'product_name': 'Tote', 'price': '$1,299.00', 'product_type': 'HANDBAG'},
+    {'product_id': 'J1', 'product_name': 'Hoops', 'price': '$25.50', 'product_type': 'JEWELRY'},
+    {'product_id': 'G1', 'product_name': 'Gift card', 'price': '$50.00', 'product_type': 'GIFT'},
+    {'product_id': 'U1', 'product_name': 'Mystery', 'price': 'call us', 'product_type': 'FOOTWEAR'},
+]
+
+
+def summary(snapshot):
+    """Per-category (id, price, fields) rows, comparable between in-memory and mapped snapshots"""
+    return {
+        category: [(product.get('product_id'), product['price_float'], product.get('product_name'),
+                    product.get('description'), product.get('product_url'))
+                   for product in snapshot.index[category].products]
+        for category in CATEGORIES
+    }
+
+
+@pytest.fixture
+def written(tmp_path):
+    snapshot = CatalogSnapshot(ITEMS, loaded_at=time.time())
+    path = tmp_path / 'catalog.bin'
+    rows = write_catalog_file(snapshot, str(path), 'products')
+    return snapshot, CatalogFile(str(path)), rows
+
+
+def test_round_trip_keeps_indexes_and_products(written):
+    snapshot, catalog_file, rows = written
+    mapped = catalog_file.snapshot()
+
+    assert rows == len(snapshot.items) == 6
+    assert summary(mapped) == summary(snapshot)
+    assert sorted(p.get('product_id') for p in mapped.items) == sorted(p.get('product_id') for p in snapshot.items)
+    assert mapped.scanned_count == snapshot.scanned_count == len(ITEMS)
+    assert mapped.loaded_at == snapshot.loaded_at
+    assert list(mapped.index['shoes'].prices) == [80.0, 80.0, 120.0]
+
+
+def test_round_trip_keeps_search_statistics(written):
+    snapshot, catalog_file, _ = written
+    mapped = catalog_file.snapshot()
+
+    assert mapped.search.stats() == snapshot.search.stats()
+    shoes = list(snapshot.index['shoes'].products)
+    assert mapped.search.score('leather loafer', shoes) == snapshot.search.score('leather loafer', shoes)
+
+
+def test_mapped_products_read_like_dicts(written):
+    _, catalog_file, _ = written
+    boot = catalog_file.snapshot().by_key()['S1']
+
+    assert boot['description'] == 'Suede ankle boot – café brown'
+    assert boot.get('original_image_url') is None
+    assert 'original_image_url' not in boot
+    with pytest.raises(KeyError):
+        boot['original_image_url']
+    assert boot.to_dict()['price_float'] == 120.0
+
+
+def test_equal_strings_are_stored_once(written):
+    _, catalog_file, _ = written
+    columns = catalog_file.columns
+
+    loafers = [row for row in range(catalog_file.header['rows'])
+               if catalog_file.string(columns['product_id'][row]) in ('S2', 'S3')]
+    assert columns['description'][loafers[0]] == columns['description'][loafers[1]]
+
+
+def test_changes_apply_to_a_mapped_snapshot(written):
+    _, catalog_file, _ = written
+    mapped = catalog_file.snapshot()
+    updated = mapped.with_changes([
+        ('S1', {'product_id': 'S1', 'product_name': 'Ankle boot', 'price': '$95.00', 'product_type': 'HANDBAG'}),
+        ('J1', None),
+    ])
+
+    assert [p.get('product_id') for p in updated.index['shoes'].products] == ['S2', 'S3']
+    assert [p.get('product_id') for p in updated.index['handbags'].products] == ['S1', 'H1']
+    assert len(updated.index['jewelry']) == 0
+    assert updated.index['clothing'] is mapped.index['clothing']
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / 'not-a-catalog.bin'
+    path.write_bytes(b'PK\x03\x04 zip file')
+    with pytest.raises(ValueError):
+        CatalogFile(str(path))
+
+
+def test_freshness_checks(written):
+    _, catalog_file, _ = written
+    header = catalog_file.header
+
+    assert check_freshness(header, SimpleNamespace(name='products', item_count=len(ITEMS))) is None
+    assert check_freshness(header, SimpleNamespace(name='other', item_count=len(ITEMS)))
+    assert check_freshness(header, SimpleNamespace(name='products', item_count=100))
+    assert check_freshness(dict(header, created_at=0), SimpleNamespace(name='products', item_count=len(ITEMS)))
@@ -0,0 +1,108 @@
+"""
+outfit_images: media type detection and preprocessing before the vision call
+"""
+import random
+from io import BytesIO
+
+import pytest
+
+import outfit_images
+from outfit_images import OutfitImage, can_send, detect_media_type, preprocess_image
+
+HEIC = b'\x00\x00\x00\x18ftypheic\x00\x00\x00\x00mif1heic fake heic'
+
+
+def test_detect_media_type():
+    assert detect_media_type(b'\xff\xd8\xff\xe0') == 'image/jpeg'
+    assert detect_media_type(b'\x89PNG\r\n\x1a\n') == 'image/png'
+    assert detect_media_type(b'RIFF\x00\x00\x00\x00WEBPVP8 ') == 'image/webp'
+    assert detect_media_type(HEIC[:16]) == 'image/heic'
+
+
+def test_heic_needs_a_decoder(monkeypatch):
+    monkeypatch.setattr(outfit_images, 'HEIF_SUPPORT', False)
+    assert not can_send('image/heic')
+    assert can_send('image/png')
+
+    monkeypatch.setattr(outfit_images, 'HEIF_SUPPORT', True)
+    assert can_send('image/heic')
+
+
+def test_unconvertible_heic_is_not_passed_through(monkeypatch):
+    # Bedrock rejects image/heic, so sending the original is never an option
+    with pytest.raises(ValueError):
+        preprocess_image(OutfitImage(data=HEIC, name='IMG_0001.HEIC'))
+
+    monkeypatch.setattr(outfit_images, 'Image', None)
+    with pytest.raises(ValueError):
+        preprocess_image(OutfitImage(data=HEIC, name='IMG_0001.HEIC'))
+
+
+def test_without_pillow_images_are_sent_as_uploaded(monkeypatch):
+    monkeypatch.setattr(outfit_images, 'Image', None)
+    image = OutfitImage(data=b'\xff\xd8\xff\xe0 fake jpeg', name='look.jpg')
+
+    processed, stats = preprocess_image(image)
+    assert processed is image
+    assert stats['sent_bytes'] == stats['original_bytes']
+
+
+def encoded(img, image_format):
+    output = BytesIO()
+    img.save(output, format=image_format)
+    return output.getvalue()
+
+
+def decoded(image):
+    Image = pytest.importorskip('PIL.Image')
+    return Image.open(BytesIO(image.data)).convert('RGB')
+
+
+@pytest.mark.parametrize('mode', ['RGBA', 'LA', 'P'])
+def test_transparency_is_flattened_onto_white(mode):
+    Image = pytest.importorskip('PIL.Image')
+    img = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+    img.paste((200, 30, 30, 255), (0, 0, 32, 64))
+    if mode == 'LA':
+        img = img.convert('LA')
+    elif mode == 'P':
+        img = img.convert('P')
+        img.info['transparency'] = img.getpixel((63, 63))
+    data = encoded(img, 'PNG')
+
+    # Downscaled, so it is always re-encoded
+    processed, stats = preprocess_image(OutfitImage(data=data, name='shot.png'), max_edge=32)
+    assert stats['resized']
+    assert processed.media_type == 'image/jpeg'
+    pixels = decoded(processed)
+    assert min(pixels.getpixel((28, 16))) > 240
+    assert max(pixels.getpixel((4, 16))) < 240
+
+
+def noisy_jpeg_with_exif(quality):
+    Image = pytest.importorskip('PIL.Image')
+    rng = random.Random(7)
+    img = Image.frombytes('RGB', (128, 128), bytes(rng.randrange(256) for _ in range(128 * 128 * 3)))
+    exif = Image.Exif()
+    exif[0x010F] = 'PhoneMaker'
+    exif[0xA431] = 'SERIAL-1234'
+    output = BytesIO()
+    img.save(output, format='JPEG', quality=quality, exif=exif)
+    return output.getvalue()
+
+
+def test_metadata_is_stripped_even_when_larger():
+    Image = pytest.importorskip('PIL.Image')
+    data = noisy_jpeg_with_exif(quality=5)
+
+    processed, stats = preprocess_image(OutfitImage(data=data, name='look.jpg'), quality=95, strip_metadata=True)
+    assert stats['sent_bytes'] > stats['original_bytes']
+    assert len(Image.open(BytesIO(processed.data)).getexif()) == 0
+
+
+def test_metadata_is_kept_when_not_stripping():
+    data = noisy_jpeg_with_exif(quality=5)
+    image = OutfitImage(data=data, name='look.jpg')
+
+    processed, _ = preprocess_image(image, strip_metadata=False)
+    assert processed is image
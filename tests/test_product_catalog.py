@@ -0,0 +1,254 @@
+"""
+CatalogSnapshot.with_changes and CatalogCache: incremental changes and stale-while-revalidate loading
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from product_catalog import CATEGORIES, CatalogCache, CatalogSnapshot
+
+
+def item(product_id, price, product_type):
+    return {'product_id': product_id, 'product_name': f"Item {product_id}",
+            'price': f"${price:.2f}", 'product_type': product_type}
+
+
+def index_ids(snapshot, category):
+    return [product['product_id'] for product in snapshot.index[category].products]
+
+
+def assert_sorted(snapshot):
+    for category in CATEGORIES:
+        index = snapshot.index[category]
+        assert list(index.prices) == sorted(index.prices)
+        assert list(index.prices) == [product['price_float'] for product in index.products]
+
+
+def make_snapshot():
+    return CatalogSnapshot([
+        item('S1', 50, 'FOOTWEAR'),
+        item('S2', 90, 'FOOTWEAR'),
+        item('S3', 120, 'FOOTWEAR'),
+        item('H1', 70, 'HANDBAG'),
+        item('H2', 140, 'HANDBAG'),
+        item('J1', 30, 'JEWELRY'),
+    ], loaded_at=1000.0)
+
+
+def test_product_moves_between_categories():
+    snapshot = make_snapshot()
+    updated = snapshot.with_changes([('S2', item('S2', 100, 'HANDBAG'))])
+
+    assert index_ids(updated, 'shoes') == ['S1', 'S3']
+    assert index_ids(updated, 'handbags') == ['H1', 'S2', 'H2']
+    assert updated.by_key()['S2']['price_float'] == 100.0
+    assert updated.index['handbags'].count(95, 105) == 1
+    assert updated.index['shoes'].count(85, 95) == 0
+    assert_sorted(updated)
+
+
+def test_unchanged_categories_share_their_index():
+    snapshot = make_snapshot()
+    updated = snapshot.with_changes([('S2', item('S2', 100, 'HANDBAG'))])
+
+    assert updated.index['jewelry'] is snapshot.index['jewelry']
+    assert updated.index['shoes'] is not snapshot.index['shoes']
+    assert updated.index['handbags'] is not snapshot.index['handbags']
+
+
+def test_original_snapshot_is_untouched():
+    snapshot = make_snapshot()
+    snapshot.with_changes([('S2', item('S2', 100, 'HANDBAG')), ('J1', None)])
+
+    assert index_ids(snapshot, 'shoes') == ['S1', 'S2', 'S3']
+    assert index_ids(snapshot, 'handbags') == ['H1', 'H2']
+    assert index_ids(snapshot, 'jewelry') == ['J1']
+    assert snapshot.by_key()['S2']['price_float'] == 90.0
+
+
+def test_price_change_moves_product_within_its_category():
+    updated = make_snapshot().with_changes([('S1', item('S1', 130, 'FOOTWEAR'))])
+
+    assert index_ids(updated, 'shoes') == ['S2', 'S3', 'S1']
+    assert_sorted(updated)
+
+
+def test_removals_and_new_products():
+    snapshot = make_snapshot()
+    updated = snapshot.with_changes([('H1', None), ('J2', item('J2', 10, 'JEWELRY')), ('X1', None)])
+
+    assert index_ids(updated, 'handbags') == ['H2']
+    assert index_ids(updated, 'jewelry') == ['J2', 'J1']
+    assert 'H1' not in updated.by_key()
+    assert updated.scanned_count == snapshot.scanned_count
+    assert_sorted(updated)
+
+
+def test_unpriced_upsert_drops_the_product():
+    snapshot = make_snapshot()
+    unpriced = dict(item('S3', 0, 'FOOTWEAR'), price='call for price')
+    updated = snapshot.with_changes([('S3', unpriced)])
+
+    assert index_ids(updated, 'shoes') == ['S1', 'S2']
+    assert 'S3' not in updated.by_key()
+    # Still a row of the table, just not an indexable one
+    assert updated.scanned_count == snapshot.scanned_count
+
+
+def test_last_change_to_a_key_wins():
+    updated = make_snapshot().with_changes([
+        ('S1', item('S1', 60, 'JEWELRY')),
+        ('S1', None),
+        ('S1', item('S1', 75, 'HANDBAG')),
+    ])
+
+    assert index_ids(updated, 'shoes') == ['S2', 'S3']
+    assert index_ids(updated, 'jewelry') == ['J1']
+    assert index_ids(updated, 'handbags') == ['H1', 'S1', 'H2']
+    assert_sorted(updated)
+
+
+def test_changes_keep_load_time_and_bump_version():
+    snapshot = make_snapshot()
+    updated = snapshot.with_changes([('J1', item('J1', 35, 'JEWELRY'))])
+
+    assert updated.loaded_at == snapshot.loaded_at
+    assert updated.version > snapshot.version
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+class GatedLoader:
+    """Loader that counts calls and, once gated, blocks until released"""
+
+    def __init__(self, catalogs):
+        self.catalogs = list(catalogs)
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def gate(self):
+        self.started.clear()
+        self.release.clear()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        assert self.release.wait(5)
+        return self.catalogs[min(self.calls, len(self.catalogs)) - 1]
+
+
+def catalog(*entries):
+    return [item(product_id, price, product_type) for product_id, price, product_type in entries]
+
+
+def test_cold_start_loads_once_for_concurrent_callers():
+    loader = GatedLoader([catalog(('S1', 50, 'FOOTWEAR'))])
+    loader.gate()
+    cache = CatalogCache(loader, ttl=60)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get) for _ in range(8)]
+        assert loader.started.wait(5)
+        time.sleep(0.05)
+        loader.release.set()
+        snapshots = [future.result() for future in futures]
+
+    assert loader.calls == 1
+    assert all(snapshot is snapshots[0] for snapshot in snapshots)
+    assert cache.stats()['misses'] == 8
+
+
+def test_stale_snapshot_is_served_while_one_refresh_runs():
+    loader = GatedLoader([catalog(('S1', 50, 'FOOTWEAR')), catalog(('S1', 55, 'FOOTWEAR'))])
+    cache = CatalogCache(loader, ttl=0.05)
+    old = cache.get()
+    time.sleep(0.06)
+
+    loader.gate()
+    assert cache.get() is old
+    assert loader.started.wait(5)
+    # Requests during the refresh neither wait nor start another one
+    for _ in range(5):
+        assert cache.get() is old
+    assert loader.calls == 2
+    assert cache.stats()['refreshing']
+
+    loader.release.set()
+    wait_for(lambda: not cache.stats()['refreshing'])
+    new = cache.get()
+    assert new is not old
+    assert new.by_key()['S1']['price_float'] == 55.0
+    assert cache.stats()['refreshes'] == 1
+
+
+def test_failed_refresh_keeps_the_stale_snapshot():
+    def loader():
+        loader.calls += 1
+        if loader.calls > 1:
+            raise RuntimeError('throttled')
+        return catalog(('S1', 50, 'FOOTWEAR'))
+    loader.calls = 0
+    cache = CatalogCache(loader, ttl=0.01)
+    old = cache.get()
+    time.sleep(0.02)
+
+    assert cache.get() is old
+    wait_for(lambda: not cache.stats()['refreshing'])
+    assert cache.get() is old
+    assert cache.stats()['refresh_errors'] >= 1
+
+
+def test_changes_during_a_refresh_are_replayed_onto_its_result():
+    loader = GatedLoader([catalog(('S1', 50, 'FOOTWEAR'), ('H1', 70, 'HANDBAG')),
+                          # The rescan read the items before the changes below
+                          catalog(('S1', 50, 'FOOTWEAR'), ('H1', 70, 'HANDBAG'))])
+    cache = CatalogCache(loader, ttl=0.05)
+    cache.get()
+    time.sleep(0.06)
+
+    loader.gate()
+    cache.get()
+    assert loader.started.wait(5)
+    cache.apply_changes([('S1', item('S1', 65, 'FOOTWEAR')), ('H1', None)])
+    assert cache.get().by_key()['S1']['price_float'] == 65.0
+
+    loader.release.set()
+    wait_for(lambda: not cache.stats()['refreshing'])
+    refreshed = cache.get()
+    assert cache.stats()['refreshes'] == 1
+    assert refreshed.by_key()['S1']['price_float'] == 65.0
+    assert 'H1' not in refreshed.by_key()
+    assert len(refreshed.index['handbags']) == 0
+
+
+def test_changes_before_the_first_load_are_replayed():
+    loader = GatedLoader([catalog(('S1', 50, 'FOOTWEAR'))])
+    loader.gate()
+    cache = CatalogCache(loader, ttl=60)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(cache.get)
+        assert loader.started.wait(5)
+        assert cache.apply_changes([('S2', item('S2', 80, 'FOOTWEAR'))]) is None
+        loader.release.set()
+        snapshot = future.result()
+
+    assert sorted(snapshot.by_key()) == ['S1', 'S2']
+
+
+def test_empty_change_batch_does_not_refresh_load_time():
+    cache = CatalogCache(lambda: catalog(('S1', 50, 'FOOTWEAR')), ttl=60)
+    snapshot = cache.get()
+    loaded_at = snapshot.loaded_at
+    time.sleep(0.01)
+
+    assert cache.apply_changes([]) is snapshot
+    assert cache.get().loaded_at == loaded_at
+    assert cache.apply_changes([('S1', item('S1', 40, 'FOOTWEAR'))]).loaded_at > loaded_at
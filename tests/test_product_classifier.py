@@ -0,0 +1,98 @@
+"""
+ProductClassifier: whole-word keyword rules, plurals and product_type priority
+"""
+import json
+
+import pytest
+
+import product_classifier
+from product_classifier import DEFAULT_RULES, ProductClassifier, get_classifier
+
+
+@pytest.fixture
+def classifier():
+    return ProductClassifier(DEFAULT_RULES)
+
+
+@pytest.mark.parametrize('name, category', [
+    ('Gold hoop earring', 'jewelry'),
+    ('Gold hoop earrings', 'jewelry'),
+    ('Spring floral blouse', None),
+    ('Springs collection', None),
+    ('Signet ring', 'jewelry'),
+    ('Stacking rings', 'jewelry'),
+    ('Earring and ring set', 'jewelry'),
+    ('Bags of style', 'handbags'),
+    ('Baggy jeans', None),
+    ('That everyday look', None),
+    ('He hates mondays tee', None),
+    ('Chat bubble print', None),
+    ('Wide brim hat', 'other_accessories'),
+    ('Summer hats', 'other_accessories'),
+    ('Wool scarf', 'other_accessories'),
+    ('Silk scarves', 'other_accessories'),
+    ('Cashmere scarfs', 'other_accessories'),
+    ('Aviator sunglasses', 'other_accessories'),
+    ('Evening clutches', 'handbags'),
+    ('Mini crossbodies', 'handbags'),
+    ('Leather belts', 'other_accessories'),
+    ('Beltway jacket', None),
+])
+def test_keywords_match_whole_words_and_plurals(classifier, name, category):
+    item = {'product_name': name}
+
+    assert classifier.primary(item) == category
+    assert classifier.classify_many([item]) == [category]
+
+
+def test_product_type_takes_priority_over_keywords(classifier):
+    item = {'product_name': 'Ring buckle tote loafer', 'product_type': 'footwear'}
+
+    assert classifier.primary(item) == 'shoes'
+    assert classifier.classify_many([item]) == ['shoes']
+    assert classifier.classify(item) == ('shoes', 'handbags', 'jewelry')
+
+
+def test_first_keyword_category_wins_without_product_type(classifier):
+    item = {'product_name': 'Scarf ring with bag charm'}
+
+    assert classifier.primary(item) == 'handbags'
+    assert classifier.classify(item) == ('handbags', 'jewelry', 'other_accessories')
+
+
+def test_custom_plurals_and_regular_forms():
+    classifier = ProductClassifier({
+        'knives': {'keywords': ['knife'], 'plurals': {'knife': ['knives']}},
+        'boxes': {'keywords': ['box', 'Jersey']},
+    })
+
+    assert classifier.primary({'product_name': 'chef knives'}) == 'knives'
+    assert classifier.primary({'product_name': 'steak knifes'}) is None
+    assert classifier.primary({'product_name': 'gift boxes'}) == 'boxes'
+    assert classifier.primary({'product_name': 'two jerseys'}) == 'boxes'
+
+
+def test_rules_load_from_product_rules_path(tmp_path, monkeypatch):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({
+        'shoes': {'product_types': ['FOOTWEAR'], 'keywords': ['sneaker']},
+        'outerwear': {'product_types': ['COAT'], 'keywords': ['parka'], 'plurals': {'parka': ['parkas']}},
+    }), encoding='utf-8')
+    monkeypatch.setattr(product_classifier, 'PRODUCT_RULES_PATH', str(path))
+    monkeypatch.setattr(product_classifier, '_classifier', None)
+
+    classifier = get_classifier()
+    assert classifier.categories == ['shoes', 'outerwear']
+    assert classifier.primary({'product_name': 'Down parkas'}) == 'outerwear'
+    assert classifier.primary({'product_name': 'Court sneakers'}) == 'shoes'
+    assert classifier.primary({'product_name': 'Gold ring'}) is None
+    assert get_classifier() is classifier
+
+
+def test_unreadable_rules_fall_back_to_defaults(tmp_path, monkeypatch):
+    path = tmp_path / 'rules.json'
+    path.write_text('{not json', encoding='utf-8')
+    monkeypatch.setattr(product_classifier, 'PRODUCT_RULES_PATH', str(path))
+    monkeypatch.setattr(product_classifier, '_classifier', None)
+
+    assert get_classifier().categories == list(DEFAULT_RULES)
@@ -0,0 +1,120 @@
+"""
+ResponseCache: single-flight computation, failure propagation and what gets stored
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from response_cache import ResponseCache, response_key
+
+CALLERS = 8
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.005)
+
+
+def run_concurrently(cache, compute, release):
+    """CALLERS concurrent get_or_compute calls; compute is held until every follower waits on the leader"""
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        futures = [pool.submit(cache.get_or_compute, 'key', compute) for _ in range(CALLERS)]
+        wait_for(lambda: cache.stats()['coalesced'] == CALLERS - 1)
+        release.set()
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def test_concurrent_callers_share_one_computation():
+    cache = ResponseCache(ttl=60)
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        assert release.wait(5)
+        return {'bundles': [1, 2, 3]}, True
+
+    results = run_concurrently(cache, compute, release)
+
+    assert len(calls) == 1
+    assert sorted(status for _, status in results) == ['coalesced'] * (CALLERS - 1) + ['miss']
+    assert all(value is results[0][0] for value, _ in results)
+    assert cache.get_or_compute('key', compute) == ({'bundles': [1, 2, 3]}, 'hit')
+    assert len(calls) == 1
+    assert cache.stats()['in_flight'] == 0
+
+
+def test_leader_failure_reaches_every_waiter():
+    cache = ResponseCache(ttl=60)
+    release = threading.Event()
+
+    def compute():
+        assert release.wait(5)
+        raise RuntimeError('Bedrock throttled')
+
+    results = run_concurrently(cache, compute, release)
+
+    assert len(results) == CALLERS
+    assert all(isinstance(result, RuntimeError) for result in results)
+    stats = cache.stats()
+    assert stats['entries'] == 0 and stats['in_flight'] == 0
+    # Nothing was cached, so the next caller computes again
+    assert cache.get_or_compute('key', lambda: ('ok', True)) == ('ok', 'miss')
+
+
+def test_uncacheable_result_is_shared_but_not_stored():
+    cache = ResponseCache(ttl=60)
+    release = threading.Event()
+
+    def compute():
+        assert release.wait(5)
+        return {'bundles': [1]}, False
+
+    results = run_concurrently(cache, compute, release)
+
+    assert all(value == {'bundles': [1]} for value, _ in results)
+    assert cache.stats()['entries'] == 0
+    assert cache.get_or_compute('key', lambda: ({'bundles': [1, 2, 3]}, True)) == ({'bundles': [1, 2, 3]}, 'miss')
+
+
+def test_entries_expire_and_are_evicted_least_recently_used():
+    cache = ResponseCache(ttl=0.05, max_entries=2)
+    cache.get_or_compute('a', lambda: ('A', True))
+    cache.get_or_compute('b', lambda: ('B', True))
+    assert cache.get_or_compute('a', lambda: pytest.fail('cached'))[1] == 'hit'
+    cache.get_or_compute('c', lambda: ('C', True))
+
+    # 'b' was least recently used
+    assert cache.get_or_compute('b', lambda: ('B2', True)) == ('B2', 'miss')
+    time.sleep(0.06)
+    assert cache.get_or_compute('c', lambda: ('C2', True)) == ('C2', 'miss')
+
+
+def test_response_key_normalizes_context():
+    images = [b'outfit one', b'outfit two']
+    key = response_key(images, '25', 'Female', 'Wedding  Guest', None, 200, 7)
+
+    assert response_key(images, ' 25 ', 'female', 'wedding guest', '', '200', 7) == key
+    assert response_key(images, '25', 'female', 'wedding guest', None, 200, 8) != key
+    assert response_key(images[::-1], '25', 'female', 'wedding guest', None, 200, 7) != key
+    assert response_key(images, '25', 'female', 'wedding guest', None, 200, 7, pipeline='fused') != key
+
+
+def test_only_complete_responses_are_cacheable():
+    pytest.importorskip('boto3')
+    from outfit_bundle_api import _cacheable
+
+    complete = {'bundles': [1, 2, 3], 'outfits_count': 2, 'outfits_analyzed': 2}
+    assert _cacheable(complete) == (complete, True)
+    assert not _cacheable(dict(complete, bundles=[1, 2]))[1]
+    assert not _cacheable(dict(complete, outfits_analyzed=1))[1]